@@ -4,20 +4,39 @@ Extracts and evaluates data points from DICOM RTPLAN files.
 This file covers the high level process of handling input and processing dicoms 
 '''
 
-import pydicom 
 import os
+import csv
+import time
+import sys
 import argparse
-from pathlib import Path
 from code import strings
-from code.outputter import output
+from code.outputter import output, open_batch_output
 from code.truth_table_reader import read_truth_table
-from code.parameters.parameter_retrieval import extract_parameters, evaluate_parameters
+from code.processing import run_checks, evaluate_result, CaseNotFound
+from code.folder_index import FolderIndex
+from code.discovery import discover
+from code.archives import is_archive, is_member, split_location, file_stem
+from code.extraction_cache import CACHE_FILE
+from code.watcher import watch
+from code.service import AuditService, serve
+from code.results_store import ResultsStore, COLUMNS
+from code.parameters.parameter_retrieval import PARAMETERS
+from code.profiling import Profile, PROFILE_REPORT, CPROFILE_FOLDER
+
+# The name of the report holding every plan, when --batch is used
+BATCH_REPORT = "batch_report"
+# The name of the report listing the plans whose case couldn't be detected
+UNASSIGNED_REPORT = "unassigned.csv"
 
 def main():
     '''
     Main function; everything starts here.
     Handles input arguments and processes the dicoms
     '''
+    # python app.py query ... looks up the results of earlier runs rather than checking plans
+    if sys.argv[1:2] == ["query"]:
+        return query_results(parse_query_arguments(sys.argv[2:]))
+
     # Retrieve user inputs and settings from command line arguments
     user_input = parse_arguments()
     properties = read_properties_file("settings.txt")
@@ -28,16 +47,99 @@ def main():
     output = user_input["output"] if user_input["output"] else properties["default_output_folder"]
     output_format = user_input["output_format"]
     case_number = user_input["case_number"]
-    truth_table_file = user_input["truth_table_file"] if user_input["truth_table_file"] else properties["truth_table_file"]
-    truth_table = read_truth_table(truth_table_file) 
+    truth_table_files = user_input["truth_table_files"] if user_input["truth_table_files"] else [properties["truth_table_file"]]
+    # Every plan is extracted once and evaluated against each truth table. Cases are detected using the first
+    truth_tables = [read_truth_table(truth_table_file) for truth_table_file in truth_table_files]
+    truth_table = truth_tables[0]
 
     # Print truth table being applied: this can be confusing for the user due to the settings file defaulting to lvl3
-    print(f"\nUsing truth table: {truth_table_file}\n")
+    print(f"\nUsing truth table{'s' if len(truth_tables) > 1 else ''}: {', '.join(truth_table_files)}\n")
+    # Values in the wrong format are found when the table is read, rather than for every plan
+    for table in truth_tables:
+        for case, parameter, message in table.errors:
+            print(f"Warning: truth table {table.name} case {case} {parameter}: {message}. This parameter will be reported as \"{strings.TRUTH_TABLE_ERROR}\"")
     # Create the output folder if it doesn't exist
     if not os.path.isdir(output):
         os.mkdir(output)
 
-    # Look for the given file or files or directories (aka folders) and process them
+    # With --serve, plans are sent to a local service rather than given as inputs
+    if user_input["serve"] is not None:
+        cache_file = os.path.join(output, CACHE_FILE) if user_input["cache"] else None
+        selected_parameters = tuple(user_input["parameters"]) if user_input["parameters"] else None
+        service = AuditService(truth_table, user_input["workers"], cache_file, user_input["mmap"], selected_parameters)
+        try:
+            serve(service, user_input["serve"])
+        finally:
+            service.close()
+        return
+
+    # Look for the given file or files or directories (aka folders) and gather the DICOMs to be processed.
+    # Jobs are generated as the inputs are indexed, so the first plans are checked while the rest are still being found
+    memory_map = user_input["mmap"]
+    indices = {}
+    dose_struct_indices = {}
+    watch_targets = []
+    jobs = find_jobs(inputs, case_number, user_input["recursive"], memory_map, indices, dose_struct_indices, watch_targets)
+
+    # With --batch, every plan's report goes into one file (per truth table) instead of a file per plan
+    batch_outputs = None
+    if user_input["batch"]:
+        batch_outputs = [open_batch_output(os.path.join(output, report_name(BATCH_REPORT, table, truth_tables)), output_format) for table in truth_tables]
+
+    # With --profile, the timings of every plan are collected and summarised once the inputs have been processed
+    profile = Profile() if user_input["profile"] else None
+    cprofile_folder = os.path.join(output, CPROFILE_FOLDER) if user_input["cprofile"] else None
+
+    # With --results_db, every plan's results are also added to a database that can be queried later (see query_results)
+    results_store = ResultsStore(user_input["results_db"]) if user_input["results_db"] else None
+
+    try:
+        # Process every DICOM, in this process or spread across a pool of workers
+        cache_file = os.path.join(output, CACHE_FILE) if user_input["cache"] else None
+        interactive = not user_input["non_interactive"]
+        prefetch = user_input["prefetch"]
+        # With --parameters, only those parameters are checked. A parameter a truth table accepts any value for is skipped, unless
+        # there are other tables, which may not
+        selected_parameters = tuple(user_input["parameters"]) if user_input["parameters"] else None
+        skip_unchecked = len(truth_tables) == 1
+        # The name of each plan's report, kept for the whole run so that plans with the same file name don't overwrite each other's
+        report_names = {}
+        unassigned = process_jobs(jobs, truth_tables, dose_struct_indices, output, output_format, user_input["workers"], cache_file, batch_outputs, interactive,
+                                  profile, cprofile_folder, memory_map, prefetch, results_store, selected_parameters, skip_unchecked, report_names)
+        if profile:
+            write_profile(profile, output)
+        write_unassigned_report(unassigned, output)
+
+        # Keep the truth tables and folder indices loaded, and check plans as they arrive or change.
+        # Arrivals are checked in this process, since starting a pool for every new plan would cost more than it saves
+        if user_input["watch"]:
+            print("\nWatching for new or changed plans (press Ctrl+C to stop)...")
+            def process_arrivals(new_jobs):
+                unassigned.extend(process_jobs(new_jobs, truth_tables, dose_struct_indices, output, output_format, 1, cache_file, batch_outputs, interactive,
+                                               profile, cprofile_folder, memory_map, prefetch, results_store, selected_parameters, skip_unchecked,
+                                               report_names))
+                write_unassigned_report(unassigned, output)
+                if profile:
+                    profile.write(os.path.join(output, PROFILE_REPORT))
+            try:
+                watch(watch_targets, indices, dose_struct_indices, process_arrivals)
+            except KeyboardInterrupt:
+                print("Stopped watching")
+    finally:
+        for batch_output in batch_outputs or []:
+            batch_output.close()
+        if results_store:
+            results_store.close()
+
+def find_jobs(inputs, case_number, recursive, memory_map, indices, dose_struct_indices, watch_targets):
+    ''' Yield a (location, case_number, folder) job for each plan in inputs, as they are found
+
+    inputs              - a list of files, folders or archives, each optionally followed by a comma and its case number
+    case_number         - the case number of the inputs that don't have their own, or None
+    recursive           - whether to look for plans in the folders inside input folders, as well as directly in them
+    indices, dose_struct_indices, watch_targets - filled in with the FolderIndex, dose_struct_index and (folder, case_number, location)
+                            watch target of each folder or archive as it's indexed
+    '''
     for location in inputs:
         # Check if input item is [file,case] formatted
         comma_case = None
@@ -47,96 +149,252 @@ def main():
             comma_case = int(input_item[1])
         final_case = case_number if comma_case is None else comma_case
 
-        # Handle the input where a file is specified
-        if os.path.isfile(location):
-            folder_path = os.path.dirname(location)
-            dose_struct_index = dose_struct_references(folder_path)
-            process_dicom(location, output, output_format, final_case, truth_table, dose_struct_index)
+        # Handle the input where a file (including one inside an archive) is specified
+        if is_member(location) or (os.path.isfile(location) and not is_archive(location)):
+            folder_path = split_location(location)[0] if is_member(location) else os.path.dirname(location)
+            if folder_path not in indices:
+                indices[folder_path] = next(discover(folder_path, memory_map=memory_map))[1]
+                dose_struct_indices[folder_path] = indices[folder_path].dose_struct_index()
+            watch_targets.append((folder_path, final_case, location))
+            # Skip the file if the index says it isn't a plan. Files outside the index, or whose header couldn't be
+            # read, are still checked in full so that any error is reported
+            entry = indices[folder_path].entry(location)
+            if entry is None or entry.modality in [None, strings.RTPLAN]:
+                yield location, final_case, folder_path
 
-        # Handle the input where a folder is specified
+        # Handle the input where a folder (aka directory) or an archive is specified
         else:
-            # First we scan through the entire folder once to find out what dose and structure files we have
-            dose_struct_index = dose_struct_references(location)
-            # Then, scan through the folder and process each RTPLAN DICOM
-            with os.scandir(location) as folder:
-                for item in folder:
-                    if item.is_file() and item.name.endswith(".dcm"):
-                        process_dicom(item.path, output, output_format, final_case, truth_table, dose_struct_index)
+            # Index each folder once to find out what plans, dose and structure files we have,
+            # then queue up each RTPLAN DICOM in the folder; the other files are never read in full
+            for folder, index in discover(location, recursive, memory_map):
+                indices[folder] = index
+                dose_struct_indices[folder] = index.dose_struct_index()
+                watch_targets.append((folder, final_case, None))
+                for entry in index.plans():
+                    yield entry.path, final_case, folder
 
-def dose_struct_references(folder_path):
-    dose_struct_index = {}
-    with os.scandir(folder_path) as folder:
-        for item in folder:
-            if item.is_file() and item.name.endswith(".dcm"):
-                ref = dose_struct_reference(item.path)
-                if ref:
-                    if ref[0] in dose_struct_index:
-                        dose_struct_index[ref[0]] += [ref[1:]]
-                    else:
-                        dose_struct_index[ref[0]] = [ref[1:]]
-    return dose_struct_index
-
-def dose_struct_reference(file_path):
-    dataset = pydicom.dcmread(file_path, force=True, specific_tags=["StudyInstanceUID", "Modality"])
-    if str(dataset.Modality) in ["RTDOSE", "RTSTRUCT"]:
-        return dataset.StudyInstanceUID, file_path, dataset.Modality
-
-def process_dicom(location, destination, output_format, case_number, truth_table, dose_struct_index={}):
-    ''' Function to process a single DICOM RTPLAN
+def process_jobs(jobs, truth_tables, dose_struct_indices, output, output_format, workers=1, cache_file=None, batch_outputs=None, interactive=True,
+                 profile=None, cprofile_folder=None, memory_map=False, prefetch=0, results_store=None, selected_parameters=None, skip_unchecked=True,
+                 report_names=None):
+    ''' Check each (location, case_number, folder) job and write its report, summarising any failures at the end
 
-    location            - the filepath of the DICOM
-    destination         - the filepath of the folder in which the result will be saved to
-    output_format       - perhaps there will be support for json output in the future? currently always csv
-    case_number         - the case number of the truth table that parameters should be evaluated against (see data/truth_table_lvl3.csv)
-    truth_table         - a dictionary of correct values for each case
-    dose_struct_index   - a dictionary mapping StudyInstanceUID to (location, modality) pairs of dose and structure set DICOMs
+    jobs                - a list or generator of jobs (see find_jobs)
+    truth_tables        - the TruthTables to evaluate every plan against. Plans are checked against the first (which their
+                            case is detected with), then the parameters extracted are evaluated against the rest too
+
+    batch_outputs       - the report (see outputter.open_batch_output) for each truth table to add every plan to, or None to write reports per plan
+    interactive         - whether to prompt for missing case numbers; if not, cases are detected from the plans
+    profile             - a Profile (see code/profiling.py) to add the timings of every plan to, or None to not profile. The evaluation
+                            against each truth table after the first is timed separately, labelled with the table's name
+    cprofile_folder     - a folder to save the cProfile stats of each process in, or None to not run cProfile
+    memory_map          - whether to read DICOMs through a memory map
+    prefetch            - how many plans to read ahead of the ones being checked, or 0 to not read ahead (see code/pipeline.py).
+                            Reports are then written while the next plans are read and checked
+    results_store       - a ResultsStore (see code/results_store.py) to add every plan's results to, or None
+    selected_parameters, skip_unchecked - which parameters are extracted from each plan (see processing.check_dicom)
+    report_names        - a dictionary of the name given to each plan's report (see unique_report_name), filled in here. Pass the same
+                            dictionary to every call of a run so that report names stay unique across them
+
+    Returns a list of (location, reason) for the plans whose case couldn't be detected
     '''
-    dataset = pydicom.read_file(location, force=True)
+    failures = []
+    unassigned = []
+    checked = 0
+    report_names = {} if report_names is None else report_names
+    # The user can only be prompted when everything is checked in this process, one plan at a time
+    interactive = interactive and workers <= 1 and not prefetch
+    for location, result, error in run_checks(jobs, truth_tables[0], dose_struct_indices, workers, cache_file, interactive,
+                                              profile is not None, cprofile_folder, memory_map, prefetch, selected_parameters, skip_unchecked):
+        checked += 1
+        if isinstance(error, CaseNotFound):
+            unassigned.append((location, str(error)))
+            print(f"Could not detect the case of {location}; it has been added to the unassigned report")
+        elif error:
+            failures.append((location, error))
+            print(f"Failed to process {location}: {error}")
+        elif result:
+            # Only writing the reports counts as the output stage; evaluating against the other tables is timed on its own
+            output_time = 0
+            for index, truth_table in enumerate(truth_tables):
+                table_result = result if index == 0 else _evaluate_result(location, result, truth_table, profile is not None, failures)
+                if table_result is None:
+                    continue
+                if index > 0 and profile is not None:
+                    profile.add_evaluation(table_result[3], file_stem(truth_table.name))
+                start = time.perf_counter()
+                if batch_outputs:
+                    output_file = batch_outputs[index].write(location, *table_result)
+                    print(f"Extracted {location} to file {output_file}")
+                else:
+                    name = report_name(unique_report_name(location, report_names), truth_table, truth_tables)
+                    output_file = write_report(location, table_result, output, output_format, name)
+                    if output_file:
+                        print("Extracted to file " + output_file)
+                if results_store is not None:
+                    results_store.add(location, table_result, truth_table.name)
+                output_time += time.perf_counter() - start
+            if profile is not None:
+                profile.add(result[3])
+                profile.add_timing("stage", "output", output_time)
+
+    # The results of a batch are saved together, in one transaction
+    if results_store is not None:
+        results_store.flush()
+    if failures:
+        print(f"\n{len(failures)} of {checked} DICOMs could not be processed:")
+        for location, error in failures:
+            print(f"  {location}: {error}")
+    return unassigned
+
+def _evaluate_result(location, result, truth_table, profile, failures):
+    ''' The result of a plan evaluated against another truth table (see processing.evaluate_result), or None if it couldn't be,
+    e.g. because the table doesn't have the plan's case'''
+    try:
+        return evaluate_result(result, truth_table, profile)
+    except Exception as e:
+        failures.append((location, f"{truth_table.name}: {e}"))
+        print(f"Failed to evaluate {location} against {truth_table.name}: {e}")
+        return None
 
-    # If the dicom is not an RTPLAN, we don't want to process it. 
-    if str(dataset.Modality) != "RTPLAN":
+def unique_report_name(location, report_names):
+    ''' The name of the report of the plan at location: its file name, numbered (e.g. RP1_2) if another plan of the run already has that
+    name, e.g. a plan of the same name in another folder or archive. report_names maps each plan to its report's name so far'''
+    if location not in report_names:
+        taken = set(report_names.values())
+        name = stem = file_stem(location)
+        number = 2
+        while name in taken:
+            name = f"{stem}_{number}"
+            number += 1
+        if name != stem:
+            print(f"Warning: another plan's report is already called {stem}; the report of {location} will be {name}")
+        report_names[location] = name
+    return report_names[location]
+
+def report_name(name, truth_table, truth_tables):
+    ''' The name of a report, labelled with the truth table it's evaluated against when there's more than one'''
+    return f"{name}_{file_stem(truth_table.name)}" if len(truth_tables) > 1 else name
+
+def write_unassigned_report(unassigned, destination):
+    ''' Save the list of plans whose case couldn't be detected, so they can be rerun with a case number'''
+    if not unassigned:
         return
+    filepath = os.path.join(destination, UNASSIGNED_REPORT)
+    with open(filepath, 'w', newline='', encoding='utf-8') as report_file:
+        writer = csv.writer(report_file, lineterminator=os.linesep)
+        writer.writerow(["Plan", "Reason"])
+        writer.writerows(unassigned)
+    print(f"\n{len(unassigned)} plans need a case number; see {filepath}")
 
-    # Prompt for case number if not specified
-    cases = len(truth_table["case"])
-    while not isinstance(case_number, int):
-        try:
-            case_number = int(input(f"What is the case number for {location}?"))
-        except ValueError:
-            print(f"Case must be an integer between 1 and {cases}!")
+def write_profile(profile, destination):
+    ''' Print a summary of where the time went and save it in the output folder'''
+    print("\nProfile (times per plan):")
+    profile.print_summary()
+    print(f"Saved the profile to {profile.write(os.path.join(destination, PROFILE_REPORT))}")
 
-    # Look for any related dose files or structure sets
-    struct_dose_files = {}
-    if dataset.StudyInstanceUID in dose_struct_index:
-        struct_dose_files[dataset.StudyInstanceUID] = dose_struct_index[dataset.StudyInstanceUID]
+def query_results(query):
+    ''' Print the results in a results database (see --results_db) that match the query as csv'''
+    if not os.path.isfile(query["results_db"]):
+        print(f"There is no results database at {query['results_db']}")
+        return
+    results_store = ResultsStore(query.pop("results_db"))
+    try:
+        writer = csv.writer(sys.stdout, lineterminator=os.linesep)
+        writer.writerow(COLUMNS)
+        writer.writerows(results_store.query(**query))
+    finally:
+        results_store.close()
 
-    # Extract and evaluate the DICOM 
-    parameters = extract_parameters(dataset, struct_dose_files, case_number)
-    evaluations = evaluate_parameters(parameters, truth_table, case_number)
-    solutions = dict([(key, truth_table[key][case_number-1]) for key in truth_table])
+def dose_struct_references(folder_path):
+    ''' Map each StudyInstanceUID to the [(location, modality), ...] of the dose and structure set DICOMs in folder_path'''
+    return FolderIndex(folder_path).dose_struct_index()
+
+def write_report(location, result, destination, output_format, name=None):
+    ''' Function to output the result of checking a single DICOM RTPLAN
+
+    location            - the filepath of the DICOM
+    result              - the (parameters, evaluations, solutions, details) tuple produced by check_dicom
+    destination         - the filepath of the folder in which the result will be saved to
+    output_format       - csv, or json for a single line JSON record
+    name                - the name of the report file (without its extension), if not the name of the DICOM
+    '''
+    parameters, evaluations, solutions, details = result
 
     # Output the extracted parameters into the format specified by user
-    output_location = os.path.join(destination,Path(location).stem)
-    output_file = output(parameters, evaluations, solutions, output_location, output_format)
-    if output_file:
-        print("Extracted to file " + output_file)
+    output_location = os.path.join(destination, name or file_stem(location))
+    return output(parameters, evaluations, solutions, output_location, output_format, dict(details, plan=location))
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Extract and evaluate selected parameters of DICOM files for the purpose of auditing planned radiotherapy treatment.")
     parser.add_argument("-i", "--inputs", nargs='+',
-                        help="The locations of one or more DICOMS to be processed, OR the locations of one or more folders containing DICOMS to be processed.")
-    parser.add_argument("-t", "--truth_table", dest="truth_table_file",
-                        help="The file containing the truth table to be used for determining pass/fail results.")    
+                        help="The locations of one or more DICOMS to be processed, OR the locations of one or more folders (or ZIP/tar archives) containing DICOMS to be processed. A DICOM inside an archive is given as ARCHIVE::MEMBER.")
+    parser.add_argument("-t", "--truth_table", nargs='+', dest="truth_table_files",
+                        help="The file containing the truth table to be used for determining pass/fail results. Given several, each DICOM is read once and evaluated against every table, with a report per table labelled with the table's name; cases are detected with the first.")    
     parser.add_argument("-o", "--output", metavar="FOLDER",
                         help="The location where the reports for processed DICOMs should be saved (creates folder if doesn't yet exist). If unspecified, each report will be saved in a Reports folder in this directory.")
     parser.add_argument("-c", "--case_number", metavar="NUMBER", type=int,
                         help="The case number of input DICOMS. If specified, assumes all DICOMS in this batch will be this case.")
     parser.add_argument("-f", "--format", choices=["csv", "json"], default="csv", dest="output_format",
                         help="The format of the output file.")
+    parser.add_argument("-b", "--batch", action="store_true",
+                        help="Save the reports of all processed DICOMs into a single file in the output folder, with a column identifying the DICOM, instead of a file per DICOM.")
+    parser.add_argument("-w", "--workers", metavar="N", type=int, default=1,
+                        help="The number of worker processes used to process DICOMs in parallel (default 1). With more than one worker, inputs without a case number have it detected, as with --non_interactive.")
+    parser.add_argument("-n", "--non_interactive", action="store_true",
+                        help="Never prompt for case numbers. Inputs without one have their case detected from the file name, plan label or beam signature; plans whose case can't be detected are listed in unassigned.csv in the output folder.")
+    parser.add_argument("-p", "--parameters", nargs='+', choices=PARAMETERS, metavar="PARAMETER",
+                        help=f"Only check these parameters (and read just the parts of each DICOM they need), e.g. --parameters SSD gantry. One of: {', '.join(PARAMETERS)}.")
+    parser.add_argument("--watch", action="store_true",
+                        help="After processing the inputs, keep running and process any plans that are added to or changed in the input folders.")
+    parser.add_argument("--cache", action="store_true",
+                        help="Keep the parameters extracted from each DICOM in a cache in the output folder, so that unchanged DICOMs are only re-evaluated on later runs.")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Also process the DICOMs in every folder inside the input folders, rather than just those directly in them.")
+    parser.add_argument("--mmap", action="store_true",
+                        help="Read DICOMs through memory maps rather than into memory. Faster for archives on local disk, especially when they're audited repeatedly; not recommended for network drives.")
+    parser.add_argument("--prefetch", metavar="N", type=int, default=0,
+                        help="Read up to N plans ahead of the ones being checked, and write reports while the next plans are checked, so that slow (e.g. network) drives aren't left idle. Inputs without a case number have it detected, as with --non_interactive.")
+    parser.add_argument("--serve", metavar="PORT", type=int,
+                        help="Instead of processing inputs, keep running as a service on localhost:PORT that checks the plans POSTed to /check (as a path or as the DICOM itself) and responds with their JSON reports. The truth table, workers and --cache stay loaded between plans, and --parameters applies to every plan. Can't be combined with options for batches of inputs such as --watch or --profile, or with more than one truth table.")
+    parser.add_argument("--results_db", metavar="FILE",
+                        help="Also add the results of every DICOM to an SQLite database, so that audits can be looked up later with: python app.py query --results_db FILE (see python app.py query --help).")
+    parser.add_argument("--profile", action="store_true",
+                        help="Time each stage of checking every DICOM, and each parameter's extraction and evaluation, then print a summary of the percentiles and save it to profile.csv in the output folder.")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="Run cProfile in every process that checks DICOMs and save its stats to a cprofile folder in the output folder, one .prof file per process.")
                     
     args = parser.parse_args()
+    # The service answers each request with one report, from one truth table, as soon as the plan is checked. The options
+    # for runs over a batch of inputs don't apply to it, so rather than ignoring them they're refused
+    if args.serve is not None:
+        refused = [option for option, given in [("--watch", args.watch), ("--batch", args.batch), ("--prefetch", args.prefetch),
+                                                ("--results_db", args.results_db), ("--profile", args.profile), ("--cprofile", args.cprofile)] if given]
+        if args.truth_table_files and len(args.truth_table_files) > 1:
+            refused.insert(0, "more than one --truth_table")
+        if refused:
+            parser.error(f"--serve can't be used with {', '.join(refused)}")
     return vars(args)
     
+def parse_query_arguments(arguments):
+    parser = argparse.ArgumentParser(prog="app.py query", description="Print the results of earlier runs (saved with --results_db) that match every filter given, as csv.")
+    parser.add_argument("--results_db", metavar="FILE", required=True,
+                        help="The results database given to --results_db when the DICOMs were processed.")
+    parser.add_argument("-c", "--case", metavar="NUMBER", type=int, dest="case_number",
+                        help="Only the results of plans checked against this case.")
+    parser.add_argument("-p", "--parameter",
+                        help="Only the results of this parameter, e.g. SSD.")
+    parser.add_argument("-e", "--evaluation",
+                        help="Only the results with this evaluation, e.g. FAIL.")
+    parser.add_argument("--since", metavar="TIME",
+                        help="Only the results of plans checked at or after this date (YYYY-MM-DD) or time (YYYY-MM-DD HH:MM:SS).")
+    parser.add_argument("--until", metavar="TIME",
+                        help="Only the results of plans checked at or before this date (YYYY-MM-DD, including the whole day) or time.")
+    parser.add_argument("--plan",
+                        help="Only the results of the plan with this SOPInstanceUID, or of plans whose location includes this text.")
+    parser.add_argument("-t", "--truth_table",
+                        help="Only the results of plans checked against truth tables whose file name includes this text.")
+    return vars(parser.parse_args(arguments))
+
 def read_properties_file(properties_file):
     properties = {}
     with open(properties_file, 'r') as prop_file:
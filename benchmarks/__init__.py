@@ -0,0 +1,10 @@
+''' Benchmarks of the hot paths of checking plans, to catch performance regressions before they reach the audits
+
+The benchmarks are written in the style of asv (airspeed velocity): each bench_*.py module has classes whose
+time_* methods are timed, after the class's setup method has been called with each combination of its params.
+They run on synthetic DICOMs (see tests/synthetic.py), so they can cover plans far larger than the sample data.
+
+Run them from the root folder of the repository with
+    python -m benchmarks
+and see python -m benchmarks --help for saving results and comparing against an earlier run.
+'''
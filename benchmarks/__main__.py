@@ -0,0 +1,116 @@
+''' Runs the benchmarks: python -m benchmarks [-k PATTERN] [--save FILE] [--compare FILE]'''
+
+import sys
+import json
+import time
+import inspect
+import argparse
+import itertools
+import importlib
+import pkgutil
+import statistics
+import benchmarks
+
+# Each sample times the benchmark for at least this long (in seconds), calling it as many times as needed
+MIN_SAMPLE_TIME = 0.05
+
+def discover(pattern=None):
+    ''' Yield (name, class, method name, params) for every benchmark whose name contains pattern'''
+    for module_info in pkgutil.iter_modules(benchmarks.__path__):
+        if not module_info.name.startswith("bench_"):
+            continue
+        module = importlib.import_module(f"benchmarks.{module_info.name}")
+        for class_name, benchmark_class in inspect.getmembers(module, inspect.isclass):
+            if benchmark_class.__module__ != module.__name__ or class_name.startswith("_"):
+                continue
+            params = getattr(benchmark_class, "params", None)
+            # asv allows a single list of params, or a list of lists for several params
+            if params is None:
+                combinations = [()]
+            elif params and isinstance(params[0], list):
+                combinations = list(itertools.product(*params))
+            else:
+                combinations = [(param,) for param in params]
+            for method_name in sorted(dir(benchmark_class)):
+                if not method_name.startswith("time_"):
+                    continue
+                for combination in combinations:
+                    name = f"{module_info.name[len('bench_'):]}.{class_name}.{method_name}"
+                    if combination:
+                        name += "(" + ", ".join(map(str, combination)) + ")"
+                    if pattern is None or pattern in name:
+                        yield name, benchmark_class, method_name, combination
+
+def run(benchmark_class, method_name, params, repeat):
+    ''' Returns the time (in seconds) of each of repeat samples of one call to the benchmark'''
+    instance = benchmark_class()
+    if hasattr(instance, "setup"):
+        instance.setup(*params)
+    try:
+        method = getattr(instance, method_name)
+        # The first call warms up anything cached, and tells us how many calls fill a sample
+        start = time.perf_counter()
+        method(*params)
+        number = max(1, int(MIN_SAMPLE_TIME / max(time.perf_counter() - start, 1e-9)))
+
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                method(*params)
+            samples.append((time.perf_counter() - start) / number)
+        return samples
+    finally:
+        if hasattr(instance, "teardown"):
+            instance.teardown(*params)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Time the hot paths of checking plans on synthetic DICOMs.")
+    parser.add_argument("-k", metavar="PATTERN", dest="pattern",
+                        help="Only run the benchmarks whose name contains PATTERN.")
+    parser.add_argument("-r", "--repeat", metavar="N", type=int, default=5,
+                        help="The number of samples taken of each benchmark (default 5).")
+    parser.add_argument("--save", metavar="FILE",
+                        help="Save the median time of each benchmark to FILE (JSON), to compare later runs against.")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="Compare against the times saved in FILE, and exit with an error if any benchmark is slower by more than the threshold.")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="How many times slower than the saved time a benchmark can be before it's a regression (default 1.25).")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = {}
+    regressions = []
+    for name, benchmark_class, method_name, params in discover(args.pattern):
+        samples = run(benchmark_class, method_name, params, args.repeat)
+        median = statistics.median(samples)
+        results[name] = median
+
+        line = f"{name:<70} median {median * 1000:10.3f} ms   min {min(samples) * 1000:10.3f} ms"
+        items = getattr(benchmark_class, "items", None)
+        if items:
+            line += f"   {items / median:10.1f} items/s"
+        if name in baseline:
+            ratio = median / baseline[name]
+            line += f"   {ratio:5.2f}x"
+            if ratio > args.threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line, flush=True)
+
+    if args.save:
+        with open(args.save, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"\nSaved the results to {args.save}")
+    if regressions:
+        print(f"\n{len(regressions)} benchmarks are more than {args.threshold}x slower than {args.compare}:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
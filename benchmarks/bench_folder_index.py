@@ -0,0 +1,28 @@
+''' Benchmarks of indexing folders of plans mixed in with large dose files'''
+
+from code.folder_index import FolderIndex
+from .data import study_folder
+
+# Each study has a plan, a structure set and a 16 MB dose, so most of the bytes in the folder are never needed
+STUDIES = 20
+DOSE_SHAPE = (100, 200, 200)
+
+class IndexFolder:
+    # The number of files indexed per call, for reporting throughput
+    items = STUDIES * 3
+
+    def setup(self):
+        self.folder, _ = study_folder("index", studies=STUDIES, dose_shape=DOSE_SHAPE, beams=5, control_points=2)
+
+    def time_index_folder(self):
+        FolderIndex(self.folder).dose_struct_index()
+
+class RefreshUnchangedFolder:
+    items = STUDIES * 3
+
+    def setup(self):
+        self.folder, _ = study_folder("index", studies=STUDIES, dose_shape=DOSE_SHAPE, beams=5, control_points=2)
+        self.index = FolderIndex(self.folder)
+
+    def time_refresh_unchanged_folder(self):
+        self.index.refresh()
@@ -0,0 +1,55 @@
+''' Benchmarks of reading, extracting and evaluating a single plan'''
+
+from code import strings
+from code.dicom_reader import read_dataset
+from code.processing import check_dicom, PLAN_TAGS
+from code.truth_table_reader import read_truth_table
+from code.parameters.parameter_retrieval import extract_parameters, evaluate_parameters
+from .data import study_folder, PLANS
+
+# Case 7 accepts both IMRT and VMAT plans, so every plan is extracted the same way as a real audit plan would be
+CASE = 7
+
+class _Plan:
+    params = list(PLANS)
+    param_names = ["plan"]
+
+    def setup(self, plan):
+        _, studies = study_folder(plan, **PLANS[plan])
+        self.location = studies[0][strings.RTPLAN]
+        self.truth_table = read_truth_table("data/truth_table_lvl3.csv")
+
+class CheckDicom(_Plan):
+    ''' Everything check_dicom does for a plan: read, extract and evaluate'''
+    def time_check_dicom(self, plan):
+        check_dicom(self.location, CASE, self.truth_table)
+
+    def time_check_dicom_selected(self, plan):
+        ''' Checking just the gantry angles and SSDs, as with --parameters gantry SSD'''
+        check_dicom(self.location, CASE, self.truth_table, selected_parameters=(strings.gantry, strings.SSD))
+
+class ReadDataset(_Plan):
+    ''' Reading a plan and extracting its parameters. A plan read with every tag is only parsed as its elements are used, so
+    reading it alone would time next to nothing: both are timed with the extraction that parses what they read'''
+    def time_read_dataset(self, plan):
+        extract_parameters(read_dataset(self.location), {}, CASE)
+
+    def time_read_plan_tags(self, plan):
+        ''' Reading only the tags that the extraction functions use, as check_dicom does'''
+        extract_parameters(read_dataset(self.location, PLAN_TAGS), {}, CASE)
+
+class ExtractParameters(_Plan):
+    def setup(self, plan):
+        super().setup(plan)
+        self.dataset = read_dataset(self.location, PLAN_TAGS)
+
+    def time_extract_parameters(self, plan):
+        extract_parameters(self.dataset, {}, CASE)
+
+class EvaluateParameters(_Plan):
+    def setup(self, plan):
+        super().setup(plan)
+        self.parameters = extract_parameters(read_dataset(self.location, PLAN_TAGS), {}, CASE)
+
+    def time_evaluate_parameters(self, plan):
+        evaluate_parameters(self.parameters, self.truth_table, CASE)
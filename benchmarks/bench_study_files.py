@@ -0,0 +1,21 @@
+''' Benchmarks of loading a study's dose grid and looking up the dose at its measurement points'''
+
+import numpy as np
+from code import strings
+from code.dicom_reader import read_dataset
+from code.study_files import DoseGrid, DOSE_GRID_TAGS
+from .data import study_folder
+
+class PointDoses:
+    ''' Looking up the dose at points of a realistic (100 x 400 x 400, 64 MB) dose grid, from opening the file'''
+    params = [9, 1000]
+    param_names = ["points"]
+
+    def setup(self, points):
+        _, studies = study_folder("large_dose", dose_shape=(100, 400, 400))
+        self.location = studies[0][strings.RTDOSE]
+        self.positions = np.random.default_rng(0).uniform(-200, 200, size=(points, 3)) * [1, 1, 0.25]
+
+    def time_dose_at(self, points):
+        # A new DoseGrid every time, so the grid is mapped again rather than using the values of the last call
+        DoseGrid(self.location, read_dataset(self.location, DOSE_GRID_TAGS, memory_map=True)).dose_at(self.positions)
@@ -0,0 +1,26 @@
+''' Synthetic studies shared by the benchmarks, generated once per run'''
+
+import atexit
+import shutil
+import tempfile
+from tests.synthetic import write_study
+
+_folders = {}
+
+def study_folder(name, studies=1, **study_options):
+    ''' A folder of synthetic studies (see tests.synthetic.write_study), made the first time it's asked for
+
+    Returns (folder, [the paths of each study, as returned by write_study])
+    '''
+    if name not in _folders:
+        folder = tempfile.mkdtemp(prefix=f"benchmark_{name}_")
+        atexit.register(shutil.rmtree, folder, True)
+        _folders[name] = folder, [write_study(folder, name=f"{name}_{study}", **study_options) for study in range(studies)]
+    return _folders[name]
+
+# The plans that the per plan benchmarks are run on: a typical static plan, a typical arc, and a long multi arc length plan
+PLANS = {
+    "static": dict(beams=5, control_points=2, gantry_angles=[0, 72, 144, 216, 288], dose_shape=None),
+    "vmat": dict(vmat=True, control_points=180, dose_shape=None),
+    "long_vmat": dict(vmat=True, control_points=4000, dose_shape=None),
+}
@@ -0,0 +1,107 @@
+''' Module for reading DICOMs straight out of ZIP and tar archives, such as the exports of a planning system
+
+A file inside an archive has a location of the form ARCHIVE_PATH::MEMBER_NAME, e.g. exports/patient.zip::plans/RP1.dcm,
+which can be used anywhere a filepath of a DICOM is expected. Members are read from the archive as they are needed,
+so archives never have to be extracted to disk.
+
+Open archives are shared by every thread of a process (see pipeline.py), and neither ZipFile nor TarFile can
+safely read several members at once, so members are read one at a time.
+'''
+
+import os
+import tarfile
+import zipfile
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+# Separates the path of an archive from the name of a file inside it
+ARCHIVE_SEPARATOR = "::"
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# The number of archives each process keeps open, so that reading many members doesn't reopen the archive each time
+OPEN_ARCHIVES = 4
+_open_archives = OrderedDict()
+# Held while an archive is opened or one of its members is being read
+_archive_lock = threading.RLock()
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def member_location(archive_path, member_name):
+    return f"{archive_path}{ARCHIVE_SEPARATOR}{member_name}"
+
+def split_location(location):
+    ''' Split a location into (archive path, member name), or (location, None) if it isn't inside an archive'''
+    archive_path, separator, member_name = location.partition(ARCHIVE_SEPARATOR)
+    if separator and is_archive(archive_path):
+        return archive_path, member_name
+    return location, None
+
+def is_member(location):
+    return split_location(location)[1] is not None
+
+def members(archive_path):
+    ''' The (name, size) of every file in the archive at archive_path, in the order they're stored'''
+    return list(_open(archive_path)[1].items())
+
+@contextmanager
+def open_member(location):
+    ''' A (read only, binary) file object of the archive member at location. No other member can be read until it's closed'''
+    archive_path, member_name = split_location(location)
+    with _archive_lock:
+        archive = _open(archive_path)[0]
+        with archive.open(member_name) if isinstance(archive, zipfile.ZipFile) else archive.extractfile(member_name) as member:
+            yield member
+
+def read_member(location):
+    with open_member(location) as member:
+        return member.read()
+
+def location_stat(location):
+    ''' The (size, modification time in ns) of the file at location. Members of an archive take the modification time of the archive,
+    so that they're treated as changed whenever the archive is'''
+    archive_path, member_name = split_location(location)
+    stat = os.stat(archive_path)
+    if member_name is None:
+        return stat.st_size, stat.st_mtime_ns
+    return _open(archive_path)[1][member_name], stat.st_mtime_ns
+
+def file_stem(location):
+    ''' The name of the file at location without its extension, e.g. RP1 for exports/patient.zip::plans/RP1.dcm'''
+    name = split_location(location)[1] or location
+    return os.path.splitext(os.path.basename(name.replace("/", os.sep)))[0]
+
+def absolute_location(location):
+    archive_path, member_name = split_location(location)
+    if member_name is None:
+        return os.path.abspath(location)
+    return member_location(os.path.abspath(archive_path), member_name)
+
+def _open(archive_path):
+    ''' The open ZipFile or TarFile of the archive at archive_path, along with a dictionary of the size of each of its files.
+    The archive is reopened if it has changed since it was opened'''
+    with _archive_lock:
+        return _open_locked(archive_path)
+
+def _open_locked(archive_path):
+    key = os.path.abspath(archive_path)
+    mtime = os.stat(archive_path).st_mtime_ns
+    if key in _open_archives:
+        archive, sizes, opened_mtime = _open_archives.pop(key)
+        if opened_mtime == mtime:
+            _open_archives[key] = archive, sizes, opened_mtime
+            return archive, sizes
+        archive.close()
+
+    if zipfile.is_zipfile(archive_path):
+        archive = zipfile.ZipFile(archive_path)
+        sizes = dict((info.filename, info.file_size) for info in archive.infolist() if not info.is_dir())
+    else:
+        archive = tarfile.open(archive_path)
+        sizes = dict((info.name, info.size) for info in archive.getmembers() if info.isfile())
+    _open_archives[key] = archive, sizes, mtime
+    while len(_open_archives) > OPEN_ARCHIVES:
+        _open_archives.popitem(last=False)[1][0].close()
+    return archive, sizes
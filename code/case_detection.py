@@ -0,0 +1,68 @@
+''' Module for working out which truth table case a plan belongs to, so that batches can run without asking the user
+
+The case is looked for in order of how reliable each source is:
+1. The file name, e.g. YellowLvlIII_7a.dcm or YellowLvlIII_8aColls5.dcm are case 7 and case 8
+2. The plan's RTPlanLabel or RTPlanName, e.g. A7a or 7a
+3. The plan's beam signature: the cases whose gantry angles, prescription and wedges all match the plan.
+    This is only used if exactly one case matches
+'''
+
+import re
+from code import strings
+from .archives import file_stem
+from .parameters.plan_context import PlanContext
+from .parameters.extractor_functions import extractor_functions
+from .parameters.parameter_retrieval import required_tags
+from .parameters.evaluator_functions import evaluator_functions
+
+# The audit's naming convention: a case number followed by a lower case variant letter (7a, 8b, 1c6FFF...). In a file name it
+# comes after an underscore (YellowLvlIII_7a.dcm), and a plan's label or name starts with it (A7a, 7a). A number followed by x
+# and another number is a field size (10x10), not a case
+FILENAME_CASE_PATTERN = re.compile(r"_(\d{1,2})(?!x\d)[a-z](?![a-z])")
+LABEL_CASE_PATTERN = re.compile(r"A?(\d{1,2})(?!x\d)[a-z](?![a-z])")
+
+# The parameters that make up a plan's beam signature. None of these depend on the case when they're extracted
+SIGNATURE_PARAMETERS = [strings.gantry, strings.prescription_dose, strings.wedge]
+
+# The top level tags of a plan that detecting its case reads
+DETECTION_TAGS = ["RTPlanLabel", "RTPlanName"] + required_tags(SIGNATURE_PARAMETERS)
+
+def case_from_filename(location, cases):
+    ''' The case number in the file name of location, or None'''
+    return _case_from_text(FILENAME_CASE_PATTERN.search(file_stem(location)), cases)
+
+def case_from_dataset(dataset, truth_table):
+    ''' Returns (case number, where it was found) for a plan, or (None, None) if it can't be determined'''
+    for keyword in ["RTPlanLabel", "RTPlanName"]:
+        case_number = _case_from_text(LABEL_CASE_PATTERN.match(str(dataset.get(keyword, "")).strip()), truth_table.cases)
+        if case_number is not None:
+            return case_number, keyword
+
+    matches = _signature_matches(dataset, truth_table)
+    if len(matches) == 1:
+        return matches[0], "signature"
+    return None, None
+
+def _case_from_text(match, cases):
+    ''' The case number of a match of one of the case patterns, or None if there's no match or the case isn't in the truth table'''
+    if match and 1 <= int(match.group(1)) <= cases:
+        return int(match.group(1))
+    return None
+
+def _signature_matches(dataset, truth_table):
+    ''' The cases whose signature parameters all PASS for this plan (ignoring cases that accept any value for all of them)'''
+    plan = PlanContext(dataset, {}, None)
+    try:
+        signature = dict((parameter, extractor_functions[parameter](plan)) for parameter in SIGNATURE_PARAMETERS)
+    except Exception:
+        return []
+
+    matches = []
+    for case in range(1, truth_table.cases + 1):
+        rules = truth_table.case_rules(case)
+        if all(rules[parameter].any for parameter in SIGNATURE_PARAMETERS):
+            continue
+        context = {"parameter_values": signature, "rules": rules, "case": case, "file_type": plan.mode}
+        if all(evaluator_functions[parameter](value, rules[parameter], **context) == strings.PASS for parameter, value in signature.items()):
+            matches.append(case)
+    return matches
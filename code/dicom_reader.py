@@ -0,0 +1,285 @@
+''' Module for reading DICOM files from disk
+
+Classifying a file only needs a handful of header tags, so read_header never decodes the body of the file.
+This matters for RTDOSE files, whose pixel data can be hundreds of MB.
+
+Likewise, extracting parameters from a plan only needs a few of the tags in each beam and control point, while
+most of the bytes of a large VMAT plan are MLC leaf positions. Given the tags that the extraction functions use,
+read_dataset walks over the encoded file and only builds the elements (and sequence items) on the paths to those
+tags. pydicom can't do this itself: its specific_tags only applies to the top level, and sequences of undefined
+length (which planning systems commonly write) are always parsed in full, even when they aren't wanted.
+
+Both functions can read files through a memory map (memory_map=True) instead of reading them into memory.
+Only the bytes of the elements that are kept are then copied out of the operating system's page cache,
+which also keeps the files cached for the next audit of the same archive.
+
+Both functions also accept the locations of files inside ZIP or tar archives (see archives.py).
+read_dataset can also be given the bytes of a file that has already been read (see read_bytes and pipeline.py).
+'''
+
+import os
+import mmap
+import struct
+import pydicom
+from io import BytesIO
+from contextlib import contextmanager
+from collections import namedtuple
+
+# The targeted reader below and study_files.py use APIs that are new in pydicom 3 (the VR enum, Dataset.original_encoding...),
+# so fail with a clear message now rather than part way through a run
+if int(pydicom.__version__.split(".")[0]) < 3:
+    raise ImportError(f"pydicom {pydicom.__version__} is installed, but 3.0 or above is needed (pip install \"pydicom>=3.0\")")
+
+from pydicom.dataset import Dataset, FileDataset
+from pydicom.dataelem import DataElement, RawDataElement
+from pydicom.datadict import tag_for_keyword
+from pydicom.sequence import Sequence
+from pydicom.tag import Tag
+from pydicom.valuerep import VR
+from .archives import is_member, open_member, read_member
+
+# Sequences through which RT DICOMs refer to each other (plan -> structure set, dose -> plan/structure set)
+REFERENCE_SEQUENCES = ["ReferencedStructureSetSequence", "ReferencedRTPlanSequence"]
+
+# The tags needed to classify a DICOM and link it to the other DICOMs of the same study
+HEADER_TAGS = ["Modality", "StudyInstanceUID", "SOPInstanceUID"] + REFERENCE_SEQUENCES
+
+# Element values larger than this are only read from disk if they are actually used
+DEFER_SIZE = "256 KB"
+
+DicomHeader = namedtuple("DicomHeader", ["path", "modality", "study_uid", "sop_uid", "referenced_uids"])
+
+def read_header(path, memory_map=False):
+    ''' Read just enough of the DICOM at path to tell what it is, without touching its pixel data'''
+    if is_member(path):
+        # Only as much of the member as is needed is decompressed
+        with open_member(path) as member:
+            dataset = pydicom.dcmread(member, force=True, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+    else:
+        with _memory_mapped(path, memory_map) as mapped:
+            dataset = pydicom.dcmread(mapped if mapped is not None else path, force=True, stop_before_pixels=True, specific_tags=HEADER_TAGS)
+
+    referenced_uids = []
+    for sequence in REFERENCE_SEQUENCES:
+        for item in dataset.get(sequence) or []:
+            if "ReferencedSOPInstanceUID" in item:
+                referenced_uids.append(str(item.ReferencedSOPInstanceUID))
+
+    return DicomHeader(path, _text(dataset, "Modality"), _text(dataset, "StudyInstanceUID"),
+                       _text(dataset, "SOPInstanceUID"), tuple(referenced_uids))
+
+def read_bytes(path):
+    ''' The whole encoded DICOM at path (which may be inside an archive), to read a dataset from later with read_dataset'''
+    if is_member(path):
+        return read_member(path)
+    with open(path, "rb") as dicom_file:
+        return dicom_file.read()
+
+def read_dataset(path, tags=None, memory_map=False, data=None):
+    ''' Read the DICOM at path for extraction. Pixel data is never loaded and other large values are deferred
+
+    tags                - the tags to read, as keyword paths (see tag_tree), or None to read every tag. HEADER_TAGS are always read
+    memory_map          - whether to read the file through a memory map
+    data                - the bytes of the file (see read_bytes) if they've already been read, in which case the file isn't read again
+
+    Elements that aren't on the path to one of the tags are left out of the dataset without being parsed.
+    '''
+    with _memory_mapped(path, memory_map and data is None) as mapped:
+        if data is not None:
+            buffer = data
+        elif mapped is not None:
+            buffer = mapped
+        elif is_member(path):
+            buffer = read_member(path)
+        else:
+            buffer = None
+
+        if tags is None:
+            return _dcmread(path, buffer)
+        if buffer is None:
+            buffer = read_bytes(path)
+        try:
+            return _TargetedReader(buffer).read(path, tag_tree(HEADER_TAGS + ["SpecificCharacterSet"] + list(tags)))
+        except UnsupportedPydicom:
+            raise
+        except Exception:
+            # Anything the targeted reader doesn't handle (e.g. a deflated transfer syntax) is read by pydicom instead
+            return _dcmread(path, buffer, [keyword.split(".")[0] for keyword in tags] + HEADER_TAGS)
+
+@contextmanager
+def _memory_mapped(path, memory_map):
+    ''' A read only memory map of the file at path if memory_map is True, otherwise (or if the file is empty or in an archive,
+    which can't be mapped) None'''
+    if not memory_map or is_member(path) or os.path.getsize(path) == 0:
+        yield None
+        return
+    with open(path, "rb") as dicom_file, mmap.mmap(dicom_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+def _dcmread(path, buffer, specific_tags=None):
+    ''' Read the DICOM at path with pydicom, from buffer (bytes or a memory map of the file) if it has already been read'''
+    if buffer is None:
+        return pydicom.dcmread(path, force=True, stop_before_pixels=True, defer_size=DEFER_SIZE, specific_tags=specific_tags)
+    # Deferred values are read again from the file they came from, which a memory map that's about to be closed (or bytes) can't do.
+    # Nothing is deferred then, but with a memory map only the elements that are read are copied out of the map
+    file_object = BytesIO(buffer) if isinstance(buffer, bytes) else buffer
+    file_object.seek(0)
+    dataset = pydicom.dcmread(file_object, force=True, stop_before_pixels=True, specific_tags=specific_tags)
+    dataset.filename = path
+    return dataset
+
+def tag_tree(paths):
+    ''' Turn keyword paths into a tree of the tags to read
+
+    Each path is a chain of keywords from the top level of the dataset, e.g. "BeamSequence.ControlPointSequence.GantryAngle".
+    The tree is a dictionary of tag to the tree of tags to read within that element's sequence items,
+    or to None if the whole element is to be read (so a path ending with a sequence reads the whole sequence)
+    '''
+    tree = {}
+    for path in paths:
+        node = tree
+        keywords = path.split(".")
+        for depth, keyword in enumerate(keywords):
+            tag = tag_for_keyword(keyword)
+            if tag is None:
+                raise ValueError(f"{keyword} (in {path}) is not a DICOM keyword")
+            if depth == len(keywords) - 1:
+                node[tag] = None
+            elif node.get(tag, {}) is None:
+                # The whole element is already being read
+                break
+            else:
+                node = node.setdefault(tag, {})
+    return tree
+
+# Tags of the items in sequences and the delimiters that end items and sequences of undefined length
+ITEM_TAG = 0xFFFEE000
+ITEM_DELIMITER_TAG = 0xFFFEE00D
+SEQUENCE_DELIMITER_TAG = 0xFFFEE0DD
+PIXEL_DATA_TAG = 0x7FE00010
+UNDEFINED_LENGTH = 0xFFFFFFFF
+
+# Explicit VRs that are followed by 2 reserved bytes and a 4 byte length, rather than a 2 byte length
+LONG_LENGTH_VRS = {b"OB", b"OD", b"OF", b"OL", b"OV", b"OW", b"SQ", b"SV", b"UC", b"UN", b"UR", b"UT", b"UV"}
+KNOWN_VRS = {vr.value.encode() for vr in VR}
+
+class UnsupportedPydicom(Exception):
+    ''' Raised when the installed version of pydicom doesn't have the (private) functions the targeted reader relies on'''
+
+def _read_file_meta_info(file_object):
+    ''' The file meta information of an encoded DICOM, leaving file_object at the start of the dataset that follows it.
+    pydicom only has a private function for this, which may change between versions'''
+    read_file_meta_info = getattr(pydicom.filereader, "_read_file_meta_info", None)
+    if read_file_meta_info is None:
+        raise UnsupportedPydicom(f"pydicom {pydicom.__version__} can't read file meta information on its own; pydicom 3.0 is known to work")
+    return read_file_meta_info(file_object)
+
+class _TargetedReader:
+    ''' Reads the elements of a tag_tree from an encoded DICOM, skipping over the bytes of everything else'''
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def read(self, path, tree):
+        # A memory map can be read from like a file, without copying it into memory first
+        file_object = BytesIO(self.buffer) if isinstance(self.buffer, bytes) else self.buffer
+        file_object.seek(0)
+        preamble = pydicom.filereader.read_preamble(file_object, True)
+        file_meta = _read_file_meta_info(file_object)
+        start = file_object.tell()
+
+        transfer_syntax = file_meta.get("TransferSyntaxUID")
+        if transfer_syntax is not None:
+            if transfer_syntax.is_deflated or not transfer_syntax.is_transfer_syntax:
+                raise ValueError(f"{transfer_syntax} can't be read directly")
+            self.implicit, self.little_endian = transfer_syntax.is_implicit_VR, transfer_syntax.is_little_endian
+        else:
+            # Without file meta information pydicom assumes little endian, with implicit VRs unless a VR follows the first tag
+            self.implicit, self.little_endian = self.buffer[start + 4:start + 6] not in KNOWN_VRS, True
+        endian = "<" if self.little_endian else ">"
+        self.tag_format, self.short_format, self.long_format = endian + "HH", endian + "H", endian + "L"
+
+        elements, _ = self._dataset(start, len(self.buffer), tree, top_level=True)
+        dataset = FileDataset(path, elements, preamble=preamble, file_meta=file_meta,
+                              is_implicit_VR=self.implicit, is_little_endian=self.little_endian)
+        dataset.set_original_encoding(self.implicit, self.little_endian, dataset._character_set)
+        return dataset
+
+    def _header(self, position):
+        ''' The (tag, VR, length, position of the value) of the element at position'''
+        group, element = struct.unpack_from(self.tag_format, self.buffer, position)
+        if self.implicit or group == 0xFFFE:
+            # Items and delimiters never have a VR
+            return (group << 16) | element, None, struct.unpack_from(self.long_format, self.buffer, position + 4)[0], position + 8
+        vr = self.buffer[position + 4:position + 6]
+        if vr in LONG_LENGTH_VRS:
+            return (group << 16) | element, vr.decode(), struct.unpack_from(self.long_format, self.buffer, position + 8)[0], position + 12
+        return (group << 16) | element, vr.decode(), struct.unpack_from(self.short_format, self.buffer, position + 6)[0], position + 8
+
+    def _skip_undefined_length(self, position):
+        ''' Skip the items of the undefined length value at position, returning the position after its sequence delimiter'''
+        while True:
+            tag, _, length, position = self._header(position)
+            if tag == SEQUENCE_DELIMITER_TAG:
+                return position
+            if length == UNDEFINED_LENGTH:
+                position = self._skip_item(position)
+            else:
+                position += length
+
+    def _skip_item(self, position):
+        ''' Skip the elements of the undefined length item at position, returning the position after its item delimiter'''
+        while True:
+            tag, _, length, position = self._header(position)
+            if tag == ITEM_DELIMITER_TAG:
+                return position
+            position = self._skip_undefined_length(position) if length == UNDEFINED_LENGTH else position + length
+
+    def _dataset(self, position, end, tree, top_level=False):
+        ''' Read the elements in tree from the dataset between position and end (None for an item ended by a delimiter)
+
+        Returns (the elements, the position after the dataset)
+        '''
+        elements = {}
+        while end is None or position < end:
+            tag, vr, length, value_position = self._header(position)
+            if tag == ITEM_DELIMITER_TAG:
+                return elements, value_position
+            if top_level and tag == PIXEL_DATA_TAG:
+                break
+
+            undefined_length = length == UNDEFINED_LENGTH
+            next_position = self._skip_undefined_length(value_position) if undefined_length else value_position + length
+            if tag in tree:
+                subtree = tree[tag]
+                if subtree is None:
+                    # Read the whole element. Its value is only parsed by pydicom if it's used
+                    value_end = next_position - 8 if undefined_length else next_position
+                    elements[Tag(tag)] = RawDataElement(Tag(tag), vr, value_end - value_position, self.buffer[value_position:value_end],
+                                                        value_position, self.implicit, self.little_endian)
+                else:
+                    sequence = self._sequence(value_position, None if undefined_length else next_position, subtree)
+                    elements[Tag(tag)] = DataElement(Tag(tag), "SQ", sequence, value_position, is_undefined_length=undefined_length)
+            position = next_position
+        return elements, position
+
+    def _sequence(self, position, end, tree):
+        ''' Read the items of the sequence between position and end (None for a sequence ended by a delimiter), keeping the elements in tree'''
+        items = []
+        while end is None or position < end:
+            tag, _, length, position = self._header(position)
+            if tag == SEQUENCE_DELIMITER_TAG:
+                break
+            if length == UNDEFINED_LENGTH:
+                elements, position = self._dataset(position, None, tree)
+            else:
+                elements, _ = self._dataset(position, position + length, tree)
+                position += length
+            item = Dataset(elements)
+            item.set_original_encoding(self.implicit, self.little_endian, "iso8859")
+            items.append(item)
+        return Sequence(items)
+
+def _text(dataset, keyword):
+    value = dataset.get(keyword)
+    return str(value) if value is not None else None
@@ -0,0 +1,30 @@
+''' Module for finding the plans to check in the input folders and archives
+
+Discovery is a generator, so that plans can be checked as soon as they are found: the plans of the first folder
+of a large export are checked while the rest of it is still being indexed, and nothing has to be listed up front.
+
+Each folder (and each archive) has its own FolderIndex (or ArchiveIndex), which links the plans in it with
+the dose and structure set files of the same study.
+'''
+
+import os
+from collections import deque
+from .archives import is_archive
+from .folder_index import FolderIndex, ArchiveIndex
+
+def discover(location, recursive=False, memory_map=False):
+    ''' Yield (folder, index) for the folder or archive at location, as each is indexed
+
+    Archives found in a folder are yielded as folders of their own. If recursive, the folders below
+    location are yielded too (breadth first, in order of their names); otherwise only location and its archives are.
+    '''
+    pending = deque([location])
+    while pending:
+        folder = pending.popleft()
+        index = ArchiveIndex(folder, memory_map) if is_archive(folder) and os.path.isfile(folder) else FolderIndex(folder, memory_map)
+        yield folder, index
+
+        # Archives are indexed straight after their folder, and subfolders after everything at this level
+        pending.extendleft(reversed(index.archives))
+        if recursive:
+            pending.extend(index.subfolders)
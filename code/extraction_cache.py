@@ -0,0 +1,65 @@
+''' Module for caching extracted parameters between runs
+
+Extracted parameters are stored in an SQLite database, keyed by the plan's path and case number. An entry is
+only used if the plan's size and modification time, the EXTRACTOR_VERSION and the dose/structure set files
+linked to the plan are all unchanged since it was stored. Unchanged plans therefore skip pydicom entirely and
+are just evaluated against the current truth table.
+'''
+
+import json
+import sqlite3
+from .archives import location_stat, absolute_location
+from .parameters.parameter_retrieval import EXTRACTOR_VERSION, PARAMETERS
+
+CACHE_FILE = ".extraction_cache.sqlite3"
+
+class ExtractionCache:
+    def __init__(self, cache_file):
+        # Several worker processes may share the cache, so wait for each other's writes instead of failing
+        self.connection = sqlite3.connect(cache_file, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            # Caches from before plans' SOPInstanceUIDs were kept are just started again
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(extractions)")]
+            if columns and "plan_uid" not in columns:
+                self.connection.execute("DROP TABLE extractions")
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS extractions (
+                                        path TEXT, case_number INTEGER, size INTEGER, mtime INTEGER, version INTEGER,
+                                        study_uid TEXT, plan_uid TEXT, linked_files TEXT, parameters TEXT,
+                                        PRIMARY KEY (path, case_number))''')
+
+    def lookup(self, location, case_number, dose_struct_index, parameters_needed=PARAMETERS):
+        ''' The cached (parameters, SOPInstanceUID) of the plan at location, or None if there are none, they are out of date or
+        they don't include all of parameters_needed (e.g. because only some were extracted last time)'''
+        row = self.connection.execute('''SELECT size, mtime, version, study_uid, plan_uid, linked_files, parameters FROM extractions
+                                         WHERE path = ? AND case_number = ?''', (absolute_location(location), case_number)).fetchone()
+        if row is None:
+            return None
+
+        size, mtime, version, study_uid, plan_uid, linked_files, parameters = row
+        if (size, mtime, version) != location_stat(location) + (EXTRACTOR_VERSION,):
+            return None
+        if json.loads(linked_files) != _linked_files(study_uid, dose_struct_index):
+            return None
+        parameters = json.loads(parameters)
+        if any(parameter not in parameters for parameter in parameters_needed):
+            return None
+        return parameters, plan_uid
+
+    def store(self, location, case_number, study_uid, plan_uid, dose_struct_index, parameters):
+        size, mtime = location_stat(location)
+        with self.connection:
+            self.connection.execute('''INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                    (absolute_location(location), case_number, size, mtime, EXTRACTOR_VERSION,
+                                     study_uid, plan_uid, json.dumps(_linked_files(study_uid, dose_struct_index)), json.dumps(parameters)))
+
+    def close(self):
+        self.connection.close()
+
+def _linked_files(study_uid, dose_struct_index):
+    ''' A JSON friendly fingerprint of the dose and structure set files linked to a study'''
+    linked_files = []
+    for path, modality in dose_struct_index.get(study_uid, []):
+        linked_files.append([absolute_location(path), modality, *location_stat(path)])
+    return sorted(linked_files)
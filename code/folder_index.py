@@ -0,0 +1,102 @@
+''' Module for indexing the DICOMs in a folder
+
+The folder is listed once and each .dcm file's header is read once. The resulting index is then used both to
+find the RTPLANs to check and to link them with the RTDOSE and RTSTRUCT files of the same study.
+
+An ArchiveIndex does the same for the .dcm files in a ZIP or tar archive (see archives.py).
+'''
+
+import os
+from collections import namedtuple
+from code import strings
+from .dicom_reader import read_header
+from .archives import is_archive, is_member, members, member_location
+
+IndexEntry = namedtuple("IndexEntry", ["path", "size", "mtime", "modality", "study_uid", "sop_uid", "referenced_uids"])
+
+class FolderIndex:
+    ''' An index of the .dcm files directly inside a folder, keyed by (normalised) path'''
+
+    def __init__(self, folder_path, memory_map=False):
+        self.folder_path = folder_path
+        # Whether headers are read through a memory map (see dicom_reader.py)
+        self.memory_map = memory_map
+        self.entries = {}
+        self.refresh()
+
+    def refresh(self):
+        ''' Bring the index up to date with the folder, returning the entries that are new or have changed.
+
+        Only files whose size or modification time differ from the last scan have their headers read again.
+        '''
+        changed = []
+        found = {}
+        for path, size, mtime in self._files():
+            entry = self.entries.get(path)
+            if entry is None or entry.size != size or entry.mtime != mtime:
+                entry = IndexEntry(path, size, mtime, *_read_header_fields(path, self.memory_map))
+                changed.append(entry)
+            found[path] = entry
+
+        self.entries = found
+        return sorted(changed)
+
+    def _files(self):
+        ''' Yield the (normalised path, size, modification time in ns) of each .dcm file in the folder.
+        The folders and archives inside the folder are noted along the way, for discovery.py'''
+        subfolders = []
+        archives = []
+        with os.scandir(self.folder_path or ".") as folder:
+            for item in folder:
+                if item.is_dir():
+                    subfolders.append(item.path)
+                elif item.is_file() and is_archive(item.name):
+                    archives.append(item.path)
+                elif item.is_file() and item.name.endswith(".dcm"):
+                    stat = item.stat()
+                    yield os.path.normpath(item.path), stat.st_size, stat.st_mtime_ns
+        self.subfolders = sorted(subfolders)
+        self.archives = sorted(archives)
+
+    def entry(self, path):
+        ''' The entry for the file at path, or None if it isn't in the index'''
+        return self.entries.get(path if is_member(path) else os.path.normpath(path))
+
+    def plans(self):
+        ''' All RTPLAN entries, sorted by path'''
+        return [entry for entry in self.sorted_entries() if entry.modality == strings.RTPLAN]
+
+    def sorted_entries(self):
+        return [self.entries[path] for path in sorted(self.entries)]
+
+    def dose_struct_index(self):
+        ''' Map each StudyInstanceUID to the [(location, modality), ...] of the dose and structure set DICOMs in the folder'''
+        dose_struct_index = {}
+        for entry in self.sorted_entries():
+            if entry.modality in [strings.RTDOSE, strings.RTSTRUCT]:
+                dose_struct_index.setdefault(entry.study_uid, []).append((entry.path, entry.modality))
+        return dose_struct_index
+
+    def referencing(self, sop_uid):
+        ''' All entries that refer to the DICOM with the given SOPInstanceUID (e.g. the RTDOSE files calculated for a plan)'''
+        return [entry for entry in self.sorted_entries() if sop_uid in entry.referenced_uids]
+
+def _read_header_fields(path, memory_map=False):
+    ''' The header fields of the DICOM at path; a file that can't be read (e.g. one still being copied in) is left unclassified'''
+    try:
+        return read_header(path, memory_map)[1:]
+    except Exception:
+        return None, None, None, ()
+
+class ArchiveIndex(FolderIndex):
+    ''' An index of the .dcm files anywhere inside a ZIP or tar archive, keyed by their location (see archives.member_location)'''
+
+    def _files(self):
+        # Every member takes the modification time of the archive, so all of them are read again if the archive changes
+        mtime = os.stat(self.folder_path).st_mtime_ns
+        archive_path = os.path.normpath(self.folder_path)
+        for name, size in members(self.folder_path):
+            if name.endswith(".dcm"):
+                yield member_location(archive_path, name), size, mtime
+        self.subfolders = []
+        self.archives = []
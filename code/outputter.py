@@ -1,30 +1,90 @@
 '''Collection of functions to output the extracted parameters into the format specified by the user'''
 
-import pandas as pd
+import os
+import csv
+import json
 
-def output_csv(data, filepath):
-    headers = ["Parameter Name", "Parameter Value", "Parameter Evaluation", "Parameter Solution"]
-    allValues = []
+headers = ["Parameter Name", "Parameter Value", "Parameter Evaluation", "Parameter Solution"]
 
-    for item in data[0]:
-        Value = [item] + [column[item] for column in data]
-        allValues.append(Value)
+def report_rows(data):
+    ''' One [name, value, evaluation, solution] row per parameter'''
+    return [[item] + [column[item] for column in data] for item in data[0]]
 
-    test_pd = pd.DataFrame(columns=headers, data=allValues)
+def json_record(data, details):
+    ''' The report of a plan as a JSON friendly dictionary; details (see processing.check_dicom) should include the plan's location'''
+    parameters, evaluations, solutions = data
+    record = {"plan": None}
+    record.update(details or {})
+    record.update(parameters=parameters, evaluations=evaluations, solutions=solutions)
+    return record
 
+def output_csv(data, filepath, details=None):
     filepath = filepath + ".csv" if not filepath.endswith(".csv") else filepath
-    test_pd.to_csv(filepath, encoding='utf-8', index=False)
+    with open(filepath, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file, lineterminator=os.linesep)
+        writer.writerow(headers)
+        writer.writerows(report_rows(data))
     return filepath
 
-def output_stdout(data, filepath):
+def output_json(data, filepath, details=None):
+    ''' Writes the report as a single line of JSON, so that reports can also be concatenated into a JSON Lines file'''
+    filepath = filepath + ".json" if not filepath.endswith(".json") else filepath
+    with open(filepath, 'w', encoding='utf-8') as json_file:
+        json_file.write(json.dumps(json_record(data, details), default=str) + "\n")
+    return filepath
+
+def output_stdout(data, filepath, details=None):
     for key in data[0]:
         print(key + ": " + " || ".join([str(column[key]) for column in data]))
 
+class BatchCsvWriter:
+    ''' Writes the reports of a whole batch of plans into a single csv file, with a Plan column identifying which plan each row is from.
+    Each plan's rows are written (and flushed) as soon as it's been processed, rather than keeping the whole batch in memory'''
+
+    def __init__(self, filepath):
+        self.filepath = filepath + ".csv" if not filepath.endswith(".csv") else filepath
+        self.file = open(self.filepath, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, lineterminator=os.linesep)
+        self.writer.writerow(["Plan"] + headers)
+
+    def write(self, plan, parameters, evaluations, solutions, details=None):
+        self.writer.writerows([[plan] + row for row in report_rows((parameters, evaluations, solutions))])
+        self.file.flush()
+        return self.filepath
+
+    def close(self):
+        self.file.close()
+
+class BatchJsonWriter:
+    ''' Writes the reports of a whole batch of plans into a single JSON Lines file: one JSON record per plan, written as soon as it's been processed'''
+
+    def __init__(self, filepath):
+        self.filepath = filepath + ".jsonl" if not filepath.endswith(".jsonl") else filepath
+        self.file = open(self.filepath, 'w', encoding='utf-8')
+
+    def write(self, plan, parameters, evaluations, solutions, details=None):
+        self.file.write(json.dumps(json_record((parameters, evaluations, solutions), dict(details or {}, plan=plan)), default=str) + "\n")
+        self.file.flush()
+        return self.filepath
+
+    def close(self):
+        self.file.close()
+
 formatter = {
     'csv': output_csv,
+    'json': output_json,
     'stdout': output_stdout
 }
 
-def output(parameters, evaluations, solutions, filepath, format):
+batch_formatter = {
+    'csv': BatchCsvWriter,
+    'json': BatchJsonWriter
+}
+
+def output(parameters, evaluations, solutions, filepath, format, details=None):
     formatter_function = formatter[format]
-    return formatter_function((parameters, evaluations, solutions), filepath)
\ No newline at end of file
+    return formatter_function((parameters, evaluations, solutions), filepath, details)
+
+def open_batch_output(filepath, format):
+    ''' Start a report for a whole batch of plans; call write(plan, parameters, evaluations, solutions) for each plan and close() at the end'''
+    return batch_formatter[format](filepath)
@@ -3,168 +3,218 @@
 Each function in supplied with the same arguments (**kwargs are a bundled set of values):
 
 param_value - the value extracted (and formatted) by the corresponding extraction function
-table_value - the value from the truth table (corresponding to case and parameter)
+rule        - the Rule parsed from the truth table value (corresponding to case and parameter), see parser_functions.py.
+                rule.raw is the value exactly as written in the truth table
 
 **kwargs {
     "parameter_values"  - the complete dictionary of extracted values
-    "truth_table"       - the complete truth table dictionary
+    "rules"             - the complete {parameter: Rule} dictionary of this case
     "case"              - the case number of this plan that's being evaluated
     "file_type"         - Whether it's IMRT, VMAT or not VMAT
 }
 '''
 
+import numpy as np
 from code import strings
 
-def _evaluate_gantry(param_value, table_value, **kwargs):
+# VMAT control points within GANTRY_TOLERANCE degrees of a truth table gantry angle must have an SSD within SSD_TOLERANCE cm of its SSD
+GANTRY_TOLERANCE = 0.3
+SSD_TOLERANCE = 1
+
+def _evaluate_gantry(param_value, rule, **kwargs):
     # This line checks whether the parameter value found is the same as the truth table value (this is why the formating of the two dictionaries is important) and gives a "PASS" value
     # Also there are other instances where a PASS is given such as if the Truth Table is a dash for a given parameter in that case any value will satisfy
     # Or if the file is a VMAT and the parameter is either a gantry or an SSD
     file_type = kwargs["file_type"]
 
-    for value in table_value.split(","):
-        if not value.isdigit() and value!=strings.ANY_VALUE:
-            return strings.TRUTH_TABLE_ERROR
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
 
     if file_type == strings.VMAT:
         return strings.PASS
     else:
-        return strings.PASS if (param_value == table_value or table_value == strings.ANY_VALUE) else strings.FAIL
+        return strings.PASS if (param_value == rule.raw or rule.any) else strings.FAIL
 
-def _evaluate_ssd(param_value, table_value, **kwargs):
-    if table_value == strings.ANY_VALUE:
+def _evaluate_ssd(param_value, rule, **kwargs):
+    if rule.any:
         return strings.PASS
 
-    for value in table_value.split(","):
-        if not value.isdigit() and value!=strings.ANY_VALUE and value!="?":
-            return strings.TRUTH_TABLE_ERROR
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
 
     if kwargs["file_type"] == strings.VMAT:
-        truth_table = kwargs["truth_table"]
+        gantry_rule = kwargs["rules"][strings.gantry]
         parameter_values = kwargs["parameter_values"]
-        case = kwargs["case"]
 
-        if truth_table[strings.gantry][case-1] == strings.ANY_VALUE or parameter_values[strings.gantry] == "error retrieving gantry":
-            if truth_table[strings.gantry][case-1] != strings.ANY_VALUE:
+        if gantry_rule.any or parameter_values[strings.gantry] == "error retrieving gantry":
+            if not gantry_rule.any:
                 return strings.PASS
             else:
                 return strings.FAIL
 
+        if gantry_rule.error:
+            return strings.TRUTH_TABLE_ERROR
+
         if len(parameter_values[strings.gantry])!=len(parameter_values[strings.SSD]):
             return strings.FAIL
 
-        truth_table_gantry_list = truth_table[strings.gantry][case-1].split(',')
-        truth_table_ssd_list = truth_table[strings.SSD][case-1].split(',')
-        if len(truth_table_gantry_list) != len(truth_table_ssd_list):
+        if len(gantry_rule.items) != len(rule.items):
             return strings.FAIL
 
-        for i in range(len(truth_table_gantry_list)):
-            gantry_value = float(truth_table_gantry_list[i])
-            ssd_value = truth_table_ssd_list[i]
-            if ssd_value == '?':
+        # Sort the control points by gantry angle once, so the control points near each truth table angle
+        # can be found with a binary search instead of comparing every angle with every control point
+        gantry_angles = np.asarray(parameter_values[strings.gantry], dtype=float)
+        order = np.argsort(gantry_angles, kind="stable")
+        gantry_angles = gantry_angles[order]
+        ssds = np.asarray(parameter_values[strings.SSD], dtype=float)[order]
+
+        for gantry_value, ssd_value in zip(gantry_rule.items, rule.items):
+            if gantry_value is None or ssd_value is None:
                 continue
 
-            ssd_value=float(ssd_value)
-            j = 0
-            while j < len(parameter_values[strings.gantry]):
-                if abs(parameter_values[strings.gantry][j] - gantry_value) < 0.3:
-                    if abs(parameter_values[strings.SSD][j] - ssd_value) > 1:
-                        return strings.FAIL
-                j+=1
+            start = np.searchsorted(gantry_angles, gantry_value - GANTRY_TOLERANCE, side="left")
+            end = np.searchsorted(gantry_angles, gantry_value + GANTRY_TOLERANCE, side="right")
+            # Every control point within the tolerance of the truth table angle must have a matching SSD
+            near = np.abs(gantry_angles[start:end] - gantry_value) < GANTRY_TOLERANCE
+            if np.any(np.abs(ssds[start:end][near] - ssd_value) > SSD_TOLERANCE):
+                return strings.FAIL
         return strings.PASS
     else:
-        truth_table_ssd_list = table_value.split(',')
-        if len(truth_table_ssd_list) != len(param_value):
+        if len(rule.items) != len(param_value):
             return strings.FAIL
 
-        i=0
-        while i < len(truth_table_ssd_list):
-            if truth_table_ssd_list[i] != '?':
-                if abs(int(truth_table_ssd_list[i])-float(param_value[i])) > 1:
+        for ssd_value, extracted_ssd in zip(rule.items, param_value):
+            if ssd_value is not None:
+                if abs(ssd_value-float(extracted_ssd)) > SSD_TOLERANCE:
                     return strings.FAIL
-            i+=1
         return strings.PASS
 
-def _evaluate_wedge(param_value, table_value, **kwargs):
-    for value in table_value.split(","):
-        if not value.isdigit() and value!=strings.ANY_VALUE and value!=strings.no_wedge:
-            return strings.TRUTH_TABLE_ERROR
+def _evaluate_wedge(param_value, rule, **kwargs):
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
 
-    if table_value == strings.no_wedge:
+    if rule.raw == strings.no_wedge:
         all_no_wedge = all(map(lambda w_angle: w_angle == strings.no_wedge, param_value.split(',')))
         return strings.PASS if all_no_wedge else strings.FAIL
     else:
-        return strings.PASS if table_value == param_value else strings.FAIL
+        return strings.PASS if rule.raw == param_value else strings.FAIL
 
-def _evaluate_prescription_dose(param_value, table_value, **kwargs):
-    ''' param_value and table_value are in the format DOSE/FRACTION/UNIT'''
+def _evaluate_prescription_dose(param_value, rule, **kwargs):
+    ''' param_value and rule.raw are in the format DOSE/FRACTION/UNIT'''
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
 
     prescription_items = param_value.split("/")
-    table_items = table_value.split("/")
-    for i in range(3):
-        if table_items[i] != strings.ANY_VALUE and prescription_items[i] != table_items[i]:
+    if len(prescription_items) < len(rule.items):
+        return strings.FAIL
+    for prescription_item, table_item in zip(prescription_items, rule.items):
+        if table_item is not None and prescription_item != table_item:
             return strings.FAIL
     return strings.PASS
 
-def _evaluate_collimator(param_value, table_value, **kwargs):
-    for value in table_value.split(","):
-        if not value.isdigit() and value!=strings.ANY_VALUE:
-            if not value[0] == "*" or len(value)<2 or not value[1:].isdigit():
-                return strings.TRUTH_TABLE_ERROR
+def _evaluate_collimator(param_value, rule, **kwargs):
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
 
-    if table_value == strings.ANY_VALUE:
+    if rule.any:
         return strings.PASS
 
-    result = table_value == param_value if table_value[0] != '*' else    \
-             table_value[1:] != param_value
+    # A negated rule (e.g. *0) passes for any angle except its own
+    result = (rule.items[0] == param_value) != rule.negated
     return strings.PASS if result else strings.FAIL
 
-def _evaluate_energy(param_value, table_value, **kwargs):
+def _evaluate_energy(param_value, rule, **kwargs):
     ''' Energy is just desired information; not for evaluation'''
     return strings.NOT_APPLICABLE
 
-def _evaluate_field_size(param_value, table_value, **kwargs):
-    if table_value == strings.ANY_VALUE:
+def _evaluate_field_size(param_value, rule, **kwargs):
+    if rule.any:
         return strings.PASS
-    truth_table_ssd_list = table_value.split(',')
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
+    # A field with no jaw or MLC limits on a side is extracted as strings.Not_Extracted, which fails like any other wrong size
     param_value=param_value.split(',')
 
-    if len(truth_table_ssd_list) == 1:
+    if len(rule.items) == 1:
         for i in range(len(param_value)):
-            if param_value[i] == strings.Not_Extracted:
-                return "Not Implemented For MLCX/MLCY"
-            if truth_table_ssd_list[0] != param_value[i]:
+            if rule.items[0] != param_value[i]:
                 return strings.FAIL
         return strings.PASS
     else:
-        i = 0
-        for i in range(len(truth_table_ssd_list)):
-            if truth_table_ssd_list[i] != '?':
-                if param_value[i]==strings.Not_Extracted:
-                    return "Not Implemented For MLCX/MLCY"
-                if truth_table_ssd_list[i]!= param_value[i]:
-                    return strings.FAIL
+        # The table has a size for each beam, so a plan with a different number of beams can't pass
+        if len(param_value) != len(rule.items):
+            return strings.FAIL
+        for i in range(len(rule.items)):
+            if rule.items[i] is not None and rule.items[i] != param_value[i]:
+                return strings.FAIL
+        return strings.PASS
+
+def _structure_names(value):
+    ''' The set of structure names in a comma separated list, ignoring case'''
+    return set(name.strip().casefold() for name in value.split(","))
+
+def _evaluate_structures(param_value, rule, matches):
+    ''' Evaluate a comma separated list of structure names against rule.items, the alternative structures that are acceptable.
+    matches is a function of (the set of extracted names, the list of sets of names of each alternative)'''
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
+    if param_value == rule.raw or rule.any:
         return strings.PASS
+    if param_value == strings.NO_STRUCTURE_SET:
+        return strings.NO_STRUCTURE_SET
+    alternatives = [_structure_names(alternative) for alternative in rule.items]
+    return strings.PASS if matches(_structure_names(param_value), alternatives) else strings.FAIL
+
+def _evaluate_prescription_point(param_value, rule, **kwargs):
+    ''' Passes if dose is prescribed to any of the acceptable structures'''
+    return _evaluate_structures(param_value, rule, lambda names, alternatives: any(names & alternative for alternative in alternatives))
+
+def _evaluate_isocenter_point(param_value, rule, **kwargs):
+    ''' Passes if every beam's isocentre is at one of the acceptable points'''
+    return _evaluate_structures(param_value, rule, lambda names, alternatives: names <= set().union(*alternatives))
+
+def _evaluate_override(param_value, rule, **kwargs):
+    ''' Passes if exactly the structures of one of the alternatives are overridden (or nothing is, for "no override")'''
+    return _evaluate_structures(param_value, rule, lambda names, alternatives: names in alternatives)
+
+def _evaluate_meas(param_value, rule, **kwargs):
+    ''' param_value is a comma separated list of NAME:DOSE, the dose at each measurement point.
+    Passes if the dose was found at every measurement point of the truth table'''
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
+    if param_value == rule.raw or rule.any:
+        return strings.PASS
+    if param_value in [strings.NO_STRUCTURE_SET, strings.NO_DOSE]:
+        return param_value
+
+    doses = dict((name.casefold(), dose) for name, _, dose in (item.rpartition(":") for item in param_value.split(",") if item))
+    for point in rule.items:
+        if point is not None and doses.get(point.casefold(), strings.OUTSIDE_DOSE_GRID) == strings.OUTSIDE_DOSE_GRID:
+            return strings.FAIL
+    return strings.PASS
 
-def _evaluate_default(param_value, table_value, **kwargs):
-    if param_value == table_value or table_value == strings.ANY_VALUE:
+def _evaluate_default(param_value, rule, **kwargs):
+    if rule.error:
+        return strings.TRUTH_TABLE_ERROR
+    if param_value == rule.raw or rule.any:
         return strings.PASS
     return strings.FAIL
 
-def _no_evaluation(param_value, table_value, **kwargs):
+def _no_evaluation(param_value, rule, **kwargs):
     return strings.NOT_APPLICABLE
 
 evaluator_functions = {
     strings.mode                    : _no_evaluation,
     strings.prescription_dose       : _evaluate_prescription_dose,
-    strings.prescription_point      : _evaluate_default,
-    strings.isocenter_point         : _evaluate_default,
-    strings.override                : _evaluate_default,
+    strings.prescription_point      : _evaluate_prescription_point,
+    strings.isocenter_point         : _evaluate_isocenter_point,
+    strings.override                : _evaluate_override,
     strings.collimator              : _evaluate_collimator,
     strings.gantry                  : _evaluate_gantry,
     strings.SSD                     : _evaluate_ssd,
     strings.couch                   : _evaluate_default,
     strings.field_size              : _evaluate_field_size,
     strings.wedge                   : _evaluate_wedge,
-    strings.meas                    : _evaluate_default,
+    strings.meas                    : _evaluate_meas,
     strings.energy                  : _evaluate_energy,
 }
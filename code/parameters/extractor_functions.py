@@ -1,42 +1,28 @@
 '''A collection of functions dealing with extraction of data points from DICOM files
 
-Each function in supplied with the same arguments:
+Each function in supplied with the same argument:
 
-dataset             - The full data from the RTPLAN being extracted
-struct_dose_files   - A dictionary of StudyInstanceUID mapping to a list of RTDOSE and RTSTRUCT files in the same folder as the RTPLAN. 
-                        May be empty if no RTDOSE or RTSTRUCT are found.
-                        Format should be {UID:[(filepath, modality), (filepath, modality)], ...}
-case                - The case number of the RTPLAN being extracted
+plan                - The PlanContext of the RTPLAN being extracted (see plan_context.py). It holds the dataset, struct_dose_files and case,
+                        along with things that several extractors need (mode, treatment beams, control points) so they are only worked out once
 '''
 
+import math
+import numpy as np
 from code import strings
+from .plan_context import MODE_TAGS, BEAMS_TAGS, ARC_GANTRY_TAGS, ARC_SSD_TAGS, STRUCTURE_SET_TAGS, DOSE_GRID_TAGS
 
-def _extract_mode(dataset, struct_dose_files, case):
-    # For now, we are only producing IMRT vs VMAT modes for cases 6, 7, and 8
-    if case not in [6, 7, 8]:
-        return strings.NOT_IMPLEMENTED
-
-    moving_gantry = int(dataset.BeamSequence[0].ControlPointSequence[0].GantryAngle) != \
-                            int(dataset.BeamSequence[0].ControlPointSequence[1].GantryAngle)
-
-    # One beam will be the setup beam, which is not counted
-    number_of_beams = len(dataset.BeamSequence) - 1
-
-    # "If IMRT there should be 5 static gantry positions (5 beams) for each case, and the intensity of the 
-    # beam is modulated by moving the multi leaf collimator (MLC) to different control points within each 
-    # gantry angle. If VMAT the gantry and the MLCs all move at the same time so each control point has 
-    # both gantry moves and MLC moves.""
-    if moving_gantry:
-        mode = strings.VMAT
-    elif not moving_gantry and number_of_beams is 5:
-        mode = strings.IMRT
-    else:
-        mode = "UNKNOWN"
-    return mode
+# Leaf pairs that are closer together than this (in mm) are closed
+MLC_CLOSED_GAP = 1.0
+X_JAW_TYPES = ["X", "ASYMX"]
+Y_JAW_TYPES = ["Y", "ASYMY"]
+MLC_TYPES = ["MLCX", "MLCY"]
+
+def _extract_mode(plan):
+    return plan.mode
 
-def _extract_prescription_dose(dataset, struct_dose_files, case):
-    total_prescription_dose = str(int(dataset.DoseReferenceSequence[0].TargetPrescriptionDose))
-    number_of_fractions = str(dataset.FractionGroupSequence[0].NumberOfFractionsPlanned)
+def _extract_prescription_dose(plan):
+    total_prescription_dose = str(int(plan.dataset.DoseReferenceSequence[0].TargetPrescriptionDose))
+    number_of_fractions = str(plan.dataset.FractionGroupSequence[0].NumberOfFractionsPlanned)
 
     # This section deals with the 'prescription dose/#' parameter
     # You need to make sure that the format of parameter_values['perscription dose/#] is exactly the same as truth_table['perscription dose/#'] in cases where the file passes
@@ -44,144 +30,236 @@ def _extract_prescription_dose(dataset, struct_dose_files, case):
     # Then when perscription dose is 24,48,50, or 900 you also need to check the amount of fractions
     # and when its 900 the primary dosimeter unit needs to be 'MU' as well
     try:
-        prim_dosimeter_unit = dataset.BeamSequence[0].PrimaryDosimeterUnit
+        prim_dosimeter_unit = plan.dataset.BeamSequence[0].PrimaryDosimeterUnit
     except:
         prim_dosimeter_unit = "No primary dosimeter unit"
 
     return total_prescription_dose + "/" + number_of_fractions + "/" + prim_dosimeter_unit
 
-def _extract_collimator(dataset, struct_dose_files, case):
-    beams = list(filter(lambda beam: beam.BeamDescription != strings.SETUP_beam, dataset.BeamSequence))
+def _point_name(plan, position):
+    # The name of the POINT ROI at position, or the position itself (in mm) if there's no point there
+    name = plan.structure_set.point_at(position)
+    return name if name is not None else "(" + " ".join(str(round(float(coordinate), 1)) for coordinate in position) + ")"
+
+def _extract_prescription_point(plan):
+    # The structures that dose is prescribed to, i.e. the ROIs that the plan's target dose references refer to,
+    # or the POINT ROIs at the coordinates of the ones that give coordinates instead
+    if plan.structure_set is None:
+        return strings.NO_STRUCTURE_SET
 
+    names = []
+    for dose_reference in plan.dataset.get("DoseReferenceSequence") or []:
+        if dose_reference.get("DoseReferenceType") != "TARGET":
+            continue
+        if "ReferencedROINumber" in dose_reference:
+            name = plan.structure_set.roi_names.get(int(dose_reference.ReferencedROINumber))
+        elif "DoseReferencePointCoordinates" in dose_reference:
+            name = _point_name(plan, dose_reference.DoseReferencePointCoordinates)
+        else:
+            # e.g. a SITE that isn't linked to a structure
+            continue
+        if name is not None and name not in names:
+            names.append(name)
+    return ','.join(names) if names else strings.Not_Extracted
+
+def _extract_isocenter_point(plan):
+    # The POINT ROI at the isocentre of each beam (setup beams are ignored), listing each point once
+    if plan.structure_set is None:
+        return strings.NO_STRUCTURE_SET
+
+    names = []
+    for control_point in plan.first_control_points:
+        name = _point_name(plan, control_point.IsocenterPosition)
+        if name not in names:
+            names.append(name)
+    return ','.join(names)
+
+def _extract_override(plan):
+    # The ROIs whose (relative electron) density has been overridden
+    if plan.structure_set is None:
+        return strings.NO_STRUCTURE_SET
+    return ','.join(plan.structure_set.overrides) or strings.no_override
+
+def _extract_meas(plan):
+    # The dose (in Gy) at each POINT ROI, e.g. "5_RLAT:1.023,8_RLAT:0.998", interpolated from the plan's dose grid.
+    # The doses at every point of the structure set are looked up together, and shared by the plans with the same dose
+    if plan.structure_set is None:
+        return strings.NO_STRUCTURE_SET
+    if plan.dose_grid is None:
+        return strings.NO_DOSE
+
+    point_doses = plan.dose_grid.point_doses(plan.structure_set)
+    return ','.join(name + ":" + (strings.OUTSIDE_DOSE_GRID if math.isnan(dose) else f"{dose:.3f}") for name, dose in point_doses.items())
+
+def _extract_collimator(plan):
     # Record collimator value in the parameter_values dictionary as a string to be consistant with truth_table format 
     # According to the truth table the collimator only needs to be recorded for cases 1&5 where only 1 beam occurs    
-    collimator_value = beams[len(beams)-1].ControlPointSequence[0].BeamLimitingDeviceAngle
+    collimator_value = plan.first_control_points[-1].BeamLimitingDeviceAngle
     return str(int(collimator_value))
 
-def _extract_gantry(dataset, struct_dose_files, case):
+def _extract_gantry(plan):
     try:
-        file_type = _extract_mode(dataset, struct_dose_files, case)
         #If the dataset is a VMAT file it goes through each of the control point sequence and finds each associated gantry angle and returns the lowest value slash the highest value
-        if file_type == strings.VMAT:
-            i = 0
-            vmat_gantry_angles = []
-            while i < len(dataset.BeamSequence):
-                if dataset.BeamSequence[i].BeamDescription != strings.SETUP_beam:
-                    for control_point in dataset.BeamSequence[i].ControlPointSequence:
-                        vmat_gantry_angles.append(float(control_point.GantryAngle))
-                    return vmat_gantry_angles
-                i+=1
-            return "error retrieving gantry"
+        if plan.mode == strings.VMAT:
+            if not plan.beams:
+                return "error retrieving gantry"
+            return plan.arc_gantry_angles.tolist()
         # If not, then return the Gantry Angle of all beams, separated by commas
         else:
-            #ignore setup beams
-            beams = list(filter(lambda beam: beam.BeamDescription != strings.SETUP_beam, dataset.BeamSequence))
-            #obtain the gantry angles of all beams
-            gantry_instances = map(lambda beam: str(int(beam.ControlPointSequence[0].GantryAngle)), beams)
+            #obtain the gantry angles of all beams (setup beams are ignored)
+            gantry_instances = map(lambda control_point: str(int(control_point.GantryAngle)), plan.first_control_points)
 
             return ','.join(gantry_instances)
     except:
         return strings.ANY_VALUE
 
-def _extract_ssd(dataset, struct_dose_files, case):
+def _extract_ssd(plan):
     #find SSD in centimeters
-    file_type = _extract_mode(dataset, struct_dose_files, case)
+    file_type = plan.mode
 
-    ssd_list = []
     try:
         if file_type == strings.VMAT:
-            vmat_ssd_list = []
-            for i in range(len(dataset.BeamSequence)):
-                if dataset.BeamSequence[i].BeamDescription != strings.SETUP_beam:
-                    for control_point in dataset.BeamSequence[i].ControlPointSequence:
-                        vmat_ssd_list.append(round(float(control_point.ReferencedDoseReferenceSequence[1].BeamDosePointSSD)/10,2))
-                    return vmat_ssd_list
-            return "error retrieving SSD"
+            if not plan.beams:
+                return "error retrieving SSD"
+            return plan.arc_ssds.tolist()
         else:
-            beams = list(filter(lambda beam: beam.BeamDescription != strings.SETUP_beam, dataset.BeamSequence))
             #obtain the ssd of all beams
             #in the DICOM file the SSD is given in millimetres so its divided by 10 so its in centimetres
-            ssd_list = list(map(lambda beam: round(beam.ControlPointSequence[0].SourceToSurfaceDistance / 10, 2), beams))
+            ssd_list = list(map(lambda control_point: round(control_point.SourceToSurfaceDistance / 10, 2), plan.first_control_points))
             return ssd_list
     except:
         return "error retrieving SSD"
 
-def _extract_wedge(dataset, struct_dose_files, case):
+def _extract_wedge(plan):
     # It may need more work to deal with VMAT files for cases 6,7,8
 
-    #ignore setup beams
-    beams = list(filter(lambda beam: beam.BeamDescription != strings.SETUP_beam, dataset.BeamSequence))
     # if there are wedges, get the wedge angle of the beam. Otherwise, get 0
-    wedge_angles = list(map(lambda beam: str(int(beam.WedgeSequence[0].WedgeAngle)) if int(beam.NumberOfWedges) > 0 else strings.no_wedge, beams))
+    wedge_angles = list(map(lambda beam: str(int(beam.WedgeSequence[0].WedgeAngle)) if int(beam.NumberOfWedges) > 0 else strings.no_wedge, plan.beams))
 
     return ','.join(wedge_angles)
 
-def _extract_energy(dataset, struct_dose_files, case):
+def _extract_energy(plan):
     energy = ''
 
-    for beam in dataset.BeamSequence:
-        if beam.BeamDescription == strings.SETUP_beam:
-            continue
-
-        energy = str(int(beam.ControlPointSequence[0].NominalBeamEnergy))
+    for beam, control_point in zip(plan.beams, plan.first_control_points):
+        energy = str(int(control_point.NominalBeamEnergy))
         if beam.PrimaryFluenceModeSequence[0].FluenceMode != strings.STANDARD_FLUENCE:
             energy += str(beam.PrimaryFluenceModeSequence[0].FluenceModeID)
     return energy
 
-def _extract_field_size(dataset, struct_dose_files, case):
-    beams = list(filter(lambda beam: beam.BeamDescription != strings.SETUP_beam, dataset.BeamSequence))
-    # record collimator value in the parameter_values dictionary as a string to be consistant with truth_table format
-    # According to the truth table the collimator only needs to be recorded for cases 1&5 where only 1 beam occurs
-
-    field_size_list=[]
-
-    for beam in beams:
-        beam_type_number = len(beam.ControlPointSequence[0].BeamLimitingDevicePositionSequence)
-
-        length_x = 0
-        length_y = 0
-
-        for i in range(beam_type_number):
-            device_type = beam.ControlPointSequence[0].BeamLimitingDevicePositionSequence[
-                i].RTBeamLimitingDeviceType
-            jaw_position = beam.ControlPointSequence[0].BeamLimitingDevicePositionSequence[
-                i].LeafJawPositions
-
-            if device_type != "MLCX" and device_type != "MLCY":
-
-                if device_type == "X":
-                    length_x = int((-jaw_position[0] + jaw_position[1]) / 10)
-                elif device_type == "Y":
-                    length_y = int((-jaw_position[0] + jaw_position[1]) / 10)
-                elif device_type == "ASYMX":
-                    length_x = int((-jaw_position[0] + jaw_position[1]) / 10)
-                elif device_type == "ASYMY":
-                    length_y = int((-jaw_position[0] + jaw_position[1]) / 10)
-                if length_x != 0 and length_y != 0:
-
-                    field_size_list.append(str(length_y) + "x" + str(length_x))
-            else:
-                if length_x==0 or length_y==0:
-                    field_size_list.append(strings.Not_Extracted)
-
-    return ','.join(field_size_list)
+def _extract_field_size(plan):
+    # The (Y x X) size in cm of the field at the first control point of each beam (setup beams are ignored),
+    # i.e. of the opening left by the jaws and, if the beam has one, the MLC
+    sizes = _field_sizes(plan.beams, plan.first_control_points)
+    return ','.join(strings.Not_Extracted if np.isnan(size).any() else _centimetres(size[0]) + "x" + _centimetres(size[1]) for size in sizes)
+
+def _centimetres(millimetres):
+    # e.g. 100 -> "10" and 15 -> "1.5"
+    return f"{round(millimetres / 10, 1):g}"
+
+def _field_sizes(beams, control_points):
+    # The (Y, X) size in mm of the field at each control point (of the corresponding beam), or NaN where it isn't limited.
+    # Control points of beams with the same MLC are worked out together (see _aperture_sizes)
+    sizes = np.full((len(control_points), 2), np.nan)
+    groups = {}
+    for index, (beam, control_point) in enumerate(zip(beams, control_points)):
+        devices = dict((device.RTBeamLimitingDeviceType, device) for device in beam.get("BeamLimitingDeviceSequence") or [])
+        mlc_type = next((device_type for device_type in MLC_TYPES if device_type in devices), None)
+        boundaries = tuple(float(boundary) for boundary in devices[mlc_type].LeafPositionBoundaries) if mlc_type else ()
+        groups.setdefault((mlc_type, boundaries), []).append(index)
+
+    for (mlc_type, boundaries), indices in groups.items():
+        jaws = np.tile([-np.inf, np.inf, -np.inf, np.inf], (len(indices), 1))
+        leaves = np.zeros((len(indices), 2 * max(len(boundaries) - 1, 0)))
+        for row, index in enumerate(indices):
+            for device in control_points[index].BeamLimitingDevicePositionSequence:
+                positions = np.asarray(device.LeafJawPositions, dtype=float)
+                if device.RTBeamLimitingDeviceType in X_JAW_TYPES:
+                    jaws[row, :2] = positions
+                elif device.RTBeamLimitingDeviceType in Y_JAW_TYPES:
+                    jaws[row, 2:] = positions
+                elif device.RTBeamLimitingDeviceType == mlc_type and len(positions) == leaves.shape[1]:
+                    leaves[row] = positions
+        sizes[indices] = _aperture_sizes(jaws, leaves if mlc_type else None, np.array(boundaries), mlc_type == "MLCY")
+    return sizes
+
+def _aperture_sizes(jaws, leaves, boundaries, mlc_y=False):
+    # The (Y, X) size in mm of the opening at each of N control points, all at once
+    #   jaws        - (N, 4) array of the X1, X2, Y1, Y2 jaw positions (infinite where there's no jaw)
+    #   leaves      - None, or (N, 2 * pairs) array of the MLC's LeafJawPositions: every leaf of one bank, then every leaf of the other
+    #   boundaries  - the (pairs + 1) LeafPositionBoundaries of the MLC, across the direction the leaves move in
+    #   mlc_y       - whether the leaves move along Y (MLCY) rather than X (MLCX)
+    x_size, y_size = jaws[:, 1] - jaws[:, 0], jaws[:, 3] - jaws[:, 2]
+    if leaves is None or not leaves.size:
+        sizes = np.stack([y_size, x_size], axis=1)
+    else:
+        # The jaws along the direction the leaves move in, and across it
+        along, across = (jaws[:, 2:], jaws[:, :2]) if mlc_y else (jaws[:, :2], jaws[:, 2:])
+        pairs = leaves.shape[1] // 2
+        # The part of each leaf pair's opening that the jaws don't cover, and the part of its width between the jaws
+        low = np.maximum(leaves[:, :pairs], along[:, :1])
+        high = np.minimum(leaves[:, pairs:], along[:, 1:])
+        edge_low = np.maximum(boundaries[:-1], across[:, :1])
+        edge_high = np.minimum(boundaries[1:], across[:, 1:])
+        is_open = (high - low > MLC_CLOSED_GAP) & (edge_high > edge_low)
+
+        any_open = is_open.any(axis=1)
+        along_size = np.where(is_open, high, -np.inf).max(axis=1) - np.where(is_open, low, np.inf).min(axis=1)
+        across_size = np.where(is_open, edge_high, -np.inf).max(axis=1) - np.where(is_open, edge_low, np.inf).min(axis=1)
+        along_size, across_size = np.where(any_open, along_size, 0), np.where(any_open, across_size, 0)
+        sizes = np.stack([along_size, across_size] if mlc_y else [across_size, along_size], axis=1)
+    # Sides that nothing limits have no size
+    return np.where(np.isinf(sizes), np.nan, sizes)
 
 #just a placeholder function to indicate which parameter extractions have not been implemented
-def to_be_implemented(dataset, struct_dose_files, case):
+def to_be_implemented(plan):
     return strings.NOT_IMPLEMENTED
 
 extractor_functions = {
     strings.mode                    : _extract_mode,
     strings.prescription_dose       : _extract_prescription_dose,
-    strings.prescription_point      : to_be_implemented,
-    strings.isocenter_point         : to_be_implemented,
-    strings.override                : to_be_implemented,
+    strings.prescription_point      : _extract_prescription_point,
+    strings.isocenter_point         : _extract_isocenter_point,
+    strings.override                : _extract_override,
     strings.collimator              : _extract_collimator,
     strings.gantry                  : _extract_gantry,
     strings.SSD                     : _extract_ssd,
     strings.couch                   : to_be_implemented,
     strings.field_size              : _extract_field_size,
     strings.wedge                   : _extract_wedge,
-    strings.meas                    : to_be_implemented,
+    strings.meas                    : _extract_meas,
     strings.energy                  : _extract_energy,
 }
+
+# The DICOM tags that each extraction function reads, including those read through the PlanContext.
+# Tags inside sequences are given as paths of keywords, e.g. "BeamSequence.ControlPointSequence.GantryAngle", and a sequence
+# without a path below it is read in full. Only these tags are read from a plan (see parameter_retrieval.required_tags),
+# so a new extraction function must list every tag it uses
+extractor_tags = {
+    strings.mode                    : MODE_TAGS,
+    strings.prescription_dose       : ["DoseReferenceSequence.TargetPrescriptionDose", "FractionGroupSequence.NumberOfFractionsPlanned",
+                                       "BeamSequence.PrimaryDosimeterUnit"],
+    strings.prescription_point      : STRUCTURE_SET_TAGS + ["DoseReferenceSequence.DoseReferenceType", "DoseReferenceSequence.ReferencedROINumber",
+                                                            "DoseReferenceSequence.DoseReferencePointCoordinates"],
+    strings.isocenter_point         : STRUCTURE_SET_TAGS + BEAMS_TAGS + ["BeamSequence.ControlPointSequence.IsocenterPosition"],
+    strings.override                : STRUCTURE_SET_TAGS,
+    strings.collimator              : BEAMS_TAGS + ["BeamSequence.ControlPointSequence.BeamLimitingDeviceAngle"],
+    strings.gantry                  : MODE_TAGS + ARC_GANTRY_TAGS,
+    strings.SSD                     : MODE_TAGS + ARC_SSD_TAGS + ["BeamSequence.ControlPointSequence.SourceToSurfaceDistance"],
+    strings.couch                   : [],
+    strings.field_size              : BEAMS_TAGS + ["BeamSequence.ControlPointSequence.BeamLimitingDevicePositionSequence",
+                                                    "BeamSequence.BeamLimitingDeviceSequence.RTBeamLimitingDeviceType",
+                                                    "BeamSequence.BeamLimitingDeviceSequence.LeafPositionBoundaries"],
+    strings.wedge                   : BEAMS_TAGS + ["BeamSequence.NumberOfWedges", "BeamSequence.WedgeSequence.WedgeAngle"],
+    strings.meas                    : STRUCTURE_SET_TAGS + DOSE_GRID_TAGS,
+    strings.energy                  : BEAMS_TAGS + ["BeamSequence.ControlPointSequence.NominalBeamEnergy", "BeamSequence.PrimaryFluenceModeSequence"],
+}
+
+# The other parameters whose values each parameter's extraction or evaluation uses. Whenever a parameter is extracted, these are
+# extracted (first) too. Intermediate results that several extractors share, such as the plan's mode and beams, are worked out
+# once by the PlanContext rather than being parameters of their own. Every evaluation is given the plan's mode (as file_type),
+# so mode is always extracted (see parameter_retrieval.extraction_order)
+extractor_requires = {
+    strings.gantry                  : [strings.mode],
+    strings.SSD                     : [strings.mode, strings.gantry],
+}
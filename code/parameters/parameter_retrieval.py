@@ -1,37 +1,102 @@
 '''This file applies the extraction and evaluation functions defined in extractor_functions.py and evaluator functions.py'''
 
 # We import the pydicom library to use it's DICOM reading methods
+import time
 import pydicom as dicom
 from code import strings
-from .extractor_functions import extractor_functions, _extract_mode
+from functools import lru_cache
+from .extractor_functions import extractor_functions, extractor_tags, extractor_requires
+from .plan_context import PlanContext
+from code.truth_table_reader import TruthTable
 from .evaluator_functions import evaluator_functions
 
-def extract_parameters(dataset, struct_dose_files, case):
-    # define a list of parameters that need to be found
-    parameters = [strings.mode, strings.prescription_dose, strings.prescription_point, strings.isocenter_point, strings.override, strings.collimator,
-                  strings.gantry, strings.SSD, strings.couch, strings.field_size, strings.wedge, strings.meas, strings.energy]
-    
+# Bump this whenever an extractor changes what it returns, so that cached extractions (see extraction_cache.py) are redone
+EXTRACTOR_VERSION = 5
+
+# The list of parameters that need to be found
+PARAMETERS = [strings.mode, strings.prescription_dose, strings.prescription_point, strings.isocenter_point, strings.override, strings.collimator,
+              strings.gantry, strings.SSD, strings.couch, strings.field_size, strings.wedge, strings.meas, strings.energy]
+
+# Every evaluation is given the plan's mode, so it's always extracted
+ALWAYS_EXTRACTED = [strings.mode]
+
+def required_tags(parameters=PARAMETERS):
+    ''' The DICOM tags (as keyword paths, see dicom_reader.tag_tree) that extracting parameters reads, i.e. all that has to be read from a plan'''
+    tags = []
+    for parameter in parameters:
+        tags += [tag for tag in extractor_tags[parameter] if tag not in tags]
+    return tags
+
+@lru_cache(maxsize=None)
+def _extraction_order(parameters):
+    order = []
+    def visit(parameter):
+        if parameter not in order:
+            for required in extractor_requires.get(parameter, []):
+                visit(required)
+            order.append(parameter)
+    for parameter in ALWAYS_EXTRACTED + [parameter for parameter in PARAMETERS if parameter in parameters]:
+        visit(parameter)
+    return tuple(order)
+
+def extraction_order(parameters=PARAMETERS):
+    ''' parameters and every parameter they require (see extractor_functions.extractor_requires), each after those it requires'''
+    return list(_extraction_order(frozenset(parameters)))
+
+def parameters_to_extract(rules, parameters=None, skip_unchecked=True):
+    ''' The parameters that checking a plan against rules (the {parameter: Rule} dictionary of its case) needs extracted, in the order
+    they're extracted
+
+    parameters          - the parameters to check, or None for all of them
+    skip_unchecked      - whether to leave out the parameters whose rule accepts any value (strings.ANY_VALUE), unless others require them
+    '''
+    parameters = PARAMETERS if parameters is None else parameters
+    if skip_unchecked:
+        parameters = [parameter for parameter in parameters if parameter not in rules or not rules[parameter].any]
+    return extraction_order(parameters)
+
+def extract_parameters(dataset, struct_dose_files, case, timings=None, parameters=PARAMETERS):
+    ''' Run the extraction function of each parameter on dataset
+
+    timings             - if a dictionary is given, the time (in seconds) each extraction function took is added to it
+    parameters          - the parameters to extract. Those they require are extracted too (see extraction_order)
+    '''
+    # Everything the extraction functions share about this plan is worked out (once) by the PlanContext
+    plan = PlanContext(dataset, struct_dose_files, case)
+
     #run the extraction functions for each parameter and store the values in parameter_values dictionary
     parameter_values = {}
-    for parameter in parameters:
-        parameter_values[parameter] = extractor_functions[parameter](dataset, struct_dose_files, case)
+    for parameter in extraction_order(parameters):
+        start = time.perf_counter()
+        parameter_values[parameter] = extractor_functions[parameter](plan)
+        if timings is not None:
+            timings[parameter] = time.perf_counter() - start
 
     return parameter_values
 
-def evaluate_parameters(parameter_values, truth_table, case):
+def evaluate_parameters(parameter_values, truth_table, case, timings=None):
+    ''' Evaluate each extracted parameter against the truth table values of case
+
+    timings             - if a dictionary is given, the time (in seconds) each evaluation function took is added to it
+    '''
     case = int(case)
     # Initialise a dictionary where every key is a parameter and every associated value will either be strings.PASS,strings.FAIL or if that can't be determined the truth table value associated with that case will be added
     pass_fail_values = {}
-    
+
+    # The truth table is normally compiled once when it's read, but a plain dictionary of columns is accepted too
+    if not isinstance(truth_table, TruthTable):
+        truth_table = TruthTable(truth_table)
+
     # Check if the case number is valid
-    cases = len(truth_table["case"])
-    if case not in range(1, 18):
+    cases = truth_table.cases
+    if case not in range(1, cases + 1):
         raise Exception(f"Invalid case number! Must be between 1 and {cases}")
 
     # Grouped information that will be passed onto evaluation functions
+    rules = truth_table.case_rules(case)
     context = {
         "parameter_values": parameter_values,
-        "truth_table": truth_table,
+        "rules": rules,
         "case": case,
         "file_type": parameter_values[strings.mode]
     }
@@ -42,11 +107,13 @@ def evaluate_parameters(parameter_values, truth_table, case):
         # In these instances we simply return the message to indicate it has not been implemented
         if parameter_values[param] == strings.NOT_IMPLEMENTED or parameter_values[param] is False:
             pass_fail_values[param] = strings.NOT_IMPLEMENTED
+        elif parameter_values[param] == strings.NOT_CHECKED:
+            pass_fail_values[param] = strings.NOT_CHECKED
         else:
             param_value = parameter_values[param]
-            table_value = truth_table[param][case-1]
             # Call the appropriate evaluator function for each parameter
-            pass_fail_values[param] = evaluator_functions[param](param_value, table_value, **context)
+            start = time.perf_counter()
+            pass_fail_values[param] = evaluator_functions[param](param_value, rules[param], **context)
+            if timings is not None:
+                timings[param] = time.perf_counter() - start
     return pass_fail_values
- 
-        
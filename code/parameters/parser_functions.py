@@ -0,0 +1,120 @@
+''' A collection of functions that parse (and validate) the values of the truth table into rules
+
+Each function is supplied with the raw string from the truth table (corresponding to a case and parameter)
+and returns a Rule, which is what the evaluation functions compare extracted values against:
+
+raw         - the value exactly as written in the truth table
+any         - whether the value is strings.ANY_VALUE, i.e. any extracted value is acceptable
+items       - the value parsed into a tuple, e.g. numbers for a comma separated list of angles. Wildcards
+                (such as "?" in "?,89,93,89,?") are parsed as None
+negated     - whether the value is prefixed with "*", meaning anything BUT the value is acceptable
+error       - None, or a message describing why the value isn't in a format that its parameter accepts
+
+Because the truth table is parsed once when it's loaded, format errors are found up front rather than
+every time a plan is evaluated.
+'''
+
+import re
+from collections import namedtuple
+from code import strings
+
+Rule = namedtuple("Rule", ["raw", "any", "items", "negated", "error"])
+
+FIELD_SIZE_FORMAT = re.compile(r"^\d+(\.\d+)?x\d+(\.\d+)?$")
+
+def _rule(raw, items=(), negated=False, error=None):
+    return Rule(raw, raw == strings.ANY_VALUE, tuple(items), negated, error)
+
+def _parse_list(raw, wildcards=(), words=()):
+    ''' Parse a comma separated list of whole numbers, which may also contain the given wildcards and words'''
+    items = []
+    for value in raw.split(","):
+        if value.isdigit():
+            items.append(int(value))
+        elif value in wildcards or value == strings.ANY_VALUE:
+            items.append(None)
+        elif value in words:
+            items.append(value)
+        else:
+            expected = " or ".join(["a number"] + list(words))
+            return _rule(raw, error=f"'{value}' is not {expected}")
+    return _rule(raw, items)
+
+def _parse_gantry(raw):
+    return _parse_list(raw)
+
+def _parse_ssd(raw):
+    return _parse_list(raw, wildcards=[strings.ANY_SSD])
+
+def _parse_wedge(raw):
+    return _parse_list(raw, words=[strings.no_wedge])
+
+def _parse_collimator(raw):
+    ''' A collimator angle, or "*" followed by an angle that the collimator must NOT be at'''
+    for value in raw.split(","):
+        if not value.isdigit() and value != strings.ANY_VALUE:
+            if not value.startswith("*") or len(value)<2 or not value[1:].isdigit():
+                return _rule(raw, error=f"'{value}' is not an angle or *angle")
+
+    negated = raw[0] == "*"
+    return _rule(raw, [raw[1:] if negated else raw], negated=negated)
+
+def _parse_prescription_dose(raw):
+    ''' DOSE/FRACTION/UNIT, where any item may be strings.ANY_VALUE'''
+    items = raw.split("/")
+    if len(items) != 3:
+        return _rule(raw, error="Expected the format DOSE/FRACTIONS/UNIT")
+    return _rule(raw, [None if item == strings.ANY_VALUE else item for item in items])
+
+def _parse_field_size(raw):
+    ''' A comma separated list of YxX field sizes (in cm), where "?" accepts any field size'''
+    if raw == strings.ANY_VALUE:
+        return _rule(raw)
+
+    items = []
+    for value in raw.split(","):
+        if value == "?":
+            items.append(None)
+        elif FIELD_SIZE_FORMAT.match(value):
+            items.append(value)
+        else:
+            return _rule(raw, error=f"'{value}' is not a field size like 10x12")
+    return _rule(raw, items)
+
+def _parse_alternatives(raw):
+    ''' One or more structure names separated by " or ", any of which is acceptable, e.g. "1 or 3"'''
+    return _rule(raw, [alternative.strip() for alternative in raw.split(strings.ALTERNATIVES)])
+
+def _parse_meas(raw):
+    ''' A comma separated list of measurement point names, each optionally in quotes (e.g. '5_RLAT'), where "-" is an unused slot'''
+    items = []
+    for value in raw.split(","):
+        value = value.strip().strip("'")
+        items.append(None if value == strings.ANY_VALUE else value)
+    return _rule(raw, items)
+
+def _parse_default(raw):
+    return _rule(raw, [raw])
+
+def parse_rule(parameter, raw):
+    ''' Parse the truth table value raw for parameter, which may be any column of the truth table'''
+    if not isinstance(raw, str) or raw == "":
+        # i.e. an empty cell
+        return Rule(raw, False, (), False, "Missing value")
+    return parser_functions.get(parameter, _parse_default)(raw)
+
+parser_functions = {
+    strings.mode                    : _parse_default,
+    strings.prescription_dose       : _parse_prescription_dose,
+    strings.prescription_point      : _parse_alternatives,
+    strings.isocenter_point         : _parse_alternatives,
+    strings.override                : _parse_alternatives,
+    strings.collimator              : _parse_collimator,
+    strings.gantry                  : _parse_gantry,
+    strings.SSD                     : _parse_ssd,
+    strings.couch                   : _parse_default,
+    strings.field_size              : _parse_field_size,
+    strings.wedge                   : _parse_wedge,
+    strings.meas                    : _parse_meas,
+    strings.energy                  : _parse_default,
+}
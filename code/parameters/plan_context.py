@@ -0,0 +1,123 @@
+''' The information about a single RTPLAN that is shared between the extraction functions
+
+Several extractors need the same things (the plan's mode, its treatment beams, their first control points...).
+A PlanContext works each of these out the first time it is asked for and remembers it, so a plan's sequences
+are only traversed once no matter how many extractors use them.
+'''
+
+import numpy as np
+from code import strings
+from code.study_files import load_structure_set, load_dose_grid
+
+# The DICOM tags (see dicom_reader.tag_tree) that each property of a PlanContext reads
+MODE_TAGS = ["BeamSequence.ControlPointSequence.GantryAngle"]
+BEAMS_TAGS = ["BeamSequence.BeamDescription"]
+ARC_GANTRY_TAGS = BEAMS_TAGS + ["BeamSequence.ControlPointSequence.GantryAngle"]
+ARC_SSD_TAGS = BEAMS_TAGS + ["BeamSequence.ControlPointSequence.ReferencedDoseReferenceSequence.BeamDosePointSSD"]
+STRUCTURE_SET_TAGS = ["StudyInstanceUID", "ReferencedStructureSetSequence.ReferencedSOPInstanceUID"]
+DOSE_GRID_TAGS = ["StudyInstanceUID", "SOPInstanceUID"]
+
+class _memoised:
+    ''' Decorator for a PlanContext property that is computed on first access and then stored on the instance'''
+    def __init__(self, function):
+        self.function = function
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.function(instance)
+        # The instance attribute now shadows this (non-data) descriptor, so function is never called again
+        instance.__dict__[self.function.__name__] = value
+        return value
+
+class PlanContext:
+    '''
+    dataset             - The full data from the RTPLAN being extracted
+    struct_dose_files   - A dictionary of StudyInstanceUID mapping to a list of RTDOSE and RTSTRUCT files in the same folder as the RTPLAN.
+                            May be empty if no RTDOSE or RTSTRUCT are found.
+                            Format should be {UID:[(filepath, modality), (filepath, modality)], ...}
+    case                - The case number of the RTPLAN being extracted
+    '''
+    def __init__(self, dataset, struct_dose_files, case):
+        self.dataset = dataset
+        self.struct_dose_files = struct_dose_files
+        self.case = case
+
+    @_memoised
+    def mode(self):
+        ''' IMRT vs VMAT (for cases 6, 7 and 8 only)'''
+        # For now, we are only producing IMRT vs VMAT modes for cases 6, 7, and 8
+        if self.case not in [6, 7, 8]:
+            return strings.NOT_IMPLEMENTED
+
+        beam = self.dataset.BeamSequence[0]
+        # Angles aren't truncated, since arcs with many control points move less than a degree between them
+        moving_gantry = float(beam.ControlPointSequence[0].GantryAngle) != float(beam.ControlPointSequence[1].GantryAngle)
+
+        # One beam will be the setup beam, which is not counted
+        number_of_beams = len(self.dataset.BeamSequence) - 1
+
+        # "If IMRT there should be 5 static gantry positions (5 beams) for each case, and the intensity of the
+        # beam is modulated by moving the multi leaf collimator (MLC) to different control points within each
+        # gantry angle. If VMAT the gantry and the MLCs all move at the same time so each control point has
+        # both gantry moves and MLC moves.""
+        if moving_gantry:
+            return strings.VMAT
+        elif number_of_beams == 5:
+            return strings.IMRT
+        else:
+            return "UNKNOWN"
+
+    @_memoised
+    def beams(self):
+        ''' All beams of the plan except the setup beams'''
+        return [beam for beam in self.dataset.BeamSequence if beam.BeamDescription != strings.SETUP_beam]
+
+    @_memoised
+    def first_control_points(self):
+        ''' The first control point of each (non setup) beam'''
+        return [beam.ControlPointSequence[0] for beam in self.beams]
+
+    @_memoised
+    def arc_control_points(self):
+        ''' Every control point of the first (non setup) beam, which for VMAT plans traces the arc'''
+        return list(self.beams[0].ControlPointSequence) if self.beams else []
+
+    @_memoised
+    def arc_gantry_angles(self):
+        ''' The gantry angle of each arc control point, as a NumPy array'''
+        return np.fromiter((float(control_point.GantryAngle) for control_point in self.arc_control_points),
+                           dtype=float, count=len(self.arc_control_points))
+
+    @_memoised
+    def arc_ssds(self):
+        ''' The SSD (in centimetres, to 2 decimal places) at each arc control point, as a NumPy array'''
+        # in the DICOM file the SSD is given in millimetres so its divided by 10 so its in centimetres
+        ssds = np.fromiter((float(control_point.ReferencedDoseReferenceSequence[1].BeamDosePointSSD) for control_point in self.arc_control_points),
+                           dtype=float, count=len(self.arc_control_points))
+        return np.round(ssds / 10, 2)
+
+    @_memoised
+    def study_files(self):
+        ''' The (location, modality) of each dose and structure set DICOM in the plan's study'''
+        return self.struct_dose_files.get(str(self.dataset.StudyInstanceUID), [])
+
+    @_memoised
+    def structure_set(self):
+        ''' The StructureSet (see study_files.py) that the plan refers to, or else the first in its study. None if its study has none'''
+        structure_sets = [load_structure_set(location) for location, modality in self.study_files if modality == strings.RTSTRUCT]
+        referenced_uids = [str(item.ReferencedSOPInstanceUID) for item in self.dataset.get("ReferencedStructureSetSequence") or []]
+        for structure_set in structure_sets:
+            if structure_set.sop_uid in referenced_uids:
+                return structure_set
+        return structure_sets[0] if structure_sets else None
+
+    @_memoised
+    def dose_grid(self):
+        ''' The DoseGrid (see study_files.py) of the whole plan, or else the first dose in its study. None if its study has none'''
+        dose_grids = [load_dose_grid(location) for location, modality in self.study_files if modality == strings.RTDOSE]
+        for dose_grid in dose_grids:
+            if str(self.dataset.SOPInstanceUID) in dose_grid.plan_uids and dose_grid.summation_type == "PLAN":
+                return dose_grid
+        return dose_grids[0] if dose_grids else None
@@ -0,0 +1,104 @@
+''' Module for overlapping the I/O of checking plans with the CPU work of checking them
+
+Checking a plan reads it from disk (often a network share), extracts and evaluates it, then writes its report.
+Done one plan at a time, the CPU sits idle while the next plan is fetched and the disk sits idle during extraction.
+
+pipeline runs these as stages connected by bounded queues, on an asyncio event loop in a thread of its own:
+
+fetch   - reads the next plans from disk in a pool of threads, up to `prefetch` plans ahead of the one being checked
+check   - extracts and evaluates each fetched plan in an executor (a single thread, or a pool of worker processes)
+deliver - hands each result, in order, to the caller, which writes its report while the next plans are fetched and checked
+
+Because every queue is bounded, a slow stage holds back the stages before it rather than letting fetched plans pile up in memory.
+'''
+
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Marks the end of the jobs and of the results
+_DONE = object()
+
+class _Failure:
+    ''' Carries an exception raised by the pipeline over to the thread consuming its results'''
+    def __init__(self, error):
+        self.error = error
+
+def pipeline(jobs, fetch, check, executor, prefetch, concurrency=1):
+    ''' Yield check(job, fetch(job)) for each job, in the same order as jobs, fetching ahead of the checks
+
+    jobs                - an iterable of jobs. It's advanced in a thread of its own, since generating a job may
+                            itself read from disk (e.g. app.find_jobs indexing the next folder)
+    fetch               - a function reading what a job needs from disk. It's run in prefetch threads
+    check               - a function of (job, what was fetched) doing the CPU work; what was fetched is the exception instead if fetch raised
+    executor            - the executor check is run in
+    prefetch            - how many jobs may be fetched ahead of those being checked
+    concurrency         - how many jobs may be checked at once, e.g. the number of workers of executor
+    '''
+    results = queue.Queue(maxsize=prefetch)
+    stopping = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(_run(iter(jobs), fetch, check, executor, prefetch, concurrency, results, stopping),),
+                              daemon=True)
+    thread.start()
+    try:
+        while True:
+            result = results.get()
+            if result is _DONE:
+                return
+            if isinstance(result, _Failure):
+                raise result.error
+            yield result
+    finally:
+        # If the caller stopped early, let the pipeline wind down (it may be waiting to deliver a result)
+        stopping.set()
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+async def _run(jobs, fetch, check, executor, prefetch, concurrency, results, stopping):
+    loop = asyncio.get_running_loop()
+    # (job, future of its fetch) and futures of checks, in the order of the jobs
+    fetched = asyncio.Queue(maxsize=prefetch)
+    checking = asyncio.Queue(maxsize=concurrency)
+
+    async def fetch_stage():
+        while not stopping.is_set():
+            job = await loop.run_in_executor(generator_thread, next, jobs, _DONE)
+            if job is _DONE:
+                break
+            await fetched.put((job, loop.run_in_executor(fetch_threads, fetch, job)))
+        await fetched.put(None)
+
+    async def check_stage():
+        while True:
+            item = await fetched.get()
+            if item is None:
+                break
+            job, fetching = item
+            try:
+                fetched_data = await fetching
+            except Exception as error:
+                fetched_data = error
+            await checking.put(loop.run_in_executor(executor, check, job, fetched_data))
+        await checking.put(None)
+
+    async def deliver_stage():
+        while True:
+            checked = await checking.get()
+            if checked is None:
+                break
+            result = await checked
+            if not stopping.is_set():
+                await loop.run_in_executor(deliver_thread, results.put, result)
+
+    with ThreadPoolExecutor(1) as generator_thread, ThreadPoolExecutor(prefetch) as fetch_threads, ThreadPoolExecutor(1) as deliver_thread:
+        try:
+            await asyncio.gather(fetch_stage(), check_stage(), deliver_stage())
+            outcome = _DONE
+        except Exception as error:
+            outcome = _Failure(error)
+        if not stopping.is_set():
+            await loop.run_in_executor(deliver_thread, results.put, outcome)
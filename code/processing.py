@@ -0,0 +1,300 @@
+''' Module for checking RTPLAN DICOMs, either one at a time or fanned out across a pool of worker processes
+
+A "job" is a (location, case_number, folder) tuple, where folder is the key of the dose/structure index
+(see app.dose_struct_references) that applies to the DICOM at location.
+'''
+
+import time
+from functools import partial, lru_cache
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from code import strings
+from .dicom_reader import read_dataset, read_bytes
+from .pipeline import pipeline
+from .extraction_cache import ExtractionCache
+from .case_detection import case_from_filename, case_from_dataset, DETECTION_TAGS
+from .profiling import start_cprofile
+from .parameters.parameter_retrieval import extract_parameters, evaluate_parameters, required_tags, extraction_order, parameters_to_extract, PARAMETERS
+
+class CaseNotFound(Exception):
+    ''' Raised when a plan's case number wasn't given and couldn't be detected'''
+
+class NotDicom(Exception):
+    ''' Raised when a file being checked isn't a DICOM at all (e.g. some other kind of file, or an upload that isn't a plan)'''
+
+# Only the tags used to extract parameters (or detect the case) are read from plans
+PLAN_TAGS = required_tags() + [tag for tag in DETECTION_TAGS if tag not in required_tags()]
+
+@lru_cache(maxsize=None)
+def plan_tags(parameters=None):
+    ''' The tags read from plans when only a tuple of parameters (and those they require) is checked, or PLAN_TAGS for all of them'''
+    if parameters is None:
+        return PLAN_TAGS
+    tags = required_tags(extraction_order(parameters))
+    return tags + [tag for tag in DETECTION_TAGS if tag not in tags]
+
+def check_dicom(location, case_number, truth_table, dose_struct_index={}, interactive=True, cache=None, profile=False, memory_map=False,
+                data=None, selected_parameters=None, skip_unchecked=True):
+    ''' Extract and evaluate a single DICOM RTPLAN
+
+    location            - the filepath of the DICOM
+    case_number         - the case number of the truth table that parameters should be evaluated against (see data/truth_table_lvl3.csv)
+    truth_table         - the TruthTable of correct values for each case
+    dose_struct_index   - a dictionary mapping StudyInstanceUID to (location, modality) pairs of dose and structure set DICOMs
+    interactive         - whether the user may be prompted for a missing case number. If not, the case is detected from the
+                            plan (see case_detection.py), and CaseNotFound is raised if that isn't possible
+    cache               - an ExtractionCache to reuse the parameters extracted by earlier runs, if any
+    profile             - whether to also time each extraction and evaluation function
+    memory_map          - whether to read the DICOM through a memory map (see dicom_reader.py)
+    data                - the bytes of the DICOM if they've already been read (see dicom_reader.read_bytes), or None to read it from location
+    selected_parameters - a tuple of the parameters to check, or None to check all of them. Only these (and the parameters
+                            they require) are read and extracted, and only these are reported
+    skip_unchecked      - whether to skip extracting the parameters whose truth table value for the case accepts any value. They're
+                            reported as strings.NOT_CHECKED
+
+    Returns a (parameters, evaluations, solutions, details) tuple, or None if the DICOM is not an RTPLAN. NotDicom is raised if
+    the file isn't a DICOM at all.
+    details is a dictionary of the case number the plan was checked against (and where the case number came from), the plan's
+    SOPInstanceUID, the name of the truth table, whether its parameters came from the cache, and how long (in seconds) each stage of checking it took.
+    When profiling, details also has the time each extraction and evaluation function took
+    '''
+    timings = {}
+    extractor_timings = {} if profile else None
+    evaluator_timings = {} if profile else None
+    case_source = "given" if isinstance(case_number, int) else None
+    if case_source is None and not interactive:
+        case_number = case_from_filename(location, truth_table.cases)
+        case_source = "filename" if case_number is not None else None
+
+    parameters = plan_uid = None
+    if cache is not None and isinstance(case_number, int):
+        start = time.perf_counter()
+        needed = _needed_parameters(truth_table, case_number, selected_parameters, skip_unchecked)
+        parameters, plan_uid = cache.lookup(location, case_number, dose_struct_index, needed) or (None, None)
+        timings["cache"] = time.perf_counter() - start
+    cached = parameters is not None
+
+    if parameters is None:
+        start = time.perf_counter()
+        dataset = read_dataset(location, plan_tags(selected_parameters), memory_map, data)
+        timings["read"] = time.perf_counter() - start
+
+        # Anything can be read as a DICOM, so one without a Modality is some other kind of file
+        if "Modality" not in dataset:
+            raise NotDicom("Not a DICOM RTPLAN: it has no Modality")
+        # If the dicom is not an RTPLAN, we don't want to process it.
+        if str(dataset.Modality) != strings.RTPLAN:
+            return None
+        plan_uid = str(dataset.get("SOPInstanceUID", "")) or None
+
+        # Detect the case number if not specified, or prompt for it if running interactively
+        cases = truth_table.cases
+        if not isinstance(case_number, int) and not interactive:
+            case_number, case_source = case_from_dataset(dataset, truth_table)
+            if case_number is None:
+                raise CaseNotFound("The case could not be detected from the file name, plan label or beam signature")
+        while not isinstance(case_number, int):
+            try:
+                case_number = int(input(f"What is the case number for {location}?"))
+                case_source = "user"
+            except ValueError:
+                print(f"Case must be an integer between 1 and {cases}!")
+
+        # Look for any related dose files or structure sets
+        struct_dose_files = {}
+        if dataset.StudyInstanceUID in dose_struct_index:
+            struct_dose_files[dataset.StudyInstanceUID] = dose_struct_index[dataset.StudyInstanceUID]
+
+        # Extract the parameters the case needs, keeping the result for next time
+        start = time.perf_counter()
+        needed = _needed_parameters(truth_table, case_number, selected_parameters, skip_unchecked)
+        parameters = extract_parameters(dataset, struct_dose_files, case_number, extractor_timings, needed)
+        timings["extract"] = time.perf_counter() - start
+        if cache is not None:
+            cache.store(location, case_number, str(dataset.StudyInstanceUID), plan_uid, dose_struct_index, parameters)
+
+    # The parameters that were skipped are still reported, in the usual order
+    parameters = dict((parameter, parameters[parameter] if parameter in needed else strings.NOT_CHECKED) for parameter in PARAMETERS
+                      if parameter in needed or selected_parameters is None or parameter in selected_parameters)
+
+    # Evaluate the DICOM
+    start = time.perf_counter()
+    evaluations = evaluate_parameters(parameters, truth_table, case_number, evaluator_timings)
+    solutions = truth_table.solutions(case_number)
+    timings["evaluate"] = time.perf_counter() - start
+
+    details = {"case": case_number, "case_source": case_source, "plan_uid": plan_uid, "truth_table": truth_table.name,
+               "cached": cached, "timings": timings}
+    if profile:
+        # Cached plans weren't extracted, so they have no extraction timings
+        if extractor_timings:
+            details["extractor_timings"] = extractor_timings
+        details["evaluator_timings"] = evaluator_timings
+    return parameters, evaluations, solutions, details
+
+def _needed_parameters(truth_table, case_number, selected_parameters, skip_unchecked):
+    ''' The parameters to extract from a plan of case_number (see parameter_retrieval.parameters_to_extract)'''
+    # An invalid case is reported when the plan's evaluated, so nothing is skipped for it here
+    rules = truth_table.case_rules(case_number) if 1 <= case_number <= truth_table.cases else {}
+    return parameters_to_extract(rules, selected_parameters, skip_unchecked)
+
+def evaluate_result(result, truth_table, profile=False):
+    ''' The result of check_dicom for a plan, evaluated against another truth_table (with the same case number) from the
+    parameters that were already extracted, rather than checking the plan again'''
+    parameters, _, _, details = result
+    evaluator_timings = {} if profile else None
+    start = time.perf_counter()
+    evaluations = evaluate_parameters(parameters, truth_table, details["case"], evaluator_timings)
+    solutions = truth_table.solutions(details["case"])
+    details = dict(details, truth_table=truth_table.name, timings=dict(details["timings"], evaluate=time.perf_counter() - start))
+    if profile:
+        details["evaluator_timings"] = evaluator_timings
+    return parameters, evaluations, solutions, details
+
+def run_checks(jobs, truth_table, dose_struct_indices, workers=1, cache_file=None, interactive=True, profile=False, cprofile_folder=None,
+               memory_map=False, prefetch=0, selected_parameters=None, skip_unchecked=True):
+    ''' Check every job, yielding (location, result, error) tuples in the same order as jobs
+
+    jobs                - a list of (location, case_number, folder) tuples, or a generator of them (e.g. one that is
+                            still discovering plans; each job is checked as soon as it's generated)
+    truth_table         - the TruthTable of correct values for each case
+    dose_struct_indices - a dictionary mapping each folder to its dose_struct_index. It needs to include a job's folder by
+                            the time the job is generated
+    workers             - the number of worker processes; 1 checks everything in this process
+    cache_file          - the location of the extraction cache database, or None to always extract
+    interactive         - whether the user may be prompted for missing case numbers (only possible with a single worker)
+    profile             - whether to time each extraction and evaluation function (see check_dicom)
+    cprofile_folder     - a folder to save the cProfile stats of each process that checks plans in, or None to not run cProfile
+    memory_map          - whether to read DICOMs through a memory map
+    prefetch            - how many plans to read from disk ahead of the ones being checked (see pipeline.py), or 0 to read each
+                            plan as it's checked. Prefetching never prompts the user, and plans are read whole rather than memory mapped
+    selected_parameters, skip_unchecked - which parameters are extracted from each plan (see check_dicom)
+
+    result is whatever check_dicom returned and error is None, unless checking raised, in which case
+    result is None and error describes what went wrong. If the case of a plan couldn't be detected, or it isn't a
+    DICOM, error is the CaseNotFound or NotDicom exception.
+    '''
+    if prefetch > 0:
+        yield from _run_pipeline(jobs, truth_table, dose_struct_indices, workers, cache_file, profile, cprofile_folder, prefetch,
+                                 selected_parameters, skip_unchecked)
+        return
+
+    if workers <= 1:
+        _init_worker(truth_table, dose_struct_indices, interactive, cache_file, profile, cprofile_folder, memory_map,
+                     selected_parameters, skip_unchecked)
+        try:
+            for job in jobs:
+                yield _check_job(job)
+        finally:
+            _close_cache()
+        return
+
+    # The truth table is sent once to each worker. Jobs are sent a chunk at a time as they're generated, keeping a few chunks
+    # per worker queued up, along with the dose/structure indices of their folders (folders may be found after the workers start).
+    # Results are yielded in the order the jobs were generated, so the reports come out deterministically
+    chunksize = max(1, len(jobs) // (workers * 4)) if isinstance(jobs, list) else 1
+    jobs = iter(jobs)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(truth_table, {}, False, cache_file, profile, cprofile_folder, memory_map,
+                                       selected_parameters, skip_unchecked)) as executor:
+        queued = deque()
+        while True:
+            while len(queued) < workers * 4:
+                chunk = list(islice(jobs, chunksize))
+                if not chunk:
+                    break
+                folders = set(folder for _, _, folder in chunk)
+                queued.append(executor.submit(_check_jobs, chunk, dict((folder, dose_struct_indices.get(folder, {})) for folder in folders)))
+            if not queued:
+                break
+            yield from queued.popleft().result()
+
+def start_workers(truth_table, workers=1, cache_file=None, profile=False, cprofile_folder=None, memory_map=False,
+                  selected_parameters=None, skip_unchecked=True):
+    ''' An executor whose workers are ready to check plans against truth_table (see check_job), and stay ready for as long as it's running:
+    a thread of this process for a single worker, otherwise a pool of worker processes. Stop it with stop_workers'''
+    initargs = (truth_table, {}, False, cache_file, profile, cprofile_folder, memory_map, selected_parameters, skip_unchecked)
+    if workers <= 1:
+        # A thread rather than this process, so that whatever is handing out the plans isn't held up while they're checked
+        return ThreadPoolExecutor(1, initializer=_init_worker, initargs=initargs)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs)
+
+def check_job(executor, job, dose_struct_index={}, data=None, cache=True):
+    ''' Check a job in one of the workers of an executor from start_workers, returning (location, result, error) like run_checks
+
+    dose_struct_index   - the dose_struct_index of the job's folder
+    data                - the bytes of the plan if they've already been read (see check_dicom)
+    cache               - whether to use the extraction cache, if the workers have one. Plans that aren't files can't be cached
+    '''
+    return executor.submit(_check_fetched, job, (data, dose_struct_index), cache).result()
+
+def stop_workers(executor):
+    if isinstance(executor, ThreadPoolExecutor):
+        # The cache's connection can only be used (and closed) by the thread that opened it
+        executor.submit(_close_cache).result()
+    executor.shutdown()
+
+def _run_pipeline(jobs, truth_table, dose_struct_indices, workers, cache_file, profile, cprofile_folder, prefetch,
+                  selected_parameters, skip_unchecked):
+    ''' run_checks, reading plans in threads while earlier plans are checked'''
+    executor = start_workers(truth_table, workers, cache_file, profile, cprofile_folder,
+                             selected_parameters=selected_parameters, skip_unchecked=skip_unchecked)
+    try:
+        yield from pipeline(jobs, partial(_fetch_job, dose_struct_indices), _check_fetched, executor, prefetch, workers)
+    finally:
+        stop_workers(executor)
+
+def _fetch_job(dose_struct_indices, job):
+    ''' Read the plan of a job, along with the dose/structure index of its folder to send on to wherever it's checked'''
+    location, _, folder = job
+    return read_bytes(location), dose_struct_indices.get(folder, {})
+
+# State shared by every job run in this process, set up by _init_worker
+_worker_state = {}
+
+def _init_worker(truth_table, dose_struct_indices, interactive, cache_file, profile=False, cprofile_folder=None, memory_map=False,
+                 selected_parameters=None, skip_unchecked=True):
+    _worker_state["truth_table"] = truth_table
+    _worker_state["selected_parameters"] = selected_parameters
+    _worker_state["skip_unchecked"] = skip_unchecked
+    _worker_state["dose_struct_indices"] = dose_struct_indices
+    _worker_state["interactive"] = interactive
+    _worker_state["profile"] = profile
+    _worker_state["memory_map"] = memory_map
+    # Each process needs its own connection to the cache
+    _worker_state["cache"] = ExtractionCache(cache_file) if cache_file else None
+    # cProfile runs from the first time this process checks plans until it exits (watch mode checks plans many times)
+    if cprofile_folder and "cprofile" not in _worker_state:
+        _worker_state["cprofile"] = start_cprofile(cprofile_folder)
+
+def _close_cache():
+    if _worker_state.get("cache") is not None:
+        _worker_state["cache"].close()
+        _worker_state["cache"] = None
+
+def _check_jobs(jobs, dose_struct_indices):
+    _worker_state["dose_struct_indices"].update(dose_struct_indices)
+    return [_check_job(job) for job in jobs]
+
+def _check_fetched(job, fetched, cache=True):
+    location, _, folder = job
+    if isinstance(fetched, Exception):
+        return location, None, f"{type(fetched).__name__}: {fetched}"
+    data, dose_struct_index = fetched
+    _worker_state["dose_struct_indices"][folder] = dose_struct_index
+    return _check_job(job, data, cache)
+
+def _check_job(job, data=None, cache=True):
+    location, case_number, folder = job
+    try:
+        dose_struct_index = _worker_state["dose_struct_indices"].get(folder, {})
+        result = check_dicom(location, case_number, _worker_state["truth_table"], dose_struct_index,
+                             interactive=_worker_state["interactive"], cache=_worker_state["cache"] if cache else None,
+                             profile=_worker_state["profile"], memory_map=_worker_state["memory_map"], data=data,
+                             selected_parameters=_worker_state["selected_parameters"], skip_unchecked=_worker_state["skip_unchecked"])
+        return location, result, None
+    except (CaseNotFound, NotDicom) as error:
+        return location, None, error
+    except Exception as error:
+        return location, None, f"{type(error).__name__}: {error}"
@@ -0,0 +1,96 @@
+''' Module for finding out where the time goes when checking a batch of plans
+
+check_dicom records how long each stage of checking a plan took (reading, extracting, evaluating...) and, when profiling,
+how long each individual extraction and evaluation function took. A Profile collects these from every plan in a batch
+and summarises them as percentiles, so that a slow parameter stands out even if only some plans are slow.
+
+For more detail, cProfile can also be run in each process that checks plans (see start_cprofile).
+'''
+
+import os
+import csv
+import cProfile
+from multiprocessing import util
+from collections import defaultdict
+
+# The name of the profile summary saved in the output folder
+PROFILE_REPORT = "profile.csv"
+# The name of the folder (in the output folder) that cProfile dumps are saved in
+CPROFILE_FOLDER = "cprofile"
+
+PERCENTILES = [50, 90, 99]
+SUMMARY_HEADERS = ["Group", "Name", "Count", "Total (s)", "Mean (ms)"] + [f"P{p} (ms)" for p in PERCENTILES] + ["Max (ms)"]
+
+# The keys of a plan's details that hold timings, and the group they're reported under
+TIMING_GROUPS = [("timings", "stage"), ("extractor_timings", "extractor"), ("evaluator_timings", "evaluator")]
+
+class Profile:
+    ''' The timings of every plan checked in a batch, grouped by stage, extractor and evaluator'''
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def add(self, details):
+        ''' Add the timings in the details of a checked plan (see processing.check_dicom)'''
+        for key, group in TIMING_GROUPS:
+            for name, seconds in details.get(key, {}).items():
+                self.samples[(group, name)].append(seconds)
+
+    def add_evaluation(self, details, label):
+        ''' Add the evaluation timings of a plan evaluated against another truth table (see processing.evaluate_result),
+        named with label (e.g. the table's name) to keep them apart from the timings of the table the plan was checked against'''
+        self.add_timing("stage", f"evaluate ({label})", details["timings"]["evaluate"])
+        for name, seconds in details.get("evaluator_timings", {}).items():
+            self.add_timing("evaluator", f"{name} ({label})", seconds)
+
+    def add_timing(self, group, name, seconds):
+        self.samples[(group, name)].append(seconds)
+
+    def summary_rows(self):
+        ''' A row of SUMMARY_HEADERS for everything that was timed, slowest first within each group'''
+        rows = []
+        for _, group in TIMING_GROUPS:
+            timed = [(name, samples) for (sample_group, name), samples in self.samples.items() if sample_group == group]
+            timed.sort(key=lambda item: sum(item[1]), reverse=True)
+            for name, samples in timed:
+                samples = sorted(samples)
+                row = [group, name, len(samples), round(sum(samples), 4), _ms(sum(samples) / len(samples))]
+                row += [_ms(percentile(samples, p)) for p in PERCENTILES]
+                rows.append(row + [_ms(samples[-1])])
+        return rows
+
+    def write(self, filepath):
+        with open(filepath, 'w', newline='', encoding='utf-8') as report_file:
+            writer = csv.writer(report_file, lineterminator=os.linesep)
+            writer.writerow(SUMMARY_HEADERS)
+            writer.writerows(self.summary_rows())
+        return filepath
+
+    def print_summary(self):
+        rows = [SUMMARY_HEADERS] + [[str(value) for value in row] for row in self.summary_rows()]
+        widths = [max(len(row[column]) for row in rows) for column in range(len(SUMMARY_HEADERS))]
+        for row in rows:
+            print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+def percentile(samples, p):
+    ''' The p-th percentile (nearest rank) of a sorted, non empty list of samples'''
+    rank = max(1, -(-p * len(samples) // 100))
+    return samples[rank - 1]
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+def start_cprofile(folder):
+    ''' Run cProfile in this process until it exits, then save the stats in folder
+
+    Each process saves its own <pid>.prof file, which can be read with pstats or a viewer such as snakeviz.
+    '''
+    profiler = cProfile.Profile()
+    profiler.enable()
+    # Worker processes of a pool are never told they're finished, so the stats are saved when the process exits
+    return util.Finalize(profiler, _dump_cprofile, args=(profiler, folder), exitpriority=10)
+
+def _dump_cprofile(profiler, folder):
+    profiler.disable()
+    os.makedirs(folder, exist_ok=True)
+    profiler.dump_stats(os.path.join(folder, f"{os.getpid()}.prof"))
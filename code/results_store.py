@@ -0,0 +1,78 @@
+''' Module for keeping the results of every audit in a database, so they can be queried long after the reports were written
+
+Each parameter of each plan checked is a row of an SQLite database, along with the plan's location and SOPInstanceUID,
+the case and truth table it was checked against and when it was checked. Rows are added in bulk, a transaction per
+batch of plans rather than per plan, and the database is indexed for the usual questions, e.g. every case 7 plan that
+failed SSD this quarter:
+
+    python app.py query --results_db RESULTS_DB --case 7 --parameter SSD --evaluation FAIL --since 2026-07-01
+'''
+
+import sqlite3
+from datetime import datetime
+
+# The number of plans whose results are kept in memory before they're all added in a single transaction
+BATCH_PLANS = 100
+
+# The columns of each result, in the order query returns them
+COLUMNS = ["checked_at", "plan", "plan_uid", "case_number", "truth_table", "parameter", "value", "evaluation"]
+
+class ResultsStore:
+    def __init__(self, results_db, batch_plans=BATCH_PLANS):
+        # Several runs (e.g. a --watch and a query) may use the database at once, so wait for each other's writes instead of failing
+        self.connection = sqlite3.connect(results_db, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.batch_plans = batch_plans
+        self.pending = []
+        self.pending_plans = 0
+        with self.connection:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS results (
+                                        checked_at TEXT, plan TEXT, plan_uid TEXT, case_number INTEGER, truth_table TEXT,
+                                        parameter TEXT, value TEXT, evaluation TEXT)''')
+            # Queries are nearly always for a parameter's results, usually of a case and over a period of time
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_by_case ON results (case_number, parameter, evaluation, checked_at)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_by_parameter ON results (parameter, evaluation, checked_at)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_by_plan ON results (plan_uid)")
+
+    def add(self, location, result, truth_table):
+        ''' Add the result of checking the plan at location (see processing.check_dicom) against truth_table (the name of
+        the truth table file). It's saved with the rest of its batch, or when flush is called'''
+        parameters, evaluations, _, details = result
+        checked_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        for parameter, value in parameters.items():
+            self.pending.append((checked_at, location, details.get("plan_uid"), details["case"], truth_table,
+                                 parameter, str(value), str(evaluations.get(parameter))))
+        self.pending_plans += 1
+        if self.pending_plans >= self.batch_plans:
+            self.flush()
+
+    def flush(self):
+        ''' Save every result added since the last flush'''
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(f"INSERT INTO results VALUES ({', '.join('?' * len(COLUMNS))})", self.pending)
+        self.pending = []
+        self.pending_plans = 0
+
+    def query(self, case_number=None, parameter=None, evaluation=None, since=None, until=None, plan=None, truth_table=None):
+        ''' The results matching every filter given, as rows of COLUMNS ordered by when they were checked
+
+        since, until        - the earliest and latest time (or date, e.g. 2026-07-01) the plans were checked
+        plan                - part of the location or the whole SOPInstanceUID of the plans
+        truth_table         - part of the name of the truth table the plans were checked against
+        '''
+        self.flush()
+        filters = dict(case_number=case_number, parameter=parameter, evaluation=evaluation, since=since, until=until,
+                       plan=plan, truth_table=truth_table)
+        # A time is compared to just as much of checked_at as it gives, so that e.g. an until of 2026-09-30 includes all of that day
+        conditions = {"case_number": "case_number = :case_number", "parameter": "parameter = :parameter",
+                      "evaluation": "evaluation = :evaluation", "since": "checked_at >= :since",
+                      "until": "substr(checked_at, 1, length(:until)) <= :until",
+                      "plan": "(plan_uid = :plan OR instr(plan, :plan) > 0)", "truth_table": "instr(truth_table, :truth_table) > 0"}
+        where = " AND ".join(conditions[name] for name, value in filters.items() if value is not None)
+        return self.connection.execute(f"SELECT {', '.join(COLUMNS)} FROM results {'WHERE ' + where if where else ''} "
+                                       "ORDER BY checked_at, rowid", filters)
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -0,0 +1,178 @@
+''' Module for running the checker as a local service, so that plans can be checked one at a time without starting a new run for each
+
+The service keeps the truth table, the workers (see processing.start_workers), the extraction cache and the index of
+every folder it has seen loaded between requests, so a request only costs checking its plan. It only listens on
+localhost, and has no authentication, so it should not be exposed to a network.
+
+POST /check         - check a plan, given either
+                        a JSON body of {"path": LOCATION, "case": NUMBER}, where LOCATION is a DICOM (or ARCHIVE::MEMBER)
+                            on this machine and case is optional, or
+                        the bytes of the DICOM itself (any other Content-Type, e.g. application/dicom), with the case,
+                            a file name to detect the case from and a folder holding the plan's dose and structure set
+                            given as (optional) query parameters, e.g. /check?case=7&name=YellowLvlIII_7a.dcm&folder=/data/study
+                      The response is the plan's JSON report (see outputter.json_record)
+GET /health         - {"status": "ok", "checked": the number of plans checked so far}
+
+Errors are returned as {"error": message}: 404 if the plan doesn't exist, 400 if the request is malformed and 422 if
+the plan couldn't be checked (e.g. it isn't an RTPLAN or its case couldn't be detected).
+'''
+
+import os
+import json
+import threading
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+from .archives import is_member, split_location, location_stat
+from .discovery import discover
+from .outputter import json_record
+from .processing import start_workers, check_job, stop_workers
+
+# The service only accepts requests from this machine
+HOST = "127.0.0.1"
+
+# The location reported for uploaded plans that aren't given a name
+UPLOAD_NAME = "upload.dcm"
+
+class ServiceError(Exception):
+    ''' Raised when a request can't be answered, with the HTTP status to answer it with'''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class AuditService:
+    ''' Checks plans against a truth table with workers that are kept running between checks
+
+    truth_table         - the TruthTable of correct values for each case
+    workers             - the number of worker processes; 1 checks plans in a thread of this process
+    cache_file          - the location of the extraction cache database, or None to always extract
+    memory_map          - whether to read DICOMs (and index folders) through a memory map
+    selected_parameters - a tuple of the parameters to check, or None to check all of them (see processing.check_dicom)
+    '''
+    def __init__(self, truth_table, workers=1, cache_file=None, memory_map=False, selected_parameters=None):
+        self.truth_table = truth_table
+        self.memory_map = memory_map
+        self.executor = start_workers(truth_table, workers, cache_file, memory_map=memory_map, selected_parameters=selected_parameters)
+        self.checked = 0
+        # The FolderIndex of every folder (or archive) a plan has been checked from, refreshed on every check
+        self.indices = {}
+        self.lock = threading.Lock()
+
+    def check_path(self, location, case_number=None):
+        ''' The JSON report of the plan at location'''
+        folder = split_location(location)[0] if is_member(location) else os.path.dirname(location)
+        try:
+            location_stat(location)
+        except (OSError, KeyError):
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No such plan: {location}")
+        return self._check((location, case_number, folder), self._dose_struct_index(folder))
+
+    def check_upload(self, data, case_number=None, name=None, folder=None):
+        ''' The JSON report of the plan whose bytes are data
+
+        name                - the plan's file name, which its case may be detected from
+        folder              - a folder (or archive) holding the plan's dose and structure set, if any
+        '''
+        if folder is not None and not os.path.exists(folder):
+            raise ServiceError(HTTPStatus.NOT_FOUND, f"No such folder: {folder}")
+        dose_struct_index = self._dose_struct_index(folder) if folder is not None else {}
+        # There's no file to check the cached parameters are still up to date against, so uploads are always extracted
+        return self._check((name or UPLOAD_NAME, case_number, folder), dose_struct_index, data)
+
+    def close(self):
+        stop_workers(self.executor)
+
+    def _dose_struct_index(self, folder):
+        with self.lock:
+            if folder not in self.indices:
+                try:
+                    self.indices[folder] = next(discover(folder, memory_map=self.memory_map))[1]
+                except NotADirectoryError:
+                    raise ServiceError(HTTPStatus.BAD_REQUEST, f"Not a folder or archive: {folder}")
+            else:
+                self.indices[folder].refresh()
+            return self.indices[folder].dose_struct_index()
+
+    def _check(self, job, dose_struct_index, data=None):
+        location, result, error = check_job(self.executor, job, dose_struct_index, data, cache=data is None)
+        with self.lock:
+            self.checked += 1
+        if error:
+            raise ServiceError(HTTPStatus.UNPROCESSABLE_ENTITY, str(error))
+        if result is None:
+            raise ServiceError(HTTPStatus.UNPROCESSABLE_ENTITY, f"{location} is not an RTPLAN")
+        parameters, evaluations, solutions, details = result
+        return json_record((parameters, evaluations, solutions), dict(details, plan=location))
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    ''' Answers the requests of an AuditService's server (see serve)'''
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            return self._respond(HTTPStatus.NOT_FOUND, {"error": f"No such endpoint: {self.path}"})
+        self._respond(HTTPStatus.OK, {"status": "ok", "checked": self.server.service.checked})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/check":
+            return self._respond(HTTPStatus.NOT_FOUND, {"error": f"No such endpoint: {url.path}"})
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.headers.get_content_type() == "application/json":
+                request = _json_request(body)
+                record = self.server.service.check_path(request["path"], _case_number(request.get("case")))
+            else:
+                query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+                if not body:
+                    raise ServiceError(HTTPStatus.BAD_REQUEST, "No DICOM was uploaded")
+                record = self.server.service.check_upload(body, _case_number(query.get("case")), query.get("name"), query.get("folder"))
+        except ServiceError as error:
+            return self._respond(error.status, {"error": str(error)})
+        self._respond(HTTPStatus.OK, record)
+
+    def _respond(self, status, record):
+        body = json.dumps(record, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Requests are logged by whoever is calling the service, not on every request here
+        pass
+
+def _json_request(body):
+    try:
+        request = json.loads(body)
+    except ValueError as error:
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"The request is not valid JSON: {error}")
+    if not isinstance(request, dict) or not isinstance(request.get("path"), str):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, "The request must be a JSON object with the path of a plan")
+    return request
+
+def _case_number(case):
+    ''' The case number given in a request, or None to detect the case'''
+    if case is None or case == "":
+        return None
+    try:
+        return int(case)
+    except (TypeError, ValueError):
+        raise ServiceError(HTTPStatus.BAD_REQUEST, f"The case must be a number, not {case}")
+
+def make_server(service, port, host=HOST):
+    ''' An HTTP server answering requests with service on host:port (port 0 picks a free port), handling each request in
+    its own thread. Run it with serve_forever'''
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def serve(service, port, host=HOST):
+    ''' Answer requests with service until interrupted (e.g. with Ctrl+C)'''
+    with make_server(service, port, host) as server:
+        print(f"Checking plans at http://{host}:{server.server_address[1]}/check (press Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopped serving")
@@ -32,6 +32,8 @@ IMRT = "IMRT"
 VMAT_unknown = "VMAT unknown"
 SETUP_beam = "SETUP beam"
 no_wedge = "no wedge"
+no_override = "no override"
+ALTERNATIVES = " or " # In truth table, e.g. "1 or 3" accepts either structure
 STANDARD_FLUENCE = "STANDARD" # When fluence mode is listed as "STANDARD" in dicom, it is not FFF
 FFF = "FFF"
 ANY_VALUE = "-" # Truth table uses hyphen to denote any value is acceptable
@@ -39,4 +41,13 @@ FAIL = "FAIL"
 PASS = "PASS"
 NOT_IMPLEMENTED= "NOT IMPLEMENTED"
 NOT_APPLICABLE = "NOT APPLICABLE"
-Not_Extracted = "Not Extracted"
\ No newline at end of file
+Not_Extracted = "Not Extracted"
+NOT_CHECKED = "NOT CHECKED" # The truth table accepts any value for the parameter in this case, so it wasn't extracted
+NO_STRUCTURE_SET = "No structure set" # The plan's study has no RTSTRUCT to find its structures in
+NO_DOSE = "No dose" # The plan's study has no RTDOSE to find the dose at its measurement points in
+OUTSIDE_DOSE_GRID = "outside dose grid"
+
+# DICOM modalities
+RTPLAN = "RTPLAN"
+RTDOSE = "RTDOSE"
+RTSTRUCT = "RTSTRUCT"
\ No newline at end of file
@@ -0,0 +1,188 @@
+''' Module for loading the structure sets and doses that plans are checked against, once per study
+
+The plans of a study (e.g. one plan for each case of an audit) usually share a single structure set and dose.
+load_structure_set and load_dose_grid keep the files they've loaded in each process, keyed by their location, size and
+modification time, so a file is only read once however many plans use it, and is read again if it changes.
+
+Dose grids can be hundreds of MB, so only their geometry is read when they're loaded. Their dose values are read the
+first time they're used, through a memory map when the file is uncompressed and not in an archive, so that only the
+pages of the grid that are actually looked at are read from disk. Looking up the dose at points (DoseGrid.dose_at) is
+done for every point at once, only reading the 8 grid values around each point.
+'''
+
+import itertools
+import numpy as np
+import pydicom
+from io import BytesIO
+from functools import lru_cache
+from .archives import is_member, location_stat, read_member
+from .dicom_reader import read_dataset, DEFER_SIZE
+
+# The number of structure sets (and, separately, dose grids) kept loaded in each process
+STUDY_CACHE_SIZE = 8
+
+# Coordinates within this distance (in mm) of a POINT ROI are taken to be at that point
+POINT_TOLERANCE = 1.0
+
+# The physical property of an ROI whose density has been overridden
+DENSITY_OVERRIDE = "REL_ELEC_DENSITY"
+
+# The DICOM tags (see dicom_reader.tag_tree) read from structure sets and doses
+STRUCTURE_SET_TAGS = ["StructureSetROISequence.ROINumber", "StructureSetROISequence.ROIName",
+                      "ROIContourSequence.ReferencedROINumber", "ROIContourSequence.ContourSequence.ContourGeometricType",
+                      "ROIContourSequence.ContourSequence.ContourData",
+                      "RTROIObservationsSequence.ReferencedROINumber", "RTROIObservationsSequence.ROIPhysicalPropertiesSequence"]
+DOSE_GRID_TAGS = ["DoseSummationType", "DoseGridScaling", "ImagePositionPatient", "ImageOrientationPatient", "PixelSpacing",
+                  "GridFrameOffsetVector", "NumberOfFrames", "Rows", "Columns", "BitsAllocated", "PixelRepresentation"]
+
+class StructureSet:
+    '''
+    path                - the location of the RTSTRUCT
+    sop_uid             - its SOPInstanceUID, which plans refer to it by
+    roi_names           - a dictionary of ROI number to ROI name
+    points              - a dictionary of the name of each POINT ROI to its (x, y, z) position (mm)
+    overrides           - a dictionary of the name of each ROI whose density is overridden to the relative electron density it's overridden to
+    '''
+    def __init__(self, path, sop_uid, roi_names, points, overrides):
+        self.path = path
+        self.sop_uid = sop_uid
+        self.roi_names = roi_names
+        self.points = points
+        self.overrides = overrides
+        self._point_names = list(points)
+        self._point_positions = np.array([points[name] for name in self._point_names], dtype=float).reshape(-1, 3)
+
+    def point_at(self, position, tolerance=POINT_TOLERANCE):
+        ''' The name of the POINT ROI nearest to position (x, y, z in mm), or None if there's none within tolerance mm'''
+        if not self._point_names:
+            return None
+        distances = np.linalg.norm(self._point_positions - np.asarray(position, dtype=float), axis=1)
+        nearest = int(np.argmin(distances))
+        return self._point_names[nearest] if distances[nearest] <= tolerance else None
+
+class DoseGrid:
+    '''
+    path                - the location of the RTDOSE
+    plan_uids           - the SOPInstanceUIDs of the plans it's the dose of
+    summation_type      - its DoseSummationType, e.g. PLAN for the dose of a whole plan or BEAM for a single beam
+    origin              - the (x, y, z) position (mm) of the first dose point
+    axes                - the unit vectors (in x, y, z) along which the columns, rows and frames of the grid increase
+    spacing             - the distance (mm) between neighbouring columns and neighbouring rows
+    frame_offsets       - the distance (mm) of each frame from the first, along the frame axis
+    shape               - the (frames, rows, columns) of the grid
+    '''
+    def __init__(self, path, dataset):
+        self.path = path
+        self.plan_uids = [str(item.ReferencedSOPInstanceUID) for item in dataset.get("ReferencedRTPlanSequence") or []]
+        self.summation_type = str(dataset.get("DoseSummationType", ""))
+        self.origin = np.array(dataset.ImagePositionPatient, dtype=float)
+        orientation = np.array(dataset.get("ImageOrientationPatient") or [1, 0, 0, 0, 1, 0], dtype=float)
+        self.axes = np.array([orientation[:3], orientation[3:], np.cross(orientation[:3], orientation[3:])])
+        # PixelSpacing is (row spacing, column spacing), i.e. the distance between rows then between columns
+        self.spacing = np.array([float(dataset.PixelSpacing[1]), float(dataset.PixelSpacing[0])])
+        self.frame_offsets = np.array(dataset.get("GridFrameOffsetVector") or [0.0], dtype=float)
+        self.shape = (int(dataset.get("NumberOfFrames") or 1), int(dataset.Rows), int(dataset.Columns))
+        self.scaling = float(dataset.get("DoseGridScaling", 1.0))
+        self._dtype = np.dtype(f"{'i' if dataset.get('PixelRepresentation') == 1 else 'u'}{int(dataset.BitsAllocated) // 8}")
+        self._values = None
+        self._point_doses = {}
+
+    @property
+    def values(self):
+        ''' The raw (unscaled) dose values, as an array of shape (frames, rows, columns). Multiply by scaling to get the dose in Gy'''
+        if self._values is None:
+            self._values = _pixel_values(self.path, self._dtype, self.shape)
+        return self._values
+
+    def dose_at(self, positions):
+        ''' The dose (Gy) at each of an (N, 3) array of (x, y, z) positions (mm), interpolated trilinearly between the
+        dose points around it. Positions outside the grid have a dose of NaN'''
+        positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+        # The (fractional) frame, row and column index of each position
+        distances = (positions - self.origin) @ self.axes.T
+        frame_offsets, frame_distances = self.frame_offsets, distances[:, 2]
+        if frame_offsets[-1] < frame_offsets[0]:
+            # np.interp needs increasing offsets
+            frame_offsets, frame_distances = -frame_offsets, -frame_distances
+        indices = np.stack([np.interp(frame_distances, frame_offsets, np.arange(len(frame_offsets)), left=np.nan, right=np.nan),
+                            distances[:, 1] / self.spacing[1], distances[:, 0] / self.spacing[0]], axis=1)
+
+        shape = np.array(self.shape)
+        inside = np.all((indices >= 0) & (indices <= shape - 1), axis=1)
+        indices[~inside] = 0
+        # The index of the corner of the cell each position is in, and how far across the cell it is
+        lower = np.minimum(np.floor(indices).astype(int), np.maximum(shape - 2, 0))
+        fraction = indices - lower
+
+        doses = np.zeros(len(positions))
+        for corner in itertools.product((0, 1), repeat=3):
+            corner = np.array(corner)
+            index = np.minimum(lower + corner, shape - 1)
+            weight = np.prod(np.where(corner == 1, fraction, 1 - fraction), axis=1)
+            doses += weight * self.values[index[:, 0], index[:, 1], index[:, 2]]
+        doses *= self.scaling
+        doses[~inside] = np.nan
+        return doses
+
+    def point_doses(self, structure_set):
+        ''' A dictionary of the name of each POINT ROI of structure_set to the dose (Gy) at it. Every point is looked up at
+        once, and the doses are kept, so plans sharing this dose and structure set don't look them up again'''
+        if structure_set not in self._point_doses:
+            names = list(structure_set.points)
+            doses = self.dose_at([structure_set.points[name] for name in names])
+            self._point_doses[structure_set] = dict(zip(names, doses.tolist()))
+        return self._point_doses[structure_set]
+
+def load_structure_set(path):
+    ''' The StructureSet of the RTSTRUCT at path'''
+    return _load_structure_set(path, location_stat(path))
+
+def load_dose_grid(path):
+    ''' The DoseGrid of the RTDOSE at path. Its dose values aren't read until they're used'''
+    return _load_dose_grid(path, location_stat(path))
+
+@lru_cache(maxsize=STUDY_CACHE_SIZE)
+def _load_structure_set(path, stat):
+    dataset = read_dataset(path, STRUCTURE_SET_TAGS)
+    roi_names = dict((int(roi.ROINumber), str(roi.ROIName)) for roi in dataset.get("StructureSetROISequence") or [])
+
+    points = {}
+    for roi_contour in dataset.get("ROIContourSequence") or []:
+        for contour in roi_contour.get("ContourSequence") or []:
+            name = roi_names.get(int(roi_contour.ReferencedROINumber))
+            if contour.get("ContourGeometricType") == "POINT" and name is not None:
+                points[name] = tuple(float(coordinate) for coordinate in contour.ContourData[:3])
+
+    overrides = {}
+    for observation in dataset.get("RTROIObservationsSequence") or []:
+        for physical_property in observation.get("ROIPhysicalPropertiesSequence") or []:
+            name = roi_names.get(int(observation.ReferencedROINumber))
+            if physical_property.get("ROIPhysicalProperty") == DENSITY_OVERRIDE and name is not None:
+                overrides[name] = float(physical_property.ROIPhysicalPropertyValue)
+
+    return StructureSet(path, str(dataset.SOPInstanceUID), roi_names, points, overrides)
+
+@lru_cache(maxsize=STUDY_CACHE_SIZE)
+def _load_dose_grid(path, stat):
+    # Mapped so that only the header of the file is read, not the pixel data that follows it
+    return DoseGrid(path, read_dataset(path, DOSE_GRID_TAGS, memory_map=True))
+
+def _pixel_values(path, dtype, shape):
+    ''' The pixel data of the DICOM at path as an array of dtype and shape, memory mapped if possible'''
+    data = read_member(path) if is_member(path) else None
+    with BytesIO(data) if data is not None else open(path, "rb") as dicom_file:
+        # Reading stops at the start of the pixel data element, without reading its value
+        dataset = pydicom.dcmread(dicom_file, force=True, stop_before_pixels=True, defer_size=DEFER_SIZE)
+        implicit, little_endian = dataset.original_encoding
+        # The value follows the tag and length (and, with explicit VRs, the VR and 2 reserved bytes)
+        offset = dicom_file.tell() + (8 if implicit else 12)
+
+    transfer_syntax = dataset.file_meta.get("TransferSyntaxUID")
+    if transfer_syntax is not None and transfer_syntax.is_compressed:
+        # Compressed pixel data can only be decoded by pydicom
+        return pydicom.dcmread(BytesIO(data) if data is not None else path, force=True).pixel_array.reshape(shape)
+
+    dtype = dtype.newbyteorder("<" if little_endian else ">")
+    if data is not None:
+        return np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
@@ -1,17 +1,55 @@
 ''' Module for parsing the truth table from a csv input into a python dictionary'''
 
-import pandas as pd
-from pathlib import Path
 import csv
+from code import strings
+from code.parameters.parser_functions import parse_rule
+
+class TruthTable(dict):
+    ''' The truth table as a dictionary of columns ({parameter: [value for case 1, value for case 2, ...]}),
+    compiled into a Rule for each case and parameter (see parameters/parser_functions.py).
+
+    name        - the file the table was read from, if any
+    cases       - the number of cases in the table
+    rules       - a list with a {parameter: Rule} dictionary for each case
+    errors      - a list of (case, parameter, message) for every value that isn't in a valid format
+    '''
+    def __init__(self, columns, name=None):
+        super().__init__(columns)
+        self.name = name
+        self.cases = len(self[strings.case])
+        self.rules = []
+        self.errors = []
+        for i in range(self.cases):
+            case_rules = {}
+            for parameter, values in self.items():
+                if parameter == strings.case:
+                    continue
+                case_rules[parameter] = parse_rule(parameter, values[i])
+                if case_rules[parameter].error:
+                    self.errors.append((i + 1, parameter, case_rules[parameter].error))
+            self.rules.append(case_rules)
+
+    def case_rules(self, case):
+        ''' The {parameter: Rule} dictionary of a case (numbered from 1)'''
+        return self.rules[case-1]
+
+    def solutions(self, case):
+        ''' The raw truth table values of a case (numbered from 1)'''
+        return dict([(key, self[key][case-1]) for key in self])
 
 def read_truth_table(truth_table_file):
-    tt = pd.read_csv(truth_table_file, dtype='str')
-    return tt.to_dict('list')
+    # Read with the csv module rather than pandas: the table is tiny, and importing pandas would take longer than the rest of a short run
+    with open(truth_table_file, newline='', encoding='utf-8-sig') as table_file:
+        reader = csv.reader(table_file)
+        headers = next(reader)
+        columns = dict((header, []) for header in headers)
+        for row in reader:
+            if not row:
+                continue
+            for header, value in zip(headers, row + [""] * (len(headers) - len(row))):
+                columns[header].append(value)
+    return TruthTable(columns, truth_table_file)
     
 if __name__ == "__main__":
     tt = read_truth_table("data/truth_table_lvl3.csv")
     print(tt)
-
-
-
-
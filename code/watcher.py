@@ -0,0 +1,55 @@
+''' Module for watching input folders and checking plans as they arrive or change
+
+Folders are polled rather than watched with OS notifications, which keeps this working the same way on
+every platform and on network shares. Each poll only stats the files; headers are read just for new or
+changed files (see FolderIndex.refresh).
+'''
+
+import os
+import time
+from code import strings
+
+# Seconds between polls. A plan is checked once it has been unchanged for a whole poll, so that files
+# which are still being copied in are not read half written
+POLL_INTERVAL = 0.5
+
+def watch(targets, indices, dose_struct_indices, process, interval=POLL_INTERVAL):
+    ''' Poll the watched folders forever, passing each batch of new or changed RTPLANs to process
+
+    targets             - a list of (folder, case_number, location) tuples, where location is a single file
+                            to watch within folder, or None to watch every plan in folder
+    indices             - a dictionary mapping each folder to its FolderIndex, kept up to date here
+    dose_struct_indices - a dictionary mapping each folder to its dose_struct_index, kept up to date here
+    process             - a function taking a list of (location, case_number, folder) jobs
+    '''
+    # Plans that have changed, but haven't yet been seen unchanged for a whole poll
+    pending = {}
+    while True:
+        time.sleep(interval)
+
+        changed = {}
+        for folder in set(target[0] for target in targets):
+            entries = indices[folder].refresh()
+            if any(entry.modality != strings.RTPLAN for entry in entries):
+                dose_struct_indices[folder] = indices[folder].dose_struct_index()
+            for entry in entries:
+                if entry.modality == strings.RTPLAN:
+                    changed[entry.path] = folder
+
+        jobs = []
+        for path, folder in sorted(pending.items()):
+            if path not in changed and indices[folder].entry(path) is not None:
+                case_number = _watched_case(targets, folder, path)
+                if case_number is not False:
+                    jobs.append((path, case_number, folder))
+        pending = changed
+
+        if jobs:
+            process(jobs)
+
+def _watched_case(targets, folder, path):
+    ''' The case number the plan at path should be checked against, or False if it isn't being watched'''
+    for target_folder, case_number, location in targets:
+        if target_folder == folder and (location is None or os.path.normpath(location) == path):
+            return case_number
+    return False
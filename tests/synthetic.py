@@ -0,0 +1,281 @@
+''' Generators of synthetic RT DICOMs, for tests and benchmarks that need plans the sample data doesn't cover
+
+The generated DICOMs have the tags that the extraction functions read, laid out the same way as the sample
+plans in data/Input: a treatment beam's first control point holds its jaw, MLC, gantry and collimator positions,
+and the second item of each control point's ReferencedDoseReferenceSequence holds the SSD used for VMAT arcs.
+
+plan_dataset            - an RTPLAN with any number of static beams, or a VMAT arc with any number of control points
+structure_set_dataset   - an RTSTRUCT with POINT ROIs (e.g. the isocentre and prescription points) and density overrides
+dose_dataset            - an RTDOSE with a dose grid of any size
+write_study             - saves a plan with its structure set and dose in a folder, all sharing a StudyInstanceUID
+'''
+
+import os
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import generate_uid, ExplicitVRLittleEndian
+from code import strings
+
+RT_PLAN_STORAGE = "1.2.840.10008.5.1.4.1.1.481.5"
+RT_STRUCTURE_SET_STORAGE = "1.2.840.10008.5.1.4.1.1.481.3"
+RT_DOSE_STORAGE = "1.2.840.10008.5.1.4.1.1.481.2"
+
+# The same MLC as the sample plans: 80 leaf pairs, 5 mm wide
+LEAF_PAIRS = 80
+LEAF_BOUNDARIES = [-200.0 + 5.0 * leaf for leaf in range(LEAF_PAIRS + 1)]
+
+def _dataset(modality, sop_class_uid, study_uid):
+    dataset = Dataset()
+    dataset.SOPClassUID = sop_class_uid
+    dataset.SOPInstanceUID = generate_uid()
+    dataset.StudyInstanceUID = study_uid
+    dataset.SeriesInstanceUID = generate_uid()
+    dataset.Modality = modality
+    dataset.PatientID = "SYNTHETIC"
+    return dataset
+
+def _control_point(index, gantry, collimator, ssd, field_size, energy=None, isocentre=(0.0, 0.0, 0.0)):
+    ''' A control point with jaws and MLC leaves set to a field_size of (y, x) cm, centred on the isocentre'''
+    control_point = Dataset()
+    control_point.ControlPointIndex = index
+    if energy is not None:
+        control_point.NominalBeamEnergy = energy
+    half_y, half_x = field_size[0] * 5.0, field_size[1] * 5.0
+
+    jaws = Dataset()
+    jaws.RTBeamLimitingDeviceType = "ASYMY"
+    jaws.LeafJawPositions = [-half_y, half_y]
+    leaves = Dataset()
+    leaves.RTBeamLimitingDeviceType = "MLCX"
+    leaves.LeafJawPositions = [-half_x] * LEAF_PAIRS + [half_x] * LEAF_PAIRS
+    control_point.BeamLimitingDevicePositionSequence = Sequence([jaws, leaves])
+
+    control_point.GantryAngle = gantry
+    control_point.BeamLimitingDeviceAngle = collimator
+    control_point.PatientSupportAngle = 0
+    control_point.IsocenterPosition = list(isocentre)
+    control_point.SourceToSurfaceDistance = ssd * 10
+
+    # The second dose reference holds the SSD of each control point of an arc
+    site = Dataset()
+    site.ReferencedDoseReferenceNumber = 1
+    point = Dataset()
+    point.ReferencedDoseReferenceNumber = 2
+    point.BeamDosePointSSD = ssd * 10
+    control_point.ReferencedDoseReferenceSequence = Sequence([site, point])
+    return control_point
+
+def _beam(number, description, control_points, wedge_angle=None, fluence_mode=strings.STANDARD_FLUENCE):
+    beam = Dataset()
+    beam.BeamNumber = number
+    beam.BeamName = description
+    beam.BeamDescription = description
+    beam.BeamType = "DYNAMIC"
+    beam.PrimaryDosimeterUnit = "MU"
+
+    fluence = Dataset()
+    fluence.FluenceMode = fluence_mode
+    if fluence_mode != strings.STANDARD_FLUENCE:
+        fluence.FluenceModeID = "FFF"
+    beam.PrimaryFluenceModeSequence = Sequence([fluence])
+
+    jaws = Dataset()
+    jaws.RTBeamLimitingDeviceType = "ASYMY"
+    jaws.NumberOfLeafJawPairs = 1
+    leaves = Dataset()
+    leaves.RTBeamLimitingDeviceType = "MLCX"
+    leaves.NumberOfLeafJawPairs = LEAF_PAIRS
+    leaves.LeafPositionBoundaries = LEAF_BOUNDARIES
+    beam.BeamLimitingDeviceSequence = Sequence([jaws, leaves])
+
+    if wedge_angle is None:
+        beam.NumberOfWedges = 0
+    else:
+        beam.NumberOfWedges = 1
+        wedge = Dataset()
+        wedge.WedgeAngle = wedge_angle
+        beam.WedgeSequence = Sequence([wedge])
+
+    beam.NumberOfControlPoints = len(control_points)
+    beam.ControlPointSequence = Sequence(control_points)
+    return beam
+
+def plan_dataset(beams=5, control_points=2, vmat=False, study_uid=None, structure_set_uid=None, gantry_angles=None,
+                 collimator=0, ssd=90.0, field_size=(10, 10), prescription=(50, 25), energy=6, wedge_angle=None, label="SYNTH",
+                 isocentre=(0.0, 0.0, 0.0), prescription_points=()):
+    ''' An RTPLAN dataset
+
+    beams               - the number of static treatment beams (ignored for VMAT, which has a single arc)
+    control_points      - the number of control points of each beam, e.g. thousands for a long VMAT arc
+    vmat                - whether the plan is a single arc with the gantry moving at every control point
+    study_uid           - the StudyInstanceUID, which links the plan to its structure set and dose. Generated if None
+    structure_set_uid   - the SOPInstanceUID of the structure set the plan refers to, if any
+    gantry_angles       - the gantry angle of each static beam. Spread evenly around 360 degrees if None
+    ssd, field_size     - the SSD (cm) of every control point and the (y, x) field size (cm) of every beam
+    prescription        - (total dose, number of fractions)
+    isocentre           - the (x, y, z) position (mm) of the isocentre of every beam
+    prescription_points - the (x, y, z) positions (mm) of any target dose reference points, as well as the target SITE
+    '''
+    dataset = _dataset(strings.RTPLAN, RT_PLAN_STORAGE, study_uid or generate_uid())
+    dataset.RTPlanLabel = label
+    dataset.RTPlanName = label
+
+    dose_reference = Dataset()
+    dose_reference.DoseReferenceNumber = 1
+    dose_reference.DoseReferenceStructureType = "SITE"
+    dose_reference.DoseReferenceType = "TARGET"
+    dose_reference.TargetPrescriptionDose = prescription[0]
+    dose_references = [dose_reference]
+    for number, point in enumerate(prescription_points, start=2):
+        dose_reference = Dataset()
+        dose_reference.DoseReferenceNumber = number
+        dose_reference.DoseReferenceStructureType = "COORDINATES"
+        dose_reference.DoseReferenceType = "TARGET"
+        dose_reference.DoseReferencePointCoordinates = list(point)
+        dose_references.append(dose_reference)
+    dataset.DoseReferenceSequence = Sequence(dose_references)
+    fraction_group = Dataset()
+    fraction_group.NumberOfFractionsPlanned = prescription[1]
+    dataset.FractionGroupSequence = Sequence([fraction_group])
+
+    if structure_set_uid:
+        reference = Dataset()
+        reference.ReferencedSOPClassUID = RT_STRUCTURE_SET_STORAGE
+        reference.ReferencedSOPInstanceUID = structure_set_uid
+        dataset.ReferencedStructureSetSequence = Sequence([reference])
+
+    if vmat:
+        # An arc from 181 degrees clockwise round to 179 degrees
+        angles = np.linspace(181.0, 539.0, control_points) % 360
+        arc = [_control_point(index, round(float(angle), 1), collimator, ssd, field_size, energy if index == 0 else None, isocentre)
+               for index, angle in enumerate(angles)]
+        treatment_beams = [_beam(1, "ARC", arc, wedge_angle)]
+    else:
+        if gantry_angles is None:
+            gantry_angles = [round(360 / beams * beam) for beam in range(beams)]
+        treatment_beams = [_beam(number + 1, str(gantry), [_control_point(index, gantry, collimator, ssd, field_size, energy if index == 0 else None, isocentre)
+                                                          for index in range(control_points)], wedge_angle)
+                           for number, gantry in enumerate(gantry_angles)]
+
+    setup_beam = _beam(len(treatment_beams) + 1, strings.SETUP_beam, [_control_point(0, 0, 0, ssd, field_size, energy, isocentre)])
+    dataset.BeamSequence = Sequence(treatment_beams + [setup_beam])
+    return dataset
+
+def structure_set_dataset(study_uid, points=None, overrides=None):
+    ''' An RTSTRUCT dataset
+
+    points              - a dictionary of ROI name to the (x, y, z) position (mm) of a POINT ROI
+    overrides           - a dictionary of ROI name to the relative electron density that ROI is overridden to
+    '''
+    points = points if points is not None else {"ISO": (0.0, 0.0, 0.0)}
+    overrides = overrides or {}
+    dataset = _dataset(strings.RTSTRUCT, RT_STRUCTURE_SET_STORAGE, study_uid)
+    dataset.StructureSetLabel = "SYNTHETIC"
+
+    rois, contours, observations = [], [], []
+    names = list(points) + [name for name in overrides if name not in points]
+    for number, name in enumerate(names, start=1):
+        roi = Dataset()
+        roi.ROINumber = number
+        roi.ROIName = name
+        rois.append(roi)
+
+        observation = Dataset()
+        observation.ObservationNumber = number
+        observation.ReferencedROINumber = number
+        observation.RTROIInterpretedType = "MARKER" if name in points else "ORGAN"
+        if name in overrides:
+            density = Dataset()
+            density.ROIPhysicalProperty = "REL_ELEC_DENSITY"
+            density.ROIPhysicalPropertyValue = overrides[name]
+            observation.ROIPhysicalPropertiesSequence = Sequence([density])
+        observations.append(observation)
+
+        if name in points:
+            contour = Dataset()
+            contour.ContourGeometricType = "POINT"
+            contour.NumberOfContourPoints = 1
+            contour.ContourData = list(points[name])
+            roi_contour = Dataset()
+            roi_contour.ReferencedROINumber = number
+            roi_contour.ContourSequence = Sequence([contour])
+            contours.append(roi_contour)
+
+    dataset.StructureSetROISequence = Sequence(rois)
+    dataset.ROIContourSequence = Sequence(contours)
+    dataset.RTROIObservationsSequence = Sequence(observations)
+    return dataset
+
+def dose_dataset(study_uid, plan_uid=None, shape=(50, 100, 100), spacing=2.5, origin=None, scaling=1e-4, dose=None):
+    ''' An RTDOSE dataset
+
+    shape               - the (frames, rows, columns) of the dose grid. (100, 400, 400) is a realistic 64 MB grid
+    spacing             - the distance (mm) between neighbouring dose points, in every direction
+    origin              - the (x, y, z) position (mm) of the first dose point. By default the grid is centred on (0, 0, 0)
+    dose                - a function of x, y and z (mm) arrays giving the dose (Gy) at each point. Falls off from 2 Gy at the centre if None
+    '''
+    dataset = _dataset(strings.RTDOSE, RT_DOSE_STORAGE, study_uid)
+    frames, rows, columns = shape
+    if origin is None:
+        origin = (-(columns - 1) * spacing / 2, -(rows - 1) * spacing / 2, -(frames - 1) * spacing / 2)
+    if plan_uid:
+        reference = Dataset()
+        reference.ReferencedSOPClassUID = RT_PLAN_STORAGE
+        reference.ReferencedSOPInstanceUID = plan_uid
+        dataset.ReferencedRTPlanSequence = Sequence([reference])
+
+    dataset.DoseUnits = "GY"
+    dataset.DoseType = "PHYSICAL"
+    dataset.DoseSummationType = "PLAN"
+    dataset.ImagePositionPatient = list(origin)
+    dataset.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+    dataset.PixelSpacing = [spacing, spacing]
+    dataset.GridFrameOffsetVector = [spacing * frame for frame in range(frames)]
+    dataset.NumberOfFrames = frames
+    dataset.Rows = rows
+    dataset.Columns = columns
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = "MONOCHROME2"
+    dataset.BitsAllocated = 32
+    dataset.BitsStored = 32
+    dataset.HighBit = 31
+    dataset.PixelRepresentation = 0
+    dataset.DoseGridScaling = scaling
+
+    z, y, x = np.meshgrid(origin[2] + np.arange(frames) * spacing, origin[1] + np.arange(rows) * spacing,
+                          origin[0] + np.arange(columns) * spacing, indexing="ij")
+    if dose is None:
+        dose = lambda x, y, z: 2.0 * np.exp(-(x ** 2 + y ** 2 + z ** 2) / 2e4)
+    dataset.PixelData = np.round(dose(x, y, z) / scaling).astype("<u4").tobytes()
+    return dataset
+
+def save(dataset, filepath):
+    ''' Save a dataset made by this module as a DICOM file (explicit VR little endian)'''
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = dataset.SOPClassUID
+    file_meta.MediaStorageSOPInstanceUID = dataset.SOPInstanceUID
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset.file_meta = file_meta
+    dataset.save_as(filepath, enforce_file_format=True)
+    return filepath
+
+def write_study(folder, name="synthetic", dose_shape=(50, 100, 100), points=None, overrides=None, **plan_options):
+    ''' Save a plan, along with a structure set and dose that belong to the same study, in folder
+
+    dose_shape          - the shape of the dose grid (see dose_dataset), or None to not save a dose
+    plan_options        - passed on to plan_dataset
+
+    Returns a dictionary of modality to the filepath it was saved to
+    '''
+    study_uid = plan_options.pop("study_uid", None) or generate_uid()
+    structure_set = structure_set_dataset(study_uid, points, overrides)
+    plan = plan_dataset(study_uid=study_uid, structure_set_uid=structure_set.SOPInstanceUID, **plan_options)
+
+    paths = {
+        strings.RTPLAN: save(plan, os.path.join(folder, f"{name}.dcm")),
+        strings.RTSTRUCT: save(structure_set, os.path.join(folder, f"{name}_RS.dcm")),
+    }
+    if dose_shape is not None:
+        paths[strings.RTDOSE] = save(dose_dataset(study_uid, plan.SOPInstanceUID, dose_shape), os.path.join(folder, f"{name}_RD.dcm"))
+    return paths
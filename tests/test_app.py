@@ -0,0 +1,92 @@
+''' Tests for finding plans and writing their reports from the command line'''
+
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import unittest
+import zipfile
+from unittest import mock
+from contextlib import redirect_stdout, redirect_stderr
+from io import StringIO
+from app import find_jobs, process_jobs, parse_arguments
+from code.processing import evaluate_result
+from code.profiling import Profile
+from code.truth_table_reader import read_truth_table
+
+PLAN = 'data/Input/more-input/YellowLvlIII_1a.dcm'
+
+class TestReports(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.output = os.path.join(self.folder, 'reports')
+        os.mkdir(self.output)
+        self.truth_tables = [read_truth_table('data/truth_table_lvl3.csv')]
+
+    def run_app(self, inputs, report_names=None, profile=None):
+        dose_struct_indices = {}
+        jobs = find_jobs(inputs, None, False, False, {}, dose_struct_indices, [])
+        with redirect_stdout(StringIO()) as printed:
+            process_jobs(jobs, self.truth_tables, dose_struct_indices, self.output, 'csv', interactive=False, profile=profile,
+                         report_names=report_names)
+        return printed.getvalue()
+
+    def test_plans_with_the_same_name(self):
+        # The same plan exported twice, into archives of different formats
+        with zipfile.ZipFile(os.path.join(self.folder, 'exp.zip'), 'w') as archive:
+            archive.write(PLAN, 'more-input/YellowLvlIII_1a.dcm')
+        with tarfile.open(os.path.join(self.folder, 'exp.tar.gz'), 'w:gz') as archive:
+            archive.add(PLAN, 'more-input/YellowLvlIII_1a.dcm')
+
+        report_names = {}
+        printed = self.run_app([os.path.join(self.folder, 'exp.zip'), os.path.join(self.folder, 'exp.tar.gz')], report_names)
+        self.assertEqual(sorted(os.listdir(self.output)), ['YellowLvlIII_1a.csv', 'YellowLvlIII_1a_2.csv'])
+        self.assertIn("will be YellowLvlIII_1a_2", printed)
+        # A plan checked again in the same run (e.g. by --watch) keeps its report
+        self.run_app([os.path.join(self.folder, 'exp.tar.gz')], report_names)
+        self.assertEqual(len(os.listdir(self.output)), 2)
+
+    def test_unreadable_file_is_reported(self):
+        location = os.path.join(self.folder, 'broken.dcm')
+        with open(location, 'wb') as dicom:
+            dicom.write(b'not a dicom')
+        # Named explicitly, so it's checked in full even though the index couldn't read its header
+        printed = self.run_app([location + ',7'])
+        self.assertIn(f"1 of 1 DICOMs could not be processed:\n  {location}:", printed)
+
+    def test_profile_covers_every_truth_table(self):
+        self.truth_tables.append(read_truth_table('data/truth_table_lvl2.csv'))
+        profile = Profile()
+        self.run_app(['data/Input/YellowLvlIII_7a.dcm,7'], profile=profile)
+        timed = dict(((group, name), len(samples)) for (group, name), samples in profile.samples.items())
+        self.assertEqual((timed[("stage", "evaluate")], timed[("stage", "evaluate (truth_table_lvl2)")]), (1, 1))
+        self.assertEqual(timed[("evaluator", "SSD (truth_table_lvl2)")], timed[("evaluator", "SSD")])
+
+    def test_output_stage_only_times_writing(self):
+        self.truth_tables.append(read_truth_table('data/truth_table_lvl2.csv'))
+        profile = Profile()
+        def slow_evaluation(*arguments):
+            time.sleep(0.2)
+            return evaluate_result(*arguments)
+        with mock.patch('app.evaluate_result', side_effect=slow_evaluation):
+            self.run_app(['data/Input/YellowLvlIII_7a.dcm,7'], profile=profile)
+        self.assertLess(profile.samples[("stage", "output")][0], 0.2)
+
+class TestArguments(unittest.TestCase):
+
+    def parse(self, *arguments):
+        with mock.patch('sys.argv', ['app.py'] + list(arguments)):
+            return parse_arguments()
+
+    def test_serve_refuses_batch_options(self):
+        self.assertEqual(self.parse('--serve', '8080', '--parameters', 'SSD')["parameters"], ['SSD'])
+        for arguments in [('-t', 'data/truth_table_lvl3.csv', 'data/truth_table_lvl2.csv'), ('--profile',), ('--watch',)]:
+            with redirect_stderr(StringIO()) as printed, self.assertRaises(SystemExit):
+                self.parse('--serve', '8080', *arguments)
+            self.assertIn("--serve can't be used with", printed.getvalue())
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,63 @@
+''' Tests for detecting the case of a plan when it isn't given'''
+
+import unittest
+from unittest import mock
+import pydicom
+from code.case_detection import case_from_filename, case_from_dataset
+from code.processing import check_dicom, CaseNotFound
+from code.truth_table_reader import read_truth_table
+
+class TestCaseDetection(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.truth_table = read_truth_table("data/truth_table_lvl3.csv")
+
+    def test_filename(self):
+        self.assertEqual(case_from_filename("data/Input/YellowLvlIII_7a.dcm", 17), 7)
+        self.assertEqual(case_from_filename("data/Input/more-input/YellowLvlIII_8aColls5.dcm", 17), 8)
+        self.assertEqual(case_from_filename("data/Input/more-input/YellowLvlIII_1c6FFF.dcm", 17), 1)
+        self.assertEqual(case_from_filename("plan_12b.dcm", 17), 12)
+        # No case number, or a case that isn't in the truth table
+        self.assertIsNone(case_from_filename("RP.1.2.840.dcm", 17))
+        self.assertIsNone(case_from_filename("YellowLvlIII_42a.dcm", 17))
+        # Field sizes, and numbers that aren't after an underscore, aren't case numbers
+        self.assertIsNone(case_from_filename("plan_10x10.dcm", 17))
+        self.assertIsNone(case_from_filename("2x2_field.dcm", 17))
+        self.assertIsNone(case_from_filename("YellowLvlIII_field_2x2.dcm", 17))
+        self.assertIsNone(case_from_filename("plan7a.dcm", 17))
+
+    def test_plan_label(self):
+        dataset = pydicom.dcmread("data/Input/YellowLvlIII_7b.dcm", force=True)
+        self.assertEqual(case_from_dataset(dataset, self.truth_table), (7, "RTPlanLabel"))
+        # A field size in the label isn't a case, and the plan's beams are shared by cases 6, 7 and 8
+        dataset.RTPlanLabel = "10x10"
+        dataset.RTPlanName = "Open 2x2"
+        self.assertEqual(case_from_dataset(dataset, self.truth_table), (None, None))
+
+    def test_signature(self):
+        dataset = pydicom.dcmread("data/Input/more-input/YellowLvlIII_2a.dcm", force=True)
+        dataset.RTPlanLabel = "Audit"
+        dataset.RTPlanName = "Audit"
+        self.assertEqual(case_from_dataset(dataset, self.truth_table), (2, "signature"))
+
+    def test_ambiguous_signature(self):
+        # Cases 6, 7 and 8 share the same beams, so the case can't be told from the signature alone
+        dataset = pydicom.dcmread("data/Input/YellowLvlIII_7a.dcm", force=True)
+        dataset.RTPlanLabel = "Audit"
+        dataset.RTPlanName = "Audit"
+        self.assertEqual(case_from_dataset(dataset, self.truth_table), (None, None))
+
+    def test_check_without_case(self):
+        result = check_dicom("data/Input/YellowLvlIII_7a.dcm", None, self.truth_table, interactive=False)
+        self.assertEqual(result[3]["case"], 7)
+        self.assertEqual(result[3]["case_source"], "filename")
+
+    def test_case_not_found(self):
+        with mock.patch("code.processing.case_from_filename", return_value=None), \
+             mock.patch("code.processing.case_from_dataset", return_value=(None, None)):
+            with self.assertRaises(CaseNotFound):
+                check_dicom("data/Input/YellowLvlIII_7a.dcm", None, self.truth_table, interactive=False)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,73 @@
+''' Tests for reading only the tags of a DICOM that are needed'''
+
+import glob
+import shutil
+import tempfile
+import unittest
+import os
+from unittest import mock
+from code.dicom_reader import read_dataset, read_header, tag_tree, UnsupportedPydicom
+from code.processing import PLAN_TAGS
+from code.parameters.parameter_retrieval import extract_parameters
+from tests.synthetic import write_study
+
+class TestDicomReader(unittest.TestCase):
+
+    def test_tag_tree(self):
+        tree = tag_tree(["BeamSequence.ControlPointSequence.GantryAngle", "BeamSequence.BeamDescription", "Modality"])
+        self.assertEqual(tree, {0x300A00B0: {0x300A0111: {0x300A011E: None}, 0x300A00C3: None}, 0x00080060: None})
+        # A whole sequence includes everything below it
+        self.assertEqual(tag_tree(["BeamSequence", "BeamSequence.BeamDescription"]), {0x300A00B0: None})
+        self.assertEqual(tag_tree(["BeamSequence.BeamDescription", "BeamSequence"]), {0x300A00B0: None})
+        with self.assertRaises(ValueError):
+            tag_tree(["BeamSequence.NotAKeyword"])
+
+    def test_unsupported_pydicom(self):
+        # Rather than quietly reading every plan in full with pydicom
+        with mock.patch('pydicom.filereader._read_file_meta_info', None):
+            with self.assertRaisesRegex(UnsupportedPydicom, "pydicom 3.0"):
+                read_dataset('data/Input/YellowLvlIII_7a.dcm', PLAN_TAGS)
+
+    def test_only_tags_are_read(self):
+        dataset = read_dataset('data/Input/YellowLvlIII_7a.dcm', ["BeamSequence.ControlPointSequence.GantryAngle"])
+        self.assertIn("StudyInstanceUID", dataset)
+        self.assertNotIn("PatientSetupSequence", dataset)
+        beam = dataset.BeamSequence[0]
+        self.assertEqual(len(dataset.BeamSequence), 6)
+        self.assertEqual([element.keyword for element in beam], ["ControlPointSequence"])
+        self.assertEqual([element.keyword for element in beam.ControlPointSequence[0]], ["GantryAngle"])
+        self.assertEqual(beam.ControlPointSequence[0].GantryAngle, 150)
+
+    def assertSameParameters(self, location, case):
+        full = extract_parameters(read_dataset(location), {}, case)
+        self.assertEqual(extract_parameters(read_dataset(location, PLAN_TAGS), {}, case), full)
+
+    def test_same_parameters(self):
+        # The sample plans use implicit VRs and sequences of undefined length
+        for location in sorted(glob.glob('data/Input/**/*.dcm', recursive=True)):
+            for case in [1, 7]:
+                self.assertSameParameters(location, case)
+
+    def test_same_parameters_explicit_vr(self):
+        # The synthetic plans use explicit VRs and sequences of defined length
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        paths = write_study(folder, vmat=True, control_points=50, dose_shape=None)
+        self.assertSameParameters(paths['RTPLAN'], 7)
+
+    def test_memory_map(self):
+        location = 'data/Input/more-input/YellowLvlIII_8b.dcm'
+        self.assertEqual(read_header(location, memory_map=True), read_header(location))
+        self.assertEqual(extract_parameters(read_dataset(location, PLAN_TAGS, memory_map=True), {}, 8),
+                         extract_parameters(read_dataset(location, PLAN_TAGS), {}, 8))
+        self.assertEqual(read_dataset(location, memory_map=True).filename, location)
+
+        # Empty files can't be memory mapped, so they're read normally
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        empty = os.path.join(folder, 'empty.dcm')
+        open(empty, 'wb').close()
+        self.assertNotIn("Modality", read_dataset(empty, PLAN_TAGS, memory_map=True))
+
+if __name__ == '__main__' :
+    unittest.main()
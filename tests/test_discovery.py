@@ -0,0 +1,68 @@
+''' Tests for finding plans in folders, subfolders and archives'''
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from code import strings
+from code.archives import member_location, file_stem, location_stat
+from code.discovery import discover
+from code.processing import check_dicom, run_checks
+from code.truth_table_reader import read_truth_table
+
+class TestDiscovery(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.folder, 'export.zip')
+        with zipfile.ZipFile(self.zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.write('data/Input/YellowLvlIII_7a.dcm', 'plans/YellowLvlIII_7a.dcm')
+            archive.write('data/Input/7a.PDF', '7a.PDF')
+        self.tar_path = os.path.join(self.folder, 'export.tar.gz')
+        with tarfile.open(self.tar_path, 'w:gz') as archive:
+            archive.add('data/Input/YellowLvlIII_7b.dcm', 'YellowLvlIII_7b.dcm')
+        self.truth_table = read_truth_table('data/truth_table_lvl3.csv')
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_recursive(self):
+        folders = [folder for folder, _ in discover('data', recursive=True)]
+        self.assertEqual(folders, ['data', os.path.join('data', 'Input'), os.path.join('data', 'Input', 'more-input')])
+        self.assertEqual([folder for folder, _ in discover('data')], ['data'])
+
+    def test_archives(self):
+        indices = dict(discover(self.folder))
+        self.assertEqual(list(indices), [self.folder, self.tar_path, self.zip_path])
+        self.assertEqual(indices[self.folder].plans(), [])
+        plans = [entry.path for entry in indices[self.zip_path].plans()]
+        self.assertEqual(plans, [member_location(self.zip_path, 'plans/YellowLvlIII_7a.dcm')])
+        self.assertEqual(indices[self.tar_path].plans()[0].modality, strings.RTPLAN)
+
+    def test_members_are_checked_like_files(self):
+        location = member_location(self.zip_path, 'plans/YellowLvlIII_7a.dcm')
+        self.assertEqual(file_stem(location), 'YellowLvlIII_7a')
+        self.assertEqual(location_stat(location)[0], os.path.getsize('data/Input/YellowLvlIII_7a.dcm'))
+        self.assertEqual(check_dicom(location, 7, self.truth_table)[:3], check_dicom('data/Input/YellowLvlIII_7a.dcm', 7, self.truth_table)[:3])
+        tar_location = member_location(self.tar_path, 'YellowLvlIII_7b.dcm')
+        self.assertEqual(check_dicom(tar_location, 7, self.truth_table)[:3], check_dicom('data/Input/YellowLvlIII_7b.dcm', 7, self.truth_table)[:3])
+
+    def test_streaming_jobs(self):
+        dose_struct_indices = {}
+        def jobs():
+            for folder, index in discover('data', recursive=True):
+                dose_struct_indices[folder] = index.dose_struct_index()
+                for entry in index.plans():
+                    yield entry.path, 7, folder
+        expected = [job[0] for job in jobs()]
+        for workers in [1, 2]:
+            checked = list(run_checks(jobs(), self.truth_table, dose_struct_indices, workers))
+            self.assertEqual([location for location, _, _ in checked], expected)
+            self.assertTrue(all(error is None for _, _, error in checked))
+
+if __name__ == '__main__' :
+    unittest.main()
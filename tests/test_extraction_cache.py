@@ -0,0 +1,56 @@
+''' Tests for reusing extracted parameters between runs'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from code import strings
+from code.extraction_cache import ExtractionCache
+from code.parameters.parameter_retrieval import EXTRACTOR_VERSION
+from code.processing import check_dicom
+from code.truth_table_reader import read_truth_table
+
+class TestExtractionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.plan = shutil.copy('data/Input/YellowLvlIII_7a.dcm', self.folder)
+        self.cache = ExtractionCache(os.path.join(self.folder, 'cache.sqlite3'))
+        self.addCleanup(self.cache.close)
+        self.truth_table = read_truth_table('data/truth_table_lvl3.csv')
+
+    def test_unchanged_plan_is_not_read(self):
+        first = check_dicom(self.plan, 7, self.truth_table, cache=self.cache)
+        with mock.patch('code.processing.read_dataset') as read_dataset:
+            second = check_dicom(self.plan, 7, self.truth_table, cache=self.cache)
+            read_dataset.assert_not_called()
+        self.assertEqual(first[:3], second[:3])
+        self.assertTrue(second[3]["cached"])
+
+    def test_changed_plan_is_extracted_again(self):
+        check_dicom(self.plan, 7, self.truth_table, cache=self.cache, skip_unchecked=False)
+        self.assertIsNotNone(self.cache.lookup(self.plan, 7, {}))
+        stat = os.stat(self.plan)
+        os.utime(self.plan, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertIsNone(self.cache.lookup(self.plan, 7, {}))
+
+    def test_entries_need_every_parameter(self):
+        # Only SSD (and the parameters it requires) are extracted, so checking every parameter extracts the plan again
+        check_dicom(self.plan, 7, self.truth_table, cache=self.cache, selected_parameters=(strings.SSD,))
+        self.assertIsNotNone(self.cache.lookup(self.plan, 7, {}, [strings.SSD, strings.gantry]))
+        self.assertIsNone(self.cache.lookup(self.plan, 7, {}, [strings.SSD, strings.collimator]))
+        self.assertFalse(check_dicom(self.plan, 7, self.truth_table, cache=self.cache)[3]["cached"])
+
+    def test_entries_from_older_extractors_are_not_used(self):
+        check_dicom(self.plan, 7, self.truth_table, cache=self.cache, skip_unchecked=False)
+        with mock.patch('code.extraction_cache.EXTRACTOR_VERSION', EXTRACTOR_VERSION + 1):
+            self.assertIsNone(self.cache.lookup(self.plan, 7, {}))
+
+    def test_entries_are_per_case(self):
+        check_dicom(self.plan, 7, self.truth_table, cache=self.cache)
+        self.assertIsNone(self.cache.lookup(self.plan, 6, {}))
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,42 @@
+''' Tests for indexing the DICOMs in a folder'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from code import strings
+from code.folder_index import FolderIndex
+
+class TestFolderIndex(unittest.TestCase):
+
+    def test_plans(self):
+        index = FolderIndex('./data/Input/more-input')
+        plans = [os.path.basename(entry.path) for entry in index.plans()]
+        self.assertEqual(plans, ['YellowLvlIII_1a.dcm', 'YellowLvlIII_1c6FFF.dcm', 'YellowLvlIII_2a.dcm', 'YellowLvlIII_3a.dcm',
+                                 'YellowLvlIII_3c6FFF.dcm', 'YellowLvlIII_8aColls5.dcm', 'YellowLvlIII_8b.dcm'])
+        self.assertEqual(index.dose_struct_index(), {})
+
+    def test_entry(self):
+        index = FolderIndex('./data/Input')
+        entry = index.entry('data/Input/YellowLvlIII_7a.dcm')
+        self.assertEqual(entry.modality, strings.RTPLAN)
+        self.assertEqual(entry.study_uid, '1.2.840.113619.2.278.3.380434001.132.1565818860.396')
+        self.assertEqual(entry.referenced_uids, ('2.16.840.1.114337.1.1.1597370746.0',))
+        self.assertEqual(entry.size, os.path.getsize('data/Input/YellowLvlIII_7a.dcm'))
+        self.assertEqual([entry.path for entry in index.referencing('2.16.840.1.114337.1.1.1597370746.0')],
+                         [os.path.normpath('data/Input/YellowLvlIII_7a.dcm')])
+
+    def test_refresh(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        index = FolderIndex(folder)
+        self.assertEqual(index.plans(), [])
+
+        shutil.copy('data/Input/YellowLvlIII_7a.dcm', folder)
+        changed = index.refresh()
+        self.assertEqual([entry.path for entry in changed], [os.path.join(folder, 'YellowLvlIII_7a.dcm')])
+        # Nothing has changed since the last scan
+        self.assertEqual(index.refresh(), [])
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,83 @@
+''' Tests for writing reports of the extracted parameters'''
+
+import os
+import csv
+import json
+import shutil
+import tempfile
+import unittest
+from code.outputter import output, open_batch_output
+
+class TestOutputter(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.parameters = {"mode": "IMRT", "SSD": [85.19, 89.42]}
+        self.evaluations = {"mode": "NOT APPLICABLE", "SSD": "PASS"}
+        self.solutions = {"mode": "IMRT,VMAT,TOMO", "SSD": "85,89"}
+
+    def read_rows(self, filepath):
+        with open(filepath, newline='', encoding='utf-8') as csv_file:
+            return list(csv.reader(csv_file))
+
+    def test_output_csv(self):
+        filepath = output(self.parameters, self.evaluations, self.solutions, os.path.join(self.folder, "plan"), "csv")
+        self.assertEqual(filepath, os.path.join(self.folder, "plan.csv"))
+        self.assertEqual(self.read_rows(filepath), [
+            ["Parameter Name", "Parameter Value", "Parameter Evaluation", "Parameter Solution"],
+            ["mode", "IMRT", "NOT APPLICABLE", "IMRT,VMAT,TOMO"],
+            ["SSD", "[85.19, 89.42]", "PASS", "85,89"]])
+
+    def test_batch_csv(self):
+        batch_output = open_batch_output(os.path.join(self.folder, "batch"), "csv")
+        batch_output.write("a.dcm", self.parameters, self.evaluations, self.solutions)
+        # Rows are available as soon as a plan has been written
+        self.assertEqual(len(self.read_rows(batch_output.filepath)), 3)
+        batch_output.write("b.dcm", self.parameters, self.evaluations, self.solutions)
+        batch_output.close()
+
+        rows = self.read_rows(os.path.join(self.folder, "batch.csv"))
+        self.assertEqual(rows[0], ["Plan", "Parameter Name", "Parameter Value", "Parameter Evaluation", "Parameter Solution"])
+        self.assertEqual([row[0] for row in rows[1:]], ["a.dcm", "a.dcm", "b.dcm", "b.dcm"])
+
+    def test_csv_matches_pandas_format(self):
+        # Exactly what the pandas DataFrame.to_csv the reports used to be written with gave for these values
+        parameters = {"mode": "IMRT", "SSD": [85.19, 89.42], "wedge": None, "gantry": 90.0}
+        evaluations = {"mode": "NOT APPLICABLE", "SSD": "PASS", "wedge": "FAIL", "gantry": True}
+        solutions = {"mode": "IMRT,VMAT,TOMO", "SSD": "85,89", "wedge": '30,"no wedge"', "gantry": "-"}
+        filepath = output(parameters, evaluations, solutions, os.path.join(self.folder, "plan"), "csv")
+        with open(filepath, 'rb') as csv_file:
+            written = csv_file.read()
+        expected = os.linesep.join([
+            'Parameter Name,Parameter Value,Parameter Evaluation,Parameter Solution',
+            'mode,IMRT,NOT APPLICABLE,"IMRT,VMAT,TOMO"',
+            'SSD,"[85.19, 89.42]",PASS,"85,89"',
+            'wedge,,FAIL,"30,""no wedge"""',
+            'gantry,90.0,True,-',
+            ''])
+        self.assertEqual(written, expected.encode('utf-8'))
+
+    def test_output_json(self):
+        details = {"plan": "data/plan.dcm", "case": 7, "timings": {"read": 0.01}}
+        filepath = output(self.parameters, self.evaluations, self.solutions, os.path.join(self.folder, "plan"), "json", details)
+        with open(filepath, encoding='utf-8') as json_file:
+            record = json.load(json_file)
+        self.assertEqual(record["plan"], "data/plan.dcm")
+        self.assertEqual(record["case"], 7)
+        self.assertEqual(record["parameters"], self.parameters)
+        self.assertEqual(record["evaluations"], self.evaluations)
+        self.assertEqual(record["solutions"], self.solutions)
+
+    def test_batch_json_lines(self):
+        batch_output = open_batch_output(os.path.join(self.folder, "batch"), "json")
+        batch_output.write("a.dcm", self.parameters, self.evaluations, self.solutions, {"case": 7})
+        batch_output.write("b.dcm", self.parameters, self.evaluations, self.solutions, {"case": 8})
+        batch_output.close()
+
+        with open(os.path.join(self.folder, "batch.jsonl"), encoding='utf-8') as json_file:
+            records = [json.loads(line) for line in json_file]
+        self.assertEqual([(record["plan"], record["case"]) for record in records], [("a.dcm", 7), ("b.dcm", 8)])
+
+if __name__ == '__main__' :
+    unittest.main()
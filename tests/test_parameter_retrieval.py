@@ -1,10 +1,18 @@
 ''' Tests for Parameter Extraction and Evaluation'''
 
+import shutil
+import tempfile
 import unittest
 import pydicom
+import numpy as np
 from code import strings
-from code.parameters.parameter_retrieval import extract_parameters, evaluate_parameters
+from code.parameters.parameter_retrieval import extract_parameters, evaluate_parameters, extraction_order, parameters_to_extract, PARAMETERS
+from code.parameters.evaluator_functions import evaluator_functions
+from code.parameters.extractor_functions import _aperture_sizes
+from code.parameters.plan_context import PlanContext
+from code.truth_table_reader import read_truth_table
 from app import dose_struct_references
+from tests.synthetic import write_study, plan_dataset
 
 class TestIMRTExtractionValues(unittest.TestCase): 
     ''' Tests for verifying the correct values are extracted for IMRT file
@@ -32,6 +40,10 @@ class TestIMRTExtractionValues(unittest.TestCase):
     def test_energy(self): 
         self.assertEqual(self.extracted[strings.energy], '6')
 
+    def test_field_size(self):
+        # Each beam is shaped by its MLC within the Y jaws
+        self.assertEqual(self.extracted[strings.field_size], '9.4x4.6,9x1.7,8.8x1.3,8.8x3.3,8.5x3')
+
 class TestVMATExtractionValues(unittest.TestCase): 
     ''' Tests for verifying the correct values are extracted
     The 'correct' answers are derived from the vendor report in Documents/Input/7b.pdf
@@ -65,6 +77,97 @@ class TestVMATExtractionValues(unittest.TestCase):
         self.assertEqual(self.extracted[strings.energy], '6')
 
 
+class TestModeDetection(unittest.TestCase):
+
+    def test_arc_moving_less_than_a_degree(self):
+        # A 1000 control point arc moves about 0.36 degrees between control points, so its first two gantry angles are the same whole number
+        dataset = plan_dataset(vmat=True, control_points=1000)
+        first, second = [float(control_point.GantryAngle) for control_point in dataset.BeamSequence[0].ControlPointSequence[:2]]
+        self.assertEqual(int(first), int(second))
+        self.assertEqual(PlanContext(dataset, {}, 7).mode, strings.VMAT)
+
+    def test_static_beams(self):
+        self.assertEqual(PlanContext(plan_dataset(beams=5), {}, 7).mode, strings.IMRT)
+
+class TestStudyExtractionValues(unittest.TestCase):
+    ''' Tests for the parameters extracted from a plan's structure set, using a synthetic study of the phantom's points'''
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        points = {"1": (-0.5, -105.1, -0.1), "3": (-0.5, -31.8, -7.6), "surf": (-0.5, -180.0, -0.1), "10": (-0.5, 500.0, 0.0)}
+        self.study = write_study(self.folder, points=points, overrides={"bone": 1.85}, dose_shape=(10, 200, 200),
+                                 isocentre=(-0.5, -180.0, -0.2), prescription_points=[(-0.4, -31.8, -7.6)])
+        self.dose_struct_index = dose_struct_references(self.folder)
+        self.dataset = pydicom.dcmread(self.study[strings.RTPLAN])
+        self.extracted = extract_parameters(self.dataset, self.dose_struct_index, 1)
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_prescription_point(self):
+        self.assertEqual(self.extracted[strings.prescription_point], '3')
+
+    def test_isocentre_point(self):
+        self.assertEqual(self.extracted[strings.isocenter_point], 'surf')
+
+    def test_override(self):
+        self.assertEqual(self.extracted[strings.override], 'bone')
+
+    def test_meas(self):
+        # The synthetic dose falls off from 2 Gy at (0, 0, 0)
+        doses = dict(item.split(":") for item in self.extracted[strings.meas].split(","))
+        self.assertEqual(list(doses), ["1", "3", "surf", "10"])
+        self.assertAlmostEqual(float(doses["3"]), 2.0 * np.exp(-(0.25 + 31.8 ** 2 + 7.6 ** 2) / 2e4), places=2)
+        self.assertEqual(doses["10"], strings.OUTSIDE_DOSE_GRID)
+
+    def test_passes_case_1(self):
+        # The truth table accepts "1 or 3" as the prescription point of case 1
+        evaluations = evaluate_parameters(self.extracted, read_truth_table("data/truth_table_lvl3.csv"), 1)
+        for parameter in [strings.prescription_point, strings.isocenter_point, strings.override]:
+            self.assertEqual(evaluations[parameter], strings.PASS)
+        # Measurement point 10 is outside the dose grid
+        self.assertEqual(evaluations[strings.meas], strings.FAIL)
+
+    def test_without_structure_set(self):
+        extracted = extract_parameters(self.dataset, {}, 1)
+        self.assertEqual(extracted[strings.override], strings.NO_STRUCTURE_SET)
+        evaluations = evaluate_parameters(extracted, read_truth_table("data/truth_table_lvl3.csv"), 1)
+        self.assertEqual(evaluations[strings.override], strings.NO_STRUCTURE_SET)
+
+    def test_field_size(self):
+        # The synthetic MLC is open 10 cm across every leaf pair, within Y jaws 10 cm apart
+        self.assertEqual(self.extracted[strings.field_size], '10x10,10x10,10x10,10x10,10x10')
+
+    def test_study_files_are_shared(self):
+        # Plans of the same study get the same (already loaded) structure set and dose
+        first = PlanContext(self.dataset, self.dose_struct_index, 1)
+        second = PlanContext(self.dataset, self.dose_struct_index, 2)
+        self.assertIs(first.structure_set, second.structure_set)
+        self.assertIs(first.dose_grid, second.dose_grid)
+        self.assertEqual(first.dose_grid.shape, (10, 200, 200))
+
+class TestSelectiveExtraction(unittest.TestCase):
+
+    def test_extraction_order(self):
+        # Mode is always extracted, and parameters come after those they require
+        self.assertEqual(extraction_order([strings.SSD]), [strings.mode, strings.gantry, strings.SSD])
+        self.assertEqual(extraction_order([strings.wedge]), [strings.mode, strings.wedge])
+        self.assertEqual(extraction_order(), PARAMETERS)
+
+    def test_unchecked_parameters_are_skipped(self):
+        rules = read_truth_table('data/truth_table_lvl3.csv').case_rules(7)
+        self.assertTrue(rules[strings.field_size].any)
+        self.assertNotIn(strings.field_size, parameters_to_extract(rules))
+        self.assertIn(strings.field_size, parameters_to_extract(rules, skip_unchecked=False))
+        self.assertEqual(parameters_to_extract(rules, [strings.SSD, strings.field_size]), [strings.mode, strings.gantry, strings.SSD])
+
+    def test_only_selected_parameters_are_extracted(self):
+        dataset = pydicom.dcmread('./data/Input/YellowLvlIII_7a.dcm', force=True)
+        extracted = extract_parameters(dataset, {}, 7, parameters=[strings.SSD])
+        self.assertEqual(list(extracted), [strings.mode, strings.gantry, strings.SSD])
+        self.assertEqual(extracted[strings.SSD], extract_parameters(dataset, {}, 7)[strings.SSD])
+
 class TestEvaluation(unittest.TestCase): 
     ''' Tests for verifying that parameter sets are passed correctly
     Each case (from 1-17) of the truth table has its own test against a set of parameters that *should* pass.
@@ -77,6 +180,7 @@ class TestEvaluation(unittest.TestCase):
     def setUpClass(self): 
         from code.truth_table_reader import read_truth_table
         self.truth_table = read_truth_table("data/truth_table_lvl3.csv")
+        self.folder = tempfile.mkdtemp()
 
         # If all parameters pass, evaluate_parameters() should return this.
         # We'll use this to compare with the actual results in our tests below
@@ -96,6 +200,10 @@ class TestEvaluation(unittest.TestCase):
             strings.energy                              : strings.NOT_APPLICABLE
         }
 
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
     def test_passing_lvl3_all(self):
         # Test that the evaluation passes all cases when values are directly retrieved from the truth table
         num_cases = 17
@@ -131,6 +239,69 @@ class TestEvaluation(unittest.TestCase):
         failing_data[strings.prescription_dose] = "0"
         self.assertNotEqual(evaluate_parameters(failing_data, self.truth_table, case), self.pass_evaluation)
 
+    def test_vmat_ssd(self):
+        # A dense arc with the truth table's SSD at every truth table gantry angle should pass,
+        # and moving the SSD just next to one of those angles should fail
+        case = 7
+        gantry = [round(angle * 0.1, 1) for angle in range(3600)]
+        ssd = [90.0] * len(gantry)
+        for angle, table_ssd in [(60, 89), (0, 93), (300, 89)]:
+            for i, control_point_angle in enumerate(gantry):
+                if abs(control_point_angle - angle) < 0.3:
+                    ssd[i] = table_ssd
+        parameters = {strings.mode: strings.VMAT, strings.gantry: gantry, strings.SSD: ssd}
+        rules = self.truth_table.case_rules(case)
+        context = {"parameter_values": parameters, "rules": rules, "case": case, "file_type": strings.VMAT}
+        self.assertEqual(evaluator_functions[strings.SSD](ssd, rules[strings.SSD], **context), strings.PASS)
+
+        ssd[gantry.index(60.2)] = 87.5
+        self.assertEqual(evaluator_functions[strings.SSD](ssd, rules[strings.SSD], **context), strings.FAIL)
+
+    def test_field_size(self):
+        case = 2
+        rules = self.truth_table.case_rules(case)
+        context = {"parameter_values": {}, "rules": rules, "case": case, "file_type": strings.IMRT}
+        evaluate = lambda field_size: evaluator_functions[strings.field_size](field_size, rules[strings.field_size], **context)
+        self.assertEqual(evaluate("10x6,10x12,10x6"), strings.PASS)
+        # Fewer (or more) beams than the truth table has sizes for
+        self.assertEqual(evaluate("10x6"), strings.FAIL)
+        self.assertEqual(evaluate("10x6,10x12,10x6,10x6"), strings.FAIL)
+        # A field with no jaw or MLC limits on a side
+        self.assertEqual(evaluate(f"10x6,{strings.Not_Extracted},10x6"), strings.FAIL)
+
+    def test_structures(self):
+        rules = self.truth_table.case_rules(1)
+        evaluate = lambda parameter, value: evaluator_functions[parameter](value, rules[parameter])
+        self.assertEqual(evaluate(strings.prescription_point, "1"), strings.PASS)
+        self.assertEqual(evaluate(strings.prescription_point, "5"), strings.FAIL)
+        self.assertEqual(evaluate(strings.isocenter_point, "SURF"), strings.PASS)
+        self.assertEqual(evaluate(strings.isocenter_point, "surf,1"), strings.FAIL)
+        self.assertEqual(evaluate(strings.override, "bone,lungs"), strings.FAIL)
+        self.assertEqual(evaluator_functions[strings.override](strings.no_override, self.truth_table.case_rules(2)[strings.override]), strings.PASS)
+
+    def test_mlc_field_size(self):
+        # A 1.5 x 1.5 cm field, as in case 14
+        dataset = pydicom.dcmread(write_study(self.folder, name="small", field_size=(1.5, 1.5), dose_shape=None)[strings.RTPLAN])
+        parameters = extract_parameters(dataset, {}, 14)
+        self.assertEqual(parameters[strings.field_size], ','.join(['1.5x1.5'] * 5))
+        self.assertEqual(evaluate_parameters(parameters, self.truth_table, 14)[strings.field_size], strings.PASS)
+
+    def test_aperture_sizes(self):
+        boundaries = np.arange(-20.0, 21.0, 10.0)
+        # Pairs closed except the middle two, which open 30 mm, and X jaws that cut the opening down to 20 mm
+        leaves = np.array([[0, -10, -15, 0, 0.5, 10, 15, 0], [0, -10, -15, 0, 0.5, 10, 15, 0]])
+        jaws = np.array([[-np.inf, np.inf, -100, 100], [-10, 10, -5, 100]])
+        sizes = _aperture_sizes(jaws, leaves, boundaries)
+        np.testing.assert_array_equal(sizes, [[20, 30], [15, 20]])
+        # The same MLC moving along Y
+        np.testing.assert_array_equal(_aperture_sizes(jaws[:, [2, 3, 0, 1]], leaves, boundaries, mlc_y=True), [[30, 20], [20, 15]])
+
+    def test_meas(self):
+        rule = self.truth_table.case_rules(3)[strings.meas]
+        self.assertEqual(evaluator_functions[strings.meas]("3:1.992,5:0.871,ISO:2.000", rule), strings.PASS)
+        self.assertEqual(evaluator_functions[strings.meas]("3:1.992,ISO:2.000", rule), strings.FAIL)
+        self.assertEqual(evaluator_functions[strings.meas](f"3:1.992,5:{strings.OUTSIDE_DOSE_GRID}", rule), strings.FAIL)
+
 
 if __name__ == '__main__' : 
     unittest.main()
@@ -0,0 +1,74 @@
+''' Tests for overlapping reading plans with checking them'''
+
+import os
+import time
+import random
+import shutil
+import tarfile
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from code.archives import member_location
+from code.discovery import discover
+from code.pipeline import pipeline
+from code.processing import run_checks
+from code.truth_table_reader import read_truth_table
+
+def slow_fetch(job):
+    time.sleep(random.uniform(0, 0.01))
+    if job == 3:
+        raise OSError("unreadable")
+    return job * 10
+
+def check(job, fetched):
+    return job, fetched
+
+class TestPipeline(unittest.TestCase):
+
+    def test_results_in_order(self):
+        with ThreadPoolExecutor(2) as executor:
+            results = list(pipeline(range(20), slow_fetch, check, executor, prefetch=4, concurrency=2))
+        self.assertEqual([job for job, _ in results], list(range(20)))
+        self.assertEqual(results[2], (2, 20))
+        self.assertIsInstance(results[3][1], OSError)
+
+    def test_stopping_early(self):
+        with ThreadPoolExecutor(1) as executor:
+            results = pipeline(iter(range(1000)), slow_fetch, check, executor, prefetch=2)
+            self.assertEqual(next(results), (0, 0))
+            results.close()
+
+    def test_errors_are_raised(self):
+        def failing_jobs():
+            yield 1
+            raise RuntimeError("couldn't index")
+        with ThreadPoolExecutor(1) as executor:
+            with self.assertRaises(RuntimeError):
+                list(pipeline(failing_jobs(), slow_fetch, check, executor, prefetch=2))
+
+    def test_run_checks_with_prefetch(self):
+        folder = tempfile.mkdtemp()
+        try:
+            with tarfile.open(os.path.join(folder, 'export.tar'), 'w') as archive:
+                for name in ['YellowLvlIII_7a.dcm', 'YellowLvlIII_7b.dcm']:
+                    archive.add(os.path.join('data/Input', name), name)
+            truth_table = read_truth_table('data/truth_table_lvl3.csv')
+            dose_struct_indices = {}
+            jobs = []
+            for found, index in discover(folder):
+                dose_struct_indices[found] = index.dose_struct_index()
+                jobs += [(entry.path, 7, found) for entry in index.plans()]
+            jobs.append(('data/Input/YellowLvlIII_7a.dcm', 7, 'data/Input'))
+            jobs.append((member_location(os.path.join(folder, 'export.tar'), 'missing.dcm'), 7, folder))
+
+            expected = list(run_checks(jobs, truth_table, dose_struct_indices))
+            for workers in [1, 2]:
+                checked = list(run_checks(jobs, truth_table, dose_struct_indices, workers, prefetch=3))
+                self.assertEqual([(location, result and result[:3]) for location, result, _ in checked],
+                                 [(location, result and result[:3]) for location, result, _ in expected])
+            self.assertIsNotNone(checked[-1][2])
+        finally:
+            shutil.rmtree(folder)
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,43 @@
+''' Tests for checking a plan against several truth tables, and for checking only some of its parameters'''
+
+import unittest
+from unittest import mock
+from code import strings
+from code.processing import check_dicom, evaluate_result, plan_tags, PLAN_TAGS
+from code.parameters.parameter_retrieval import evaluate_parameters
+from code.truth_table_reader import read_truth_table
+
+class TestEvaluateResult(unittest.TestCase):
+
+    def test_evaluated_against_another_table(self):
+        level3 = read_truth_table('data/truth_table_lvl3.csv')
+        level2 = read_truth_table('data/truth_table_lvl2.csv')
+        result = check_dicom('data/Input/YellowLvlIII_7a.dcm', 7, level3)
+        with mock.patch('code.processing.extract_parameters') as extract_parameters:
+            parameters, evaluations, solutions, details = evaluate_result(result, level2)
+            extract_parameters.assert_not_called()
+        self.assertIs(parameters, result[0])
+        self.assertEqual(evaluations, evaluate_parameters(result[0], level2, 7))
+        self.assertEqual(solutions, level2.solutions(7))
+        self.assertEqual((result[3]["truth_table"], details["truth_table"]), (level3.name, level2.name))
+        self.assertEqual(details["case"], 7)
+
+class TestSelectedParameters(unittest.TestCase):
+
+    def test_unchecked_parameters_are_reported(self):
+        truth_table = read_truth_table('data/truth_table_lvl3.csv')
+        parameters, evaluations, _, _ = check_dicom('data/Input/YellowLvlIII_7a.dcm', 7, truth_table)
+        # Case 7 accepts any field size
+        self.assertEqual((parameters[strings.field_size], evaluations[strings.field_size]), (strings.NOT_CHECKED, strings.NOT_CHECKED))
+        self.assertEqual(list(parameters), list(check_dicom('data/Input/YellowLvlIII_7a.dcm', 7, truth_table, skip_unchecked=False)[0]))
+
+    def test_selected_parameters(self):
+        truth_table = read_truth_table('data/truth_table_lvl3.csv')
+        parameters, evaluations, _, _ = check_dicom('data/Input/YellowLvlIII_7a.dcm', 7, truth_table, selected_parameters=(strings.SSD,))
+        # SSD is evaluated with the plan's mode and gantry angles, so they're checked too
+        self.assertEqual(list(parameters), [strings.mode, strings.gantry, strings.SSD])
+        self.assertEqual(evaluations[strings.SSD], strings.PASS)
+        self.assertTrue(set(plan_tags((strings.wedge,))) < set(PLAN_TAGS))
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,43 @@
+''' Tests for timing how long each stage and parameter of checking a plan takes'''
+
+import unittest
+from code import strings
+from code.profiling import Profile, percentile
+from code.processing import check_dicom
+from code.truth_table_reader import read_truth_table
+
+class TestProfiling(unittest.TestCase):
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([3], 90), 3)
+        self.assertEqual(percentile([1, 2, 3], 50), 2)
+
+    def test_summary(self):
+        profile = Profile()
+        for seconds in [0.001, 0.002, 0.003, 0.004]:
+            profile.add({"timings": {"read": seconds * 10, "extract": seconds}, "extractor_timings": {"SSD": seconds}})
+        profile.add_timing("stage", "output", 0.5)
+
+        rows = profile.summary_rows()
+        # Slowest first within each group, and stages before extractors
+        self.assertEqual([(row[0], row[1]) for row in rows],
+                         [("stage", "output"), ("stage", "read"), ("stage", "extract"), ("extractor", "SSD")])
+        self.assertEqual(rows[3][2:], [4, 0.01, 2.5, 2.0, 4.0, 4.0, 4.0])
+
+    def test_check_dicom_timings(self):
+        truth_table = read_truth_table("data/truth_table_lvl3.csv")
+        parameters, evaluations, _, details = check_dicom("data/Input/YellowLvlIII_7a.dcm", 7, truth_table, profile=True)
+        self.assertEqual(set(details["timings"]), {"read", "extract", "evaluate"})
+        # Parameters that the case accepts any value for are skipped
+        self.assertEqual(set(details["extractor_timings"]), set(name for name, value in parameters.items() if value != strings.NOT_CHECKED))
+        # Parameters that weren't extracted aren't evaluated
+        self.assertTrue(set(details["evaluator_timings"]) < set(evaluations))
+
+        details = check_dicom("data/Input/YellowLvlIII_7a.dcm", 7, truth_table)[3]
+        self.assertNotIn("extractor_timings", details)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+''' Tests for saving and querying the results of audits'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from code import strings
+from code.results_store import ResultsStore, COLUMNS
+from code.processing import check_dicom
+from code.truth_table_reader import read_truth_table
+
+class TestResultsStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.results_db = os.path.join(self.folder, 'results.sqlite3')
+        self.truth_table = read_truth_table('data/truth_table_lvl3.csv')
+        self.plan = 'data/Input/YellowLvlIII_7a.dcm'
+        self.result = check_dicom(self.plan, 7, self.truth_table)
+
+    def test_results_are_saved_in_batches(self):
+        store = ResultsStore(self.results_db, batch_plans=2)
+        self.addCleanup(store.close)
+        with mock.patch('code.results_store.datetime') as clock:
+            clock.now.return_value.isoformat.return_value = "2026-09-30 17:00:00"
+            store.add(self.plan, self.result, self.truth_table.name)
+            self.assertEqual(len(store.pending), len(self.result[0]))
+            store.add(self.plan, self.result, self.truth_table.name)
+        # The batch was full, so both plans were saved together
+        self.assertEqual(store.pending, [])
+
+        rows = [dict(zip(COLUMNS, row)) for row in store.query(case_number=7, parameter=strings.SSD)]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["plan_uid"], self.result[3]["plan_uid"])
+        self.assertEqual(rows[0]["truth_table"], 'data/truth_table_lvl3.csv')
+        self.assertEqual(rows[0]["evaluation"], self.result[1][strings.SSD])
+
+    def test_query_filters(self):
+        store = ResultsStore(self.results_db)
+        self.addCleanup(store.close)
+        with mock.patch('code.results_store.datetime') as clock:
+            clock.now.return_value.isoformat.return_value = "2026-09-30 17:00:00"
+            store.add(self.plan, self.result, self.truth_table.name)
+        failed = [parameter for parameter, evaluation in self.result[1].items() if evaluation == strings.FAIL]
+        self.assertEqual([row[5] for row in store.query(evaluation=strings.FAIL)], failed)
+        # A date includes the whole of that day
+        self.assertEqual(len(list(store.query(until="2026-09-30"))), len(self.result[0]))
+        self.assertEqual(list(store.query(since="2026-10-01")), [])
+        self.assertEqual(list(store.query(case_number=6)), [])
+        self.assertEqual(len(list(store.query(plan=self.result[3]["plan_uid"], truth_table="lvl3"))), len(self.result[0]))
+        self.assertEqual(list(store.query(plan="7b")), [])
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,84 @@
+''' Tests for checking plans through the local service'''
+
+import json
+import threading
+import unittest
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+from code import strings
+from code.service import AuditService, make_server
+from code.truth_table_reader import read_truth_table
+
+PLAN = 'data/Input/YellowLvlIII_7a.dcm'
+
+class TestService(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.service = AuditService(read_truth_table('data/truth_table_lvl3.csv'))
+        self.server = make_server(self.service, 0)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+
+    def request(self, path, body=None, content_type="application/json"):
+        request = Request(self.url + path, data=body, headers={"Content-Type": content_type} if body is not None else {})
+        try:
+            with urlopen(request) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as error:
+            return error.code, json.loads(error.read())
+
+    def test_check_path(self):
+        status, record = self.request("/check", json.dumps({"path": PLAN, "case": 7}).encode())
+        self.assertEqual(status, 200)
+        self.assertEqual(record["plan"], PLAN)
+        self.assertEqual(record["case"], 7)
+        self.assertEqual(record["parameters"][strings.mode], strings.IMRT)
+        self.assertEqual(set(record["evaluations"]), set(record["parameters"]))
+
+    def test_check_upload(self):
+        with open(PLAN, 'rb') as plan:
+            data = plan.read()
+        status, record = self.request("/check?name=YellowLvlIII_7a.dcm", data, "application/dicom")
+        self.assertEqual(status, 200)
+        # The case is detected from the name, as it would be from the file
+        self.assertEqual((record["case"], record["case_source"]), (7, "filename"))
+        _, checked = self.request("/check", json.dumps({"path": PLAN, "case": 7}).encode())
+        self.assertEqual(record["parameters"], checked["parameters"])
+
+    def test_errors(self):
+        self.assertEqual(self.request("/check", json.dumps({"path": "data/Input/missing.dcm"}).encode())[0], 404)
+        self.assertEqual(self.request("/check", b"not json")[0], 400)
+        self.assertEqual(self.request("/check", json.dumps({"path": PLAN, "case": "seven"}).encode())[0], 400)
+        status, record = self.request("/check", json.dumps({"path": PLAN, "case": 99}).encode())
+        self.assertEqual(status, 422)
+        self.assertIn("Invalid case number", record["error"])
+
+    def test_upload_that_is_not_a_dicom(self):
+        status, record = self.request("/check?case=7", b"not a dicom", "application/dicom")
+        self.assertEqual((status, record), (422, {"error": "Not a DICOM RTPLAN: it has no Modality"}))
+
+    def test_folder_that_is_a_file(self):
+        with open(PLAN, 'rb') as plan:
+            data = plan.read()
+        status, record = self.request(f"/check?case=7&folder={PLAN}", data, "application/dicom")
+        self.assertEqual((status, record), (400, {"error": f"Not a folder or archive: {PLAN}"}))
+
+    def test_selected_parameters(self):
+        service = AuditService(read_truth_table('data/truth_table_lvl3.csv'), selected_parameters=(strings.SSD,))
+        self.addCleanup(service.close)
+        record = service.check_path(PLAN, 7)
+        self.assertEqual(list(record["parameters"]), [strings.mode, strings.gantry, strings.SSD])
+
+    def test_health(self):
+        status, record = self.request("/health")
+        self.assertEqual((status, record["status"]), (200, "ok"))
+
+if __name__ == '__main__' :
+    unittest.main()
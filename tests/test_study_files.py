@@ -0,0 +1,61 @@
+''' Tests for loading structure sets and dose grids, and looking up the dose at points'''
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+import numpy as np
+from code import strings
+from code.archives import member_location
+from code.study_files import load_structure_set, load_dose_grid
+from tests.synthetic import dose_dataset, save, write_study
+
+# Trilinear interpolation is exact for a dose that changes linearly
+def linear_dose(x, y, z):
+    return 1 + 0.01 * x + 0.02 * y + 0.03 * z
+
+class TestStudyFiles(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.study = write_study(self.folder, points={"ISO": (0, 0, 0), "3": (10, 20, 5)}, overrides={"lungs": 0.3}, dose_shape=None)
+        self.dose_path = save(dose_dataset("1.2.3", shape=(10, 20, 30), spacing=2.5, dose=linear_dose), os.path.join(self.folder, "linear.dcm"))
+        self.zip_path = os.path.join(self.folder, "doses.zip")
+        with zipfile.ZipFile(self.zip_path, "w") as archive:
+            archive.write(self.dose_path, "linear.dcm")
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_structure_set(self):
+        structure_set = load_structure_set(self.study[strings.RTSTRUCT])
+        self.assertEqual(structure_set.points, {"ISO": (0, 0, 0), "3": (10, 20, 5)})
+        self.assertEqual(structure_set.overrides, {"lungs": 0.3})
+        self.assertEqual(structure_set.point_at((10.5, 20, 5)), "3")
+        self.assertIsNone(structure_set.point_at((5, 5, 5)))
+        self.assertIs(load_structure_set(self.study[strings.RTSTRUCT]), structure_set)
+
+    def test_dose_at(self):
+        dose_grid = load_dose_grid(self.dose_path)
+        positions = np.array([[0, 0, 0], [1.3, -2.2, 3.1], [10, 10, -5], [1000, 0, 0]])
+        doses = dose_grid.dose_at(positions)
+        np.testing.assert_allclose(doses[:3], linear_dose(*positions[:3].T), atol=1e-3)
+        self.assertTrue(np.isnan(doses[3]))
+        # The dose values are only read (through a memory map) when they're used
+        self.assertIsInstance(dose_grid.values, np.memmap)
+
+    def test_dose_in_archive(self):
+        dose_grid = load_dose_grid(member_location(self.zip_path, "linear.dcm"))
+        self.assertAlmostEqual(dose_grid.dose_at([1.3, -2.2, 3.1])[0], linear_dose(1.3, -2.2, 3.1), places=3)
+
+    def test_point_doses(self):
+        dose_grid = load_dose_grid(self.dose_path)
+        point_doses = dose_grid.point_doses(load_structure_set(self.study[strings.RTSTRUCT]))
+        self.assertEqual(list(point_doses), ["ISO", "3"])
+        self.assertAlmostEqual(point_doses["3"], linear_dose(10, 20, 5), places=3)
+
+if __name__ == '__main__' :
+    unittest.main()
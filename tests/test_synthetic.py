@@ -0,0 +1,44 @@
+''' Tests that the synthetic DICOMs used by the benchmarks are extracted like real plans'''
+
+import shutil
+import tempfile
+import unittest
+from code import strings
+from code.folder_index import FolderIndex
+from code.processing import check_dicom
+from code.truth_table_reader import read_truth_table
+from tests.synthetic import write_study
+
+class TestSynthetic(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(self):
+        self.folder = tempfile.mkdtemp()
+        self.truth_table = read_truth_table('data/truth_table_lvl3.csv')
+        self.static = write_study(self.folder, name='static', gantry_angles=[0, 72, 144, 216, 288], ssd=88.5, dose_shape=None)
+        self.vmat = write_study(self.folder, name='vmat', vmat=True, control_points=1000, dose_shape=(4, 8, 8))
+
+    @classmethod
+    def tearDownClass(self):
+        shutil.rmtree(self.folder)
+
+    def test_index(self):
+        index = FolderIndex(self.folder)
+        self.assertEqual([entry.path for entry in index.plans()], [self.static[strings.RTPLAN], self.vmat[strings.RTPLAN]])
+        self.assertEqual(len(index.dose_struct_index()), 2)
+
+    def test_static_plan(self):
+        parameters = check_dicom(self.static[strings.RTPLAN], 7, self.truth_table)[0]
+        self.assertEqual(parameters[strings.mode], strings.IMRT)
+        self.assertEqual(parameters[strings.gantry], '0,72,144,216,288')
+        self.assertEqual(parameters[strings.SSD], [88.5] * 5)
+        self.assertEqual(parameters[strings.prescription_dose], '50/25/MU')
+
+    def test_vmat_plan(self):
+        parameters = check_dicom(self.vmat[strings.RTPLAN], 7, self.truth_table)[0]
+        self.assertEqual(parameters[strings.mode], strings.VMAT)
+        self.assertEqual(len(parameters[strings.gantry]), 1000)
+        self.assertEqual(parameters[strings.gantry][:2], [181.0, 181.4])
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -1,7 +1,11 @@
 ''' Test that the truth table reader function parses the csv input correctly'''
 
+import os
+import shutil
+import tempfile
 import unittest
-from code.truth_table_reader import read_truth_table
+from code import strings
+from code.truth_table_reader import read_truth_table, TruthTable
 
 class TestTruthTableReader(unittest.TestCase):
 
@@ -52,3 +56,32 @@ class TestTruthTableReader(unittest.TestCase):
         for parameter in self.truth_table:
             for i in range(0, len(self.truth_table['case'])):
                 self.assertEqual(tt[parameter][i].upper(), self.truth_table[parameter][i].upper())
+
+    def test_compiled_rules(self):
+        tt = read_truth_table('data/truth_table_lvl3.csv')
+        self.assertEqual(tt.cases, 17)
+        self.assertEqual(tt.errors, [])
+        rules = tt.case_rules(6)
+        self.assertEqual(rules[strings.SSD].items, (None, 89, 93, 89, None))
+        self.assertEqual(rules[strings.gantry].items, (150, 60, 0, 300, 210))
+        self.assertTrue(rules[strings.collimator].negated)
+        self.assertEqual(rules[strings.prescription_dose].items, ('50', '25', None))
+        self.assertTrue(tt.case_rules(9)[strings.gantry].any)
+
+    def test_format_errors(self):
+        columns = dict((parameter, list(values[:2])) for parameter, values in self.truth_table.items())
+        columns[strings.gantry][0] = '0,ninety'
+        columns[strings.collimator][1] = '*'
+        tt = TruthTable(columns)
+        self.assertEqual([(case, parameter) for case, parameter, message in tt.errors], [(1, strings.gantry), (2, strings.collimator)])
+
+    def test_empty_and_short_rows(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        table_file = os.path.join(folder, 'truth_table.csv')
+        with open(table_file, 'w', newline='', encoding='utf-8') as csv_file:
+            csv_file.write('case,gantry,SSD\r\n1,,100\r\n\r\n2,90\r\n')
+        tt = read_truth_table(table_file)
+        # Blank lines are skipped, and missing cells at the end of a row are read as empty
+        self.assertEqual(tt, {'case': ['1', '2'], 'gantry': ['', '90'], 'SSD': ['100', '']})
+        self.assertEqual(tt.errors, [(1, strings.gantry, "Missing value"), (2, strings.SSD, "Missing value")])
@@ -0,0 +1,83 @@
+''' Tests for watching input folders for plans that arrive or change'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from pydicom.uid import generate_uid
+from code import strings
+from code.folder_index import FolderIndex
+from code.watcher import watch
+from tests.synthetic import save, structure_set_dataset, write_study
+
+class StopWatching(Exception):
+    pass
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.study = write_study(self.folder, "existing")
+        self.indices = {self.folder: FolderIndex(self.folder)}
+        self.dose_struct_indices = {self.folder: self.indices[self.folder].dose_struct_index()}
+        self.batches = []
+
+    def process(self, jobs):
+        ''' Note the poll each batch was processed on, then stop after the first batch'''
+        self.batches.append((self.polls, jobs))
+        raise StopWatching
+
+    def watch(self, targets, steps):
+        ''' Watch the folder, doing steps[n] (a function, or None) before poll n, until a batch is
+        processed or the steps run out'''
+        self.polls = 0
+        def poll(interval):
+            if self.polls == len(steps):
+                raise StopWatching
+            if steps[self.polls] is not None:
+                steps[self.polls]()
+            self.polls += 1
+        with mock.patch('code.watcher.time.sleep', side_effect=poll):
+            with self.assertRaises(StopWatching):
+                watch(targets, self.indices, self.dose_struct_indices, self.process, interval=0.01)
+
+    def add_plan(self, name):
+        path = os.path.join(self.folder, f"{name}.dcm")
+        shutil.copy(self.study[strings.RTPLAN], path)
+        return os.path.normpath(path)
+
+    def touch(self, path):
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    def test_plan_is_checked_once_settled(self):
+        new = os.path.join(self.folder, "new.dcm")
+        self.watch([(self.folder, 7, None)], [lambda: self.add_plan("new"), None, None])
+        # Seen on the first poll, unchanged on the second
+        self.assertEqual(self.batches, [(2, [(new, 7, self.folder)])])
+
+    def test_plan_still_changing_waits(self):
+        new = os.path.join(self.folder, "new.dcm")
+        self.watch([(self.folder, 7, None)], [lambda: self.add_plan("new"), lambda: self.touch(new), None, None])
+        self.assertEqual(self.batches, [(3, [(new, 7, self.folder)])])
+
+    def test_single_file_target(self):
+        existing = os.path.normpath(self.study[strings.RTPLAN])
+        targets = [(self.folder, 6, existing)]
+        # Other plans in the folder aren't checked
+        self.watch(targets, [lambda: self.add_plan("other"), None, None])
+        self.assertEqual(self.batches, [])
+        self.watch(targets, [lambda: self.touch(existing), None, None])
+        self.assertEqual(self.batches, [(2, [(existing, 6, self.folder)])])
+
+    def test_dose_struct_index_rebuilt(self):
+        study_uid = generate_uid()
+        structure_set = os.path.join(self.folder, "added_RS.dcm")
+        self.watch([(self.folder, 7, None)], [lambda: save(structure_set_dataset(study_uid), structure_set), None])
+        self.assertEqual(self.batches, [])
+        self.assertEqual(self.dose_struct_indices[self.folder][study_uid], [(os.path.normpath(structure_set), strings.RTSTRUCT)])
+
+if __name__ == '__main__' :
+    unittest.main()